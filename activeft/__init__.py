@@ -108,6 +108,7 @@ Again: very simple!
 ### Scaling to Large Datasets
 
 By default `activeft` maintains a matrix of size of the dataset in memory. This is not feasible for very large datasets.
+If the data is embedded in a space of dimension $d$ smaller than the size of the dataset, the matrix is represented in feature space instead (see `activeft.gaussian.FeatureSpaceCovarianceMatrix`), requiring memory which is linear in the size of the dataset.
 Some acquisition functions (such as `activeft.acquisition_functions.LazyVTL`) allow for efficient computation of the acquisition function without storing the entire dataset in memory.
 An alternative approach is to pre-select a subset of the data using nearest neighbor retrieval (using [Faiss](https://github.com/facebookresearch/faiss)), before initializing the `ActiveDataLoader`.
 The following is an example of this approach in the context of [test-time fine-tuning](#example-test-time-fine-tuning):
@@ -158,12 +159,13 @@ If you use the code in a publication, please cite our papers:
 """
 
 from activeft.active_data_loader import ActiveDataLoader
-from activeft import acquisition_functions, data, embeddings, model, sift
+from activeft import acquisition_functions, data, distributed, embeddings, model, sift
 
 __all__ = [
     "ActiveDataLoader",
     "acquisition_functions",
     "data",
+    "distributed",
     "embeddings",
     "model",
     "sift",
@@ -42,24 +42,39 @@ The following table provides an overview of the acquisition functions and their
 """
 
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import partial
+from itertools import islice
 import math
-from typing import Callable, Generic, Optional, Tuple, TypeVar
+import os
+import pickle
+import tempfile
+import threading
+import uuid
+from typing import Callable, Generic, Iterable, Iterator, Optional, Tuple, TypeVar
 import numpy as np
 import torch
 from torch.utils.data import DataLoader, Dataset as TorchDataset, Subset
-from activeft.data import Dataset
+from activeft.data import Dataset, TensorDataset
+from activeft.embeddings.cache import EmbeddingCache
 from activeft.model import Model, ModelWithEmbedding
 from activeft.utils import (
     DEFAULT_EMBEDDING_BATCH_SIZE,
     DEFAULT_MINI_BATCH_SIZE,
     DEFAULT_NUM_WORKERS,
     DEFAULT_SUBSAMPLE,
+    PriorityQueue,
+    StreamingTopK,
     get_device,
     mini_batch_wrapper,
 )
 import warnings
 
 M = TypeVar("M", bound=Model | None)
+T = TypeVar("T")
 
 
 class _IndexedDataset(TorchDataset[Tuple[torch.Tensor, int]]):
@@ -74,6 +89,45 @@ class _IndexedDataset(TorchDataset[Tuple[torch.Tensor, int]]):
         return data, idx
 
 
+def _mini_batches(
+    dataset: Dataset,
+    indices: torch.Tensor | None,
+    mini_batch_size: int,
+    num_workers: int,
+    generator: torch.Generator | None = None,
+) -> Iterator[Tuple[torch.Tensor, torch.Tensor]]:
+    """
+    Iterates over shuffled mini batches of the data set (restricted to `indices` if not `None`).
+    Yields the data of each mini batch along with the corresponding indices within the data set.
+    The mini batches are shuffled using `generator`, or the global random number generator if `None`.
+
+    Mini batches of a `TensorDataset` are sliced directly from the underlying tensor, avoiding per-sample loading and collation.
+    """
+    if isinstance(dataset, TensorDataset):
+        permutation = (
+            torch.randperm(len(dataset), generator=generator)
+            if indices is None
+            else indices[torch.randperm(indices.size(0), generator=generator)]
+        )
+        for idx in torch.split(permutation, mini_batch_size):
+            yield dataset.data[idx.to(dataset.data.device)], idx
+        return
+
+    indexed_dataset = _IndexedDataset(dataset)
+    data_loader = DataLoader(
+        (
+            indexed_dataset
+            if indices is None
+            else Subset(indexed_dataset, indices.tolist())
+        ),
+        batch_size=mini_batch_size,
+        num_workers=num_workers,
+        shuffle=True,
+        generator=generator,
+    )
+    yield from data_loader
+
+
 class AcquisitionFunction(ABC, Generic[M]):
     """Abstract base class for acquisition functions."""
 
@@ -86,15 +140,32 @@ class AcquisitionFunction(ABC, Generic[M]):
     subsample: bool = DEFAULT_SUBSAMPLE
     """Whether to (uniformly) subsample the data to a single mini batch for faster computation."""
 
+    executor: Executor | None = None
+    """Executor (e.g., a `concurrent.futures.ThreadPoolExecutor` or `concurrent.futures.ProcessPoolExecutor`) used for processing several mini batches concurrently. Mini batches are processed sequentially if `None`."""
+
     def __init__(
         self,
         mini_batch_size=DEFAULT_MINI_BATCH_SIZE,
         num_workers=DEFAULT_NUM_WORKERS,
         subsample=DEFAULT_SUBSAMPLE,
+        executor: Executor | None = None,
     ):
+        """
+        :param mini_batch_size: Size of mini batches used for computing the acquisition function.
+        :param num_workers: Number of workers used for data loading.
+        :param subsample: Whether to (uniformly) subsample the data to a single mini batch for faster computation.
+        :param executor: Executor (e.g., `concurrent.futures.ThreadPoolExecutor` or `concurrent.futures.ProcessPoolExecutor`) used for processing several mini batches concurrently. The model is shared across mini batches and must not be modified by the acquisition function. With a process pool, the model and the acquisition function are sent to each worker process once per batch selection, and only the mini batches are sent with each task. Mini batches are processed sequentially if `None`.
+        """
         self.mini_batch_size = mini_batch_size
         self.num_workers = num_workers
         self.subsample = subsample
+        self.executor = executor
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["executor"] = None  # executors cannot be sent to (other) workers
+        state.pop("_target_embedding_cache", None)
+        return state
 
     @abstractmethod
     def select(
@@ -145,16 +216,18 @@ class BatchAcquisitionFunction(AcquisitionFunction[M]):
         dataset: Dataset,
         device: torch.device | None = None,
     ) -> Tuple[torch.Tensor, torch.Tensor]:
-        return BatchAcquisitionFunction._select(
-            compute_fn=self.compute,
-            batch_size=batch_size,
-            model=model,
-            dataset=dataset,
-            device=device,
-            mini_batch_size=self.mini_batch_size,
-            num_workers=self.num_workers,
-            subsample=self.subsample,
-        )
+        with _caching_target_embeddings(self):
+            return BatchAcquisitionFunction._select(
+                compute_fn=self.compute,
+                batch_size=batch_size,
+                model=model,
+                dataset=dataset,
+                device=device,
+                mini_batch_size=self.mini_batch_size,
+                num_workers=self.num_workers,
+                subsample=self.subsample,
+                executor=self.executor,
+            )
 
     @staticmethod
     def _select(
@@ -166,53 +239,106 @@ class BatchAcquisitionFunction(AcquisitionFunction[M]):
         mini_batch_size: int,
         num_workers: int,
         subsample: bool,
+        executor: Executor | None = None,
     ) -> Tuple[torch.Tensor, torch.Tensor]:
-        indexed_dataset = _IndexedDataset(dataset)
-        data_loader = DataLoader(
-            indexed_dataset,
-            batch_size=mini_batch_size,
+        top_k = StreamingTopK(k=batch_size)
+        mini_batches = _mini_batches(
+            dataset=dataset,
+            indices=None,
+            mini_batch_size=mini_batch_size,
             num_workers=num_workers,
-            shuffle=True,
         )
-
-        _values = []
-        _original_indices = []
-        for data, idx in data_loader:
-            _values.append(compute_fn(model, data, device))
-            _original_indices.append(idx)
-            if subsample:
-                break
-        values = torch.cat(_values)
-        original_indices = torch.cat(_original_indices)
-
-        values, indices = torch.topk(values, batch_size)
-        return original_indices[indices.cpu()], values.cpu()
+        for values, idx in _map(
+            executor,
+            _compute_mini_batch,
+            (compute_fn, model, device),
+            islice(mini_batches, 1 if subsample else None),
+        ):
+            top_k.update(values, idx)  # memory O(batch_size + mini_batch_size)
+        return top_k.indices, top_k.values.cpu()
 
 
 State = TypeVar("State")
 
 
 class SequentialAcquisitionFunction(AcquisitionFunction[M], Generic[M, State]):
-    """
+    r"""
     Abstract base class for acquisition functions that select a batch by sequentially adding points.
+
+    #### Stochastic Greedy Selection
+
+    If `stochastic_greedy_epsilon` is set to some $\epsilon \in (0,1)$, each point of a batch of size $b$ is selected among a random subset of size $\lceil \frac{n}{b} \log \frac{1}{\epsilon} \rceil$ of the $n$ data points (*stochastic greedy* [^1]) rather than among all data points.
+    The acquisition function is then only evaluated at the random subset (see `compute_at`).
+    For submodular objectives, this achieves a $(1 - 1/e - \epsilon)$-approximation in expectation.
+
+    #### Tree Reduction
+
+    By default, batches are selected by hierarchical composition: a batch is selected from each mini batch, and the union of these batches is repeatedly split into mini batches until a single batch remains.
+    If `tree_fan_in` is set to some $k \geq 2$, batches are instead selected by *tree reduction*: a batch is selected from each mini batch (the leaves of the tree), and the batches of every $k$ nodes are merged by selecting a batch from their union, until a single batch remains at the root.
+    The nodes of each level of the tree are independent, and are processed concurrently if an `executor` is provided (e.g., a `concurrent.futures.ThreadPoolExecutor` or `concurrent.futures.ProcessPoolExecutor`).
+    The wall-clock time of selecting from large data sets then scales with the number of workers rather than with the size of the data set.
+
+    [^1]: Mirzasoleiman, B., Badanidiyuru, A., Karbasi, A., Vondrák, J., and Krause, A. Lazier than lazy greedy. AAAI, 2015.
     """
 
     force_nonsequential: bool = False
     """Whether to force non-sequential data selection."""
 
+    stochastic_greedy_epsilon: float | None = None
+    r"""Parameter $\epsilon$ of stochastic greedy selection. Selects among all data points if `None`."""
+
+    tree_fan_in: int | None = None
+    """Number of nodes merged in each step of tree reduction. Batches are selected by hierarchical composition if `None`."""
+
+    seed: int | None = None
+    """Seed of the random subsets of stochastic greedy selection and of the shuffling of mini batches. Randomly seeded (respectively, shuffled using the global random number generator) if `None`."""
+
     def __init__(
         self,
         mini_batch_size=DEFAULT_MINI_BATCH_SIZE,
         num_workers=DEFAULT_NUM_WORKERS,
         subsample=DEFAULT_SUBSAMPLE,
         force_nonsequential=False,
+        stochastic_greedy_epsilon: float | None = None,
+        seed: int | None = None,
+        executor: Executor | None = None,
+        tree_fan_in: int | None = None,
     ):
         super().__init__(
             mini_batch_size=mini_batch_size,
             num_workers=num_workers,
             subsample=subsample,
+            executor=executor,
         )
+        assert stochastic_greedy_epsilon is None or (
+            stochastic_greedy_epsilon > 0 and stochastic_greedy_epsilon < 1
+        ), "Epsilon of stochastic greedy selection must be in (0, 1)"
+        assert (
+            tree_fan_in is None or tree_fan_in >= 2
+        ), "Fan-in of tree reduction must be at least 2"
+
         self.force_nonsequential = force_nonsequential
+        self.stochastic_greedy_epsilon = stochastic_greedy_epsilon
+        self.tree_fan_in = tree_fan_in
+        self.set_seed(seed)
+
+    def set_seed(self, seed: int | None):
+        r"""
+        Resets the random number generator of stochastic greedy selection and of the shuffling of mini batches.
+
+        :param seed: Seed of the random number generator. Randomly seeded if `None`.
+        """
+        self.seed = seed
+        self._generator = torch.Generator()
+        if seed is not None:
+            self._generator.manual_seed(seed)
+        else:
+            self._generator.seed()
+
+    @property
+    def _mini_batch_generator(self) -> torch.Generator | None:
+        """Random number generator used for shuffling mini batches. Seeded selections do not depend on the global random number generator."""
+        return self._generator if self.seed is not None else None
 
     @abstractmethod
     def initialize(
@@ -241,6 +367,17 @@ class SequentialAcquisitionFunction(AcquisitionFunction[M], Generic[M, State]):
         """
         pass
 
+    def compute_at(self, state: State, indices: torch.Tensor) -> torch.Tensor:
+        """
+        Computes the acquisition function for the given state at the data points with the given indices.
+        By default, the acquisition function is computed for all data points. Subclasses may override this method with a more efficient implementation.
+
+        :param state: State of batch selection.
+        :param indices: Indices of data points.
+        :return: Acquisition function values for the given state at `indices`.
+        """
+        return self.compute(state)[indices]
+
     @abstractmethod
     def step(self, state: State, i: int) -> State:
         r"""
@@ -274,15 +411,68 @@ class SequentialAcquisitionFunction(AcquisitionFunction[M], Generic[M, State]):
         :param device: Device used for computation of the acquisition function.
         :return: Indices of the newly selected batch (with respect to mini batch) and corresponding values of the acquisition function.
         """
+        if isinstance(self, LazyGreedy) and self.lazy:
+            assert (
+                self.stochastic_greedy_epsilon is None
+            ), "Lazy greedy and stochastic greedy selection are mutually exclusive"
+            return self._lazy_select_from_minibatch(batch_size, model, data, device)
+
+        state = self.initialize(model, data, device)
+
+        n = data.size(0)
+        subset_size = (
+            min(
+                math.ceil(
+                    n / batch_size * math.log(1 / self.stochastic_greedy_epsilon)
+                ),
+                n,
+            )
+            if self.stochastic_greedy_epsilon is not None
+            else n
+        )
+
+        selected_indices = []
+        selected_values = []
+        for _ in range(batch_size):
+            if subset_size < n:
+                indices = torch.randperm(n, generator=self._generator)[:subset_size]
+                values = self.compute_at(state, indices)
+                j = self.selector(values)
+                i = int(indices[j].item())
+                value = values[j]
+            else:
+                values = self.compute(state)
+                i = self.selector(values)
+                value = values[i]
+            selected_indices.append(i)
+            selected_values.append(value)
+            state = self.step(state, i)
+        return torch.tensor(selected_indices), torch.tensor(selected_values)
+
+    def _lazy_select_from_minibatch(
+        self, batch_size: int, model: M, data: torch.Tensor, device: torch.device | None
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        assert isinstance(self, LazyGreedy)
         state = self.initialize(model, data, device)
+        priority_queue = PriorityQueue(values=self.upper_bound(state).cpu().tolist())
 
         selected_indices = []
         selected_values = []
         for _ in range(batch_size):
-            values = self.compute(state)
-            i = self.selector(values)
+            while True:
+                i, _ = priority_queue.pop()
+                gain = self.marginal_gain(state, torch.tensor([i]))[0].item()
+
+                prev_top_value = (
+                    priority_queue.top_value if not priority_queue.empty() else gain
+                )
+                priority_queue.push(i, gain)
+                if (
+                    gain >= prev_top_value
+                ):  # done if the gain is larger than the largest upper bound of other points
+                    break
             selected_indices.append(i)
-            selected_values.append(values[i])
+            selected_values.append(self.compute_at(state, torch.tensor([i]))[0])
             state = self.step(state, i)
         return torch.tensor(selected_indices), torch.tensor(selected_values)
 
@@ -295,7 +485,7 @@ class SequentialAcquisitionFunction(AcquisitionFunction[M], Generic[M, State]):
     ) -> Tuple[torch.Tensor, torch.Tensor]:
         r"""
         Selects the next batch. If `force_nonsequential` is `True`, the data is selected analogously to `BatchAcquisitionFunction.select`.
-        Otherwise, the data is selected by hierarchical composition of data selected from mini batches.
+        Otherwise, the data is selected by hierarchical composition (or tree reduction if `tree_fan_in` is set) of data selected from mini batches.
 
         :param batch_size: Size of the batch to be selected. Needs to be smaller than `mini_batch_size`.
         :param model: Model used for data selection.
@@ -303,57 +493,102 @@ class SequentialAcquisitionFunction(AcquisitionFunction[M], Generic[M, State]):
         :param device: Device used for computation of the acquisition function.
         :return: Indices of the newly selected batch and corresponding values of the acquisition function.
         """
-        if self.force_nonsequential:
-
-            def compute_fn(
-                model: M, data: torch.Tensor, device: torch.device | None = None
-            ) -> torch.Tensor:
-                return self.compute(self.initialize(model, data, device))
-
-            return BatchAcquisitionFunction._select(
-                compute_fn=compute_fn,
-                batch_size=batch_size,
-                model=model,
-                dataset=dataset,
-                device=device,
-                mini_batch_size=self.mini_batch_size,
-                num_workers=self.num_workers,
-                subsample=self.subsample,
-            )
+        with _caching_target_embeddings(self):
+            if self.force_nonsequential:
+                return BatchAcquisitionFunction._select(
+                    compute_fn=partial(_compute_nonsequentially, self),
+                    batch_size=batch_size,
+                    model=model,
+                    dataset=dataset,
+                    device=device,
+                    mini_batch_size=self.mini_batch_size,
+                    num_workers=self.num_workers,
+                    subsample=self.subsample,
+                    executor=self.executor,
+                )
 
-        assert (
-            batch_size < self.mini_batch_size
-        ), "Batch size must be smaller than `mini_batch_size`."
-        if batch_size > self.mini_batch_size / 2:
-            warnings.warn(
-                "The evaluation of the acquisition function may be slow since `batch_size` is large relative to `mini_batch_size`."
-            )
+            assert (
+                batch_size < self.mini_batch_size
+            ), "Batch size must be smaller than `mini_batch_size`."
+            if batch_size > self.mini_batch_size / 2:
+                warnings.warn(
+                    "The evaluation of the acquisition function may be slow since `batch_size` is large relative to `mini_batch_size`."
+                )
 
-        indexed_dataset = _IndexedDataset(dataset)
-        selected_indices = None
-        selected_values = None
-        while (
-            selected_indices is None or len(selected_indices) > batch_size
-        ):  # gradually shrinks size of selected batch, until the correct size is reached
-            data_loader = DataLoader(
-                indexed_dataset,
-                batch_size=self.mini_batch_size,
-                num_workers=self.num_workers,
-                shuffle=True,
-            )
+            if self.tree_fan_in is not None:
+                return self._select_by_tree_reduction(
+                    batch_size, model, dataset, device
+                )
 
-            selected_indices = []
-            selected_values = []
-            for data, idx in data_loader:
-                sub_idx, sub_val = self.select_from_minibatch(
-                    batch_size, model, data, device
+            candidate_indices = None
+            selected_indices = None
+            selected_values = None
+            while (
+                selected_indices is None or len(selected_indices) > batch_size
+            ):  # gradually shrinks size of selected batch, until the correct size is reached
+                selected_indices = []
+                selected_values = []
+                mini_batches = _mini_batches(
+                    dataset=dataset,
+                    indices=candidate_indices,
+                    mini_batch_size=self.mini_batch_size,
+                    num_workers=self.num_workers,
+                    generator=self._mini_batch_generator,
                 )
-                selected_indices.extend(idx[sub_idx].cpu().tolist())
-                selected_values.extend(sub_val.cpu().tolist())
-                if self.subsample:
-                    break
-            indexed_dataset = Subset(indexed_dataset, selected_indices)
-        return torch.tensor(selected_indices), torch.tensor(selected_values)
+                for sub_idx, sub_val in _map(
+                    self.executor,
+                    _select_from_mini_batch,
+                    (self, batch_size, model, device),
+                    islice(mini_batches, 1 if self.subsample else None),
+                ):
+                    selected_indices.extend(sub_idx.cpu().tolist())
+                    selected_values.extend(sub_val.cpu().tolist())
+                candidate_indices = torch.tensor(selected_indices)
+            return torch.tensor(selected_indices), torch.tensor(selected_values)
+
+    def _select_by_tree_reduction(
+        self,
+        batch_size: int,
+        model: M,
+        dataset: Dataset,
+        device: torch.device | None,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        assert self.tree_fan_in is not None
+        mini_batches = _mini_batches(
+            dataset=dataset,
+            indices=None,
+            mini_batch_size=self.mini_batch_size,
+            num_workers=self.num_workers,
+            generator=self._mini_batch_generator,
+        )
+        nodes = list(
+            _map(
+                self.executor,
+                _select_from_mini_batch,
+                (self, batch_size, model, device),
+                islice(mini_batches, 1 if self.subsample else None),
+            )
+        )
+        while len(nodes) > 1:  # merges nodes level by level
+            groups = [
+                nodes[i : i + self.tree_fan_in]
+                for i in range(0, len(nodes), self.tree_fan_in)
+            ]
+            remainder = (
+                groups.pop() if len(groups[-1]) == 1 else []
+            )  # a single node is passed on to the next level as is
+            merged_indices = [torch.cat([idx for idx, _ in group]) for group in groups]
+            nodes = [
+                *_map(
+                    self.executor,
+                    _select_from_mini_batch,
+                    (self, batch_size, model, device),
+                    ((_gather(dataset, idx), idx) for idx in merged_indices),
+                ),
+                *remainder,
+            ]
+        selected_indices, selected_values = nodes[0]
+        return selected_indices.cpu(), selected_values.cpu()
 
 
 class EmbeddingBased(ABC):
@@ -364,14 +599,49 @@ class EmbeddingBased(ABC):
     embedding_batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE
     """Batch size used for computing the embeddings."""
 
+    embedding_cache: EmbeddingCache | None = None
+    """Cache of the embeddings of the data set. Embeddings are not cached if `None`."""
+
     def __init__(
         self,
         embedding_batch_size=DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_cache: EmbeddingCache | None = None,
     ):
         """
         :param embedding_batch_size: Batch size used for computing the embeddings.
+        :param embedding_cache: Cache of the embeddings of the data set (see activeft.embeddings.cache.EmbeddingCache). Embeddings are not cached if `None`.
         """
         self.embedding_batch_size = embedding_batch_size
+        self.embedding_cache = embedding_cache
+
+    def compute_data_embedding(
+        self,
+        model: ModelWithEmbedding | None,
+        data: torch.Tensor,
+        indices: torch.Tensor | None = None,
+    ) -> torch.Tensor:
+        r"""
+        Returns the embedding of the given mini batch of the data set. The embeddings are read from (and written to) `embedding_cache`, if provided.
+
+        :param model: Model used for computing the embedding.
+        :param data: Mini batch of inputs (shape $n \times d$) to be embedded.
+        :param indices: Indices of `data` within the data set (of length $n$), with respect to which embeddings are cached. Embeddings are not cached if `None`.
+        :return: Embedding of the given data.
+        """
+        assert indices is None or indices.size(0) == data.size(
+            0
+        ), "Indices must match the data."
+        if self.embedding_cache is None or model is None or indices is None:
+            return self.compute_embedding(
+                model=model, data=data, batch_size=self.embedding_batch_size
+            )
+        return self.embedding_cache.get(
+            indices=indices,
+            data=data,
+            embed=lambda batch: self.compute_embedding(
+                model=model, data=batch, batch_size=self.embedding_batch_size
+            ),
+        )
 
     @staticmethod
     def compute_embedding(
@@ -414,6 +684,9 @@ class Targeted(ABC):
     subsampled_target_frac: float
     r"""Fraction of the target to be subsampled in each iteration. Must be in $(0,1]$."""
 
+    _caching_target_embeddings: bool = False
+    _target_embedding_cache: "_TargetEmbeddingCache | None" = None
+
     def __init__(
         self,
         target: torch.Tensor,
@@ -445,6 +718,7 @@ class Targeted(ABC):
         :param new_target: Tensor of new prediction targets (shape $m \times d$).
         """
         self._target = torch.cat([self._target, new_target])
+        self._target_embedding_cache = None
 
     def set_target(self, new_target: torch.Tensor):
         r"""
@@ -453,18 +727,292 @@ class Targeted(ABC):
         :param new_target: Tensor of new prediction targets (shape $m \times d$).
         """
         self._target = new_target
+        self._target_embedding_cache = None
 
     def get_target(self) -> torch.Tensor:
         r"""
         Returns the tensor of (subsampled) prediction target (shape $m \times d$).
         """
+        return self._target[self._subsample_target_indices()]
+
+    def get_embedded_target(
+        self, model: Model | None, embed: Callable[[torch.Tensor], torch.Tensor]
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        r"""
+        Returns the tensor of (subsampled) prediction target (shape $m \times d$) and its embedding.
+
+        During the selection of a batch (i.e., within `select`), embeddings of the prediction targets are cached, so that each prediction target is embedded at most once rather than once per mini batch.
+
+        :param model: Model used for computing the embedding. The cache is only valid for this model.
+        :param embed: Function computing the embedding of a tensor of prediction targets.
+        :return: Tensor of (subsampled) prediction targets and tensor of their embeddings. The tensor of embeddings is empty if there are no prediction targets.
+        """
+        indices = self._subsample_target_indices()
+        target = self._target[indices]
+
+        if target.size(0) == 0:  # nothing to embed
+            return target, torch.empty(0, device=target.device)
+        if not self._caching_target_embeddings:
+            return target, embed(target)
+
+        cache = self._target_embedding_cache
+        if cache is None or cache.model is not model:
+            cache = _TargetEmbeddingCache(model=model, m=self._target.size(0))
+            self._target_embedding_cache = cache
+
+        with cache.lock:  # mini batches may be processed concurrently
+            missing_indices = indices[~cache.mask[indices]]
+            if missing_indices.size(0) > 0:
+                cache.update(missing_indices, embed(self._target[missing_indices]))
+            assert cache.embeddings is not None
+            return target, cache.embeddings[indices]
+
+    def _subsample_target_indices(self) -> torch.Tensor:
         m = self._target.size(0)
         max_target_size = (
             self.max_target_size if self.max_target_size is not None else m
         )
+        size = min(math.ceil(self.subsampled_target_frac * m), max_target_size)
+        if size == m:  # independent of the (global) random number generator
+            return torch.arange(m)
+        return torch.randperm(m)[:size]
+
+
+class _TargetEmbeddingCache:
+    """Embeddings of the prediction targets which were already computed (with respect to `model`)."""
+
+    model: Model | None
+    mask: torch.Tensor
+    """Mask of prediction targets whose embeddings were already computed."""
+    embeddings: torch.Tensor | None
+
+    def __init__(self, model: Model | None, m: int):
+        self.model = model
+        self.mask = torch.zeros(m, dtype=torch.bool)
+        self.embeddings = None
+        self.lock = threading.Lock()
+
+    def update(self, indices: torch.Tensor, embeddings: torch.Tensor):
+        if self.embeddings is None:
+            self.embeddings = torch.empty(
+                (self.mask.size(0), *embeddings.shape[1:]),
+                dtype=embeddings.dtype,
+                device=embeddings.device,
+            )
+        self.embeddings[indices] = embeddings.to(self.embeddings.device)
+        self.mask[indices] = True
 
-        return self._target[
-            torch.randperm(m)[
-                : min(math.ceil(self.subsampled_target_frac * m), max_target_size)
-            ]
-        ]
+
+@contextmanager
+def _caching_target_embeddings(acquisition_function: AcquisitionFunction) -> Iterator:
+    """
+    Caches the embeddings of prediction targets for the duration of the context (if `acquisition_function` is targeted).
+    Acquisition functions which are composed of other acquisition functions (e.g., `InformationDensity`) cache the embeddings of the prediction targets of their components.
+    """
+    with ExitStack() as stack:
+        for component in vars(acquisition_function).values():
+            if isinstance(component, AcquisitionFunction):
+                stack.enter_context(_caching_target_embeddings(component))
+
+        if not isinstance(acquisition_function, Targeted):
+            yield
+            return
+
+        acquisition_function._caching_target_embeddings = True
+        try:
+            yield
+        finally:
+            acquisition_function._caching_target_embeddings = False
+            acquisition_function._target_embedding_cache = None
+
+
+class LazyGreedy(ABC, Generic[State]):
+    r"""
+    Abstract base class for sequential acquisition functions whose marginal gains are diminishing, i.e., the marginal gain of any data point does not increase as further data points are added to the batch.
+
+    If `lazy` is `True`, the batch is selected by the *lazy* (or *accelerated*) greedy algorithm [^1] rather than by evaluating the acquisition function at all data points in every step.
+    Upper bounds on the marginal gains are kept in a priority queue and the marginal gain is only re-evaluated for the data point with the largest upper bound, until a data point is found whose marginal gain exceeds all other upper bounds.
+    If the batch size is much smaller than the number of data points, this typically requires far fewer evaluations of the acquisition function.
+    Lazy greedy selection cannot be combined with stochastic greedy selection (see `SequentialAcquisitionFunction`).
+
+    .. note::
+
+        The lazy greedy algorithm selects the same batch as the greedy algorithm provided that the marginal gains are diminishing (for example, if the objective is submodular as for [Undirected ITL](acquisition_functions/undirected_itl)).
+        The marginal gains of other acquisition functions (e.g., [ITL](acquisition_functions/itl) or [CTL](acquisition_functions/ctl)) may occasionally increase, in which case the selected batch is an approximation of the greedily selected batch.
+
+    [^1]: Minoux, M. Accelerated greedy algorithms for maximizing submodular set functions. In Optimization Techniques. Springer, 1978.
+    """
+
+    lazy: bool = False
+    """Whether to select batches using the lazy greedy algorithm."""
+
+    def __init__(self, lazy=False):
+        """
+        :param lazy: Whether to select batches using the lazy greedy algorithm.
+        """
+        self.lazy = lazy
+
+    @abstractmethod
+    def upper_bound(self, state: State) -> torch.Tensor:
+        """
+        Computes upper bounds on the marginal gains of all data points which remain valid when further data points are added to the batch.
+
+        :param state: Initial state of batch selection.
+        :return: Upper bounds on the marginal gains of all data points.
+        """
+        pass
+
+    @abstractmethod
+    def marginal_gain(self, state: State, indices: torch.Tensor) -> torch.Tensor:
+        """
+        Computes the marginal gains of the data points with the given indices.
+
+        :param state: State of batch selection.
+        :param indices: Indices of data points.
+        :return: Marginal gains of the data points at `indices`.
+        """
+        pass
+
+
+_mini_batch_indices: ContextVar[torch.Tensor | None] = ContextVar(
+    "mini_batch_indices", default=None
+)
+"""Indices (within the data set) of the mini batch which is currently processed."""
+
+
+def _dataset_indices(indices: torch.Tensor | None = None) -> torch.Tensor | None:
+    """
+    :param indices: Indices within the mini batch which is currently processed. The entire mini batch if `None`.
+    :return: Indices of the given data points within the data set, or `None` if no mini batch is currently processed.
+    """
+    mini_batch_indices = _mini_batch_indices.get()
+    if mini_batch_indices is None or indices is None:
+        return mini_batch_indices
+    return mini_batch_indices[indices.to(mini_batch_indices.device)]
+
+
+def _compute_mini_batch(
+    compute_fn: Callable[[M, torch.Tensor, Optional[torch.device]], torch.Tensor],
+    model: M,
+    device: torch.device | None,
+    data: torch.Tensor,
+    idx: torch.Tensor,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    with _indexing_mini_batch(idx):
+        return compute_fn(model, data, device), idx
+
+
+def _select_from_mini_batch(
+    acquisition_function: "SequentialAcquisitionFunction",
+    batch_size: int,
+    model: Model | None,
+    device: torch.device | None,
+    data: torch.Tensor,
+    idx: torch.Tensor,
+) -> Tuple[torch.Tensor, torch.Tensor]:
+    with _indexing_mini_batch(idx):
+        sub_idx, sub_val = acquisition_function.select_from_minibatch(
+            batch_size, model, data, device
+        )
+    return idx[sub_idx.to(idx.device)], sub_val
+
+
+def _gather(dataset: Dataset, indices: torch.Tensor) -> torch.Tensor:
+    """Collects the data at `indices` into a single tensor."""
+    if isinstance(dataset, TensorDataset):
+        return dataset.data[indices.to(dataset.data.device)]
+    return torch.stack([dataset[i] for i in indices.tolist()])
+
+
+def _compute_nonsequentially(
+    acquisition_function: "SequentialAcquisitionFunction",
+    model: Model | None,
+    data: torch.Tensor,
+    device: torch.device | None,
+) -> torch.Tensor:
+    return acquisition_function.compute(
+        acquisition_function.initialize(model, data, device)
+    )
+
+
+@contextmanager
+def _indexing_mini_batch(indices: torch.Tensor) -> Iterator:
+    token = _mini_batch_indices.set(indices)
+    try:
+        yield
+    finally:
+        _mini_batch_indices.reset(token)
+
+
+def _map(
+    executor: Executor | None,
+    fn: Callable[..., T],
+    shared_args: Tuple,
+    mini_batches: Iterable[Tuple[torch.Tensor, torch.Tensor]],
+) -> Iterator[T]:
+    """
+    Applies `fn` to the shared arguments and each mini batch (`data`, `idx`), and yields the results in order.
+    The calls are processed concurrently on `executor` (if not `None`), bounding the number of pending calls to limit the memory of their arguments.
+
+    If `executor` is a process pool, the shared arguments (e.g., the model and the acquisition function) are sent to each worker process only once (see `_SharedArgs`), and each call only sends its mini batch.
+    """
+    if executor is None:
+        for data, idx in mini_batches:
+            yield fn(*shared_args, data, idx)
+        return
+
+    if not isinstance(executor, ProcessPoolExecutor):
+        yield from _submit(
+            executor, fn, ((*shared_args, data, idx) for data, idx in mini_batches)
+        )
+        return
+
+    with _SharedArgs(shared_args) as shared:
+        yield from _submit(
+            executor,
+            _call_with_shared_args,
+            ((shared.key, shared.path, fn, data, idx) for data, idx in mini_batches),
+        )
+
+
+def _submit(
+    executor: Executor, fn: Callable[..., T], args: Iterable[Tuple]
+) -> Iterator[T]:
+    max_pending = 2 * (os.cpu_count() or 1)
+    pending = deque()
+    for a in args:
+        pending.append(executor.submit(fn, *a))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while len(pending) > 0:
+        yield pending.popleft().result()
+
+
+class _SharedArgs:
+    """Arguments which are pickled once to a temporary file, from which each worker process loads them once (see `_call_with_shared_args`)."""
+
+    def __init__(self, args: Tuple):
+        self.key = uuid.uuid4().hex
+        fd, self.path = tempfile.mkstemp(prefix="activeft-", suffix=".pkl")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(args, f)
+
+    def __enter__(self) -> "_SharedArgs":
+        return self
+
+    def __exit__(self, *args):
+        os.remove(self.path)
+
+
+_worker_shared_args: Tuple[str, Tuple] | None = None
+"""Shared arguments (and their key) which were last loaded by the current worker process."""
+
+
+def _call_with_shared_args(
+    key: str, path: str, fn: Callable[..., T], data: torch.Tensor, idx: torch.Tensor
+) -> T:
+    global _worker_shared_args
+    if _worker_shared_args is None or _worker_shared_args[0] != key:
+        with open(path, "rb") as f:
+            _worker_shared_args = (key, pickle.load(f))
+    return fn(*_worker_shared_args[1], data, idx)
@@ -1,11 +1,17 @@
+from concurrent.futures import Executor
 from typing import NamedTuple
 import torch
 from activeft.acquisition_functions import (
     EmbeddingBased,
     SequentialAcquisitionFunction,
     Targeted,
+    _dataset_indices,
+)
+from activeft.gaussian import (
+    CovarianceMatrix,
+    GaussianCovarianceMatrix,
+    covariance_matrix_from_embeddings,
 )
-from activeft.gaussian import GaussianCovarianceMatrix
 from activeft.model import (
     ModelWithEmbeddingOrKernel,
     ModelWithKernel,
@@ -18,6 +24,7 @@ from activeft.utils import (
     DEFAULT_SUBSAMPLE,
     get_device,
 )
+from activeft.embeddings.cache import EmbeddingCache
 
 __all__ = ["BaCE", "BaCEState", "TargetedBaCE"]
 
@@ -25,8 +32,8 @@ __all__ = ["BaCE", "BaCEState", "TargetedBaCE"]
 class BaCEState(NamedTuple):
     """State of sequential batch selection."""
 
-    covariance_matrix: GaussianCovarianceMatrix
-    r"""Kernel matrix of the data. Tensor of shape $n \times n$."""
+    covariance_matrix: CovarianceMatrix
+    r"""Kernel matrix of the data (of shape $n \times n$). Represented in feature space if the embedding dimension is smaller than $n$."""
     n: int
     """Length of the data set."""
     observed_indices: torch.Tensor
@@ -50,6 +57,8 @@ class BaCE(
 
     Using the conditional kernel $k_i$ (or equivalently the "conditional embedding") rather than the initial kernel $k_0$ leads to *diverse* batch selection since $k_i$ reflects the information gained from the previously selected data points $\vx_{1:i}$.
 
+    If the kernel is induced by $d$-dimensional embeddings and $d$ is smaller than the number of data points $n$, the kernel is represented in feature space (see activeft.gaussian.FeatureSpaceCovarianceMatrix), so that memory grows as $O(nd)$ rather than $O(n^2)$.
+
     [^1]: Hübotter, J., Sukhija, B., Treven, L., As, Y., and Krause, A. Transductive Active Learning: Theory and Applications. NeurIPS, 2024.
 
     [^2]: A kernel is also induced by embeddings. See activeft.model.ModelWithEmbedding.
@@ -63,17 +72,27 @@ class BaCE(
         noise_std: float | None = None,
         mini_batch_size=DEFAULT_MINI_BATCH_SIZE,
         embedding_batch_size=DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_cache: EmbeddingCache | None = None,
         num_workers=DEFAULT_NUM_WORKERS,
         subsample=DEFAULT_SUBSAMPLE,
         force_nonsequential=False,
+        stochastic_greedy_epsilon: float | None = None,
+        seed: int | None = None,
+        executor: Executor | None = None,
+        tree_fan_in: int | None = None,
     ):
         """
         :param noise_std: Standard deviation of the noise. Determined automatically if set to `None`.
         :param mini_batch_size: Size of mini-batch used for computing the acquisition function.
         :param embedding_batch_size: Batch size used for computing the embeddings.
+        :param embedding_cache: Cache of the embeddings of the data set (see activeft.embeddings.cache.EmbeddingCache). Embeddings are not cached if `None`.
         :param num_workers: Number of workers used for parallel computation.
         :param subsample: Whether to subsample the data set.
         :param force_nonsequential: Whether to force non-sequential data selection.
+        :param stochastic_greedy_epsilon: If not `None`, each point of the batch is selected from a random subset of the data (see `SequentialAcquisitionFunction`). Smaller values lead to larger subsets.
+        :param seed: Seed of the random subsets (only used if `stochastic_greedy_epsilon` is not `None`) and of the shuffling of mini batches.
+        :param executor: Executor used for processing several mini batches concurrently (see activeft.acquisition_functions.AcquisitionFunction). Mini batches are processed sequentially if `None`.
+        :param tree_fan_in: Number of nodes merged in each step of tree reduction (see activeft.acquisition_functions.SequentialAcquisitionFunction). Batches are selected by hierarchical composition if `None`.
         """
         SequentialAcquisitionFunction.__init__(
             self,
@@ -81,8 +100,16 @@ class BaCE(
             num_workers=num_workers,
             subsample=subsample,
             force_nonsequential=force_nonsequential,
+            stochastic_greedy_epsilon=stochastic_greedy_epsilon,
+            seed=seed,
+            executor=executor,
+            tree_fan_in=tree_fan_in,
+        )
+        EmbeddingBased.__init__(
+            self,
+            embedding_batch_size=embedding_batch_size,
+            embedding_cache=embedding_cache,
         )
-        EmbeddingBased.__init__(self, embedding_batch_size=embedding_batch_size)
         self.noise_std = noise_std
 
     def initialize(
@@ -96,13 +123,13 @@ class BaCE(
             model_device = get_device(model)
             _data = data.to(model_device)
             covariance_matrix = GaussianCovarianceMatrix(
-                model.kernel(_data, _data).to(device)
+                model.kernel(_data, _data).to(device, copy=True)
             )
         else:
-            embeddings = self.compute_embedding(
-                model=model, data=data, batch_size=self.embedding_batch_size
+            embeddings = self.compute_data_embedding(
+                model=model, data=data, indices=_dataset_indices()
             ).to(device)
-            covariance_matrix = GaussianCovarianceMatrix.from_embeddings(
+            covariance_matrix = covariance_matrix_from_embeddings(
                 Embeddings=embeddings,
                 Sigma=(
                     model.latent_covariance()
@@ -110,7 +137,7 @@ class BaCE(
                     else None
                 ),
             )
-        observed_indices = torch.tensor([])
+        observed_indices = torch.tensor([], dtype=torch.long)
         return BaCEState(
             covariance_matrix=covariance_matrix,
             n=n,
@@ -119,9 +146,9 @@ class BaCE(
         )
 
     def step(self, state: BaCEState, i: int) -> BaCEState:
-        posterior_covariance_matrix = state.covariance_matrix.condition_on(
+        posterior_covariance_matrix = state.covariance_matrix.condition_on_(
             i, noise_std=self.noise_std
-        )
+        )  # Note: not treating as immutable!
         observed_indices = torch.cat(
             [
                 state.observed_indices,
@@ -149,9 +176,14 @@ class TargetedBaCE(Targeted, BaCE):
         max_target_size: int | None = None,
         mini_batch_size=DEFAULT_MINI_BATCH_SIZE,
         embedding_batch_size=DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_cache: EmbeddingCache | None = None,
         num_workers=DEFAULT_NUM_WORKERS,
         subsample=DEFAULT_SUBSAMPLE,
         force_nonsequential=False,
+        stochastic_greedy_epsilon: float | None = None,
+        seed: int | None = None,
+        executor: Executor | None = None,
+        tree_fan_in: int | None = None,
     ):
         r"""
         :param target: Tensor of prediction targets (shape $m \times d$).
@@ -160,18 +192,28 @@ class TargetedBaCE(Targeted, BaCE):
         :param max_target_size: Maximum size of the target to be subsampled in each iteration. Default is `None` in which case the target may be arbitrarily large. Ignored if `target` is `None`.
         :param mini_batch_size: Size of mini-batch used for computing the acquisition function.
         :param embedding_batch_size: Batch size used for computing the embeddings.
+        :param embedding_cache: Cache of the embeddings of the data set (see activeft.embeddings.cache.EmbeddingCache). Embeddings are not cached if `None`.
         :param num_workers: Number of workers used for parallel computation.
         :param subsample: Whether to subsample the data set.
         :param force_nonsequential: Whether to force non-sequential data selection.
+        :param stochastic_greedy_epsilon: If not `None`, each point of the batch is selected from a random subset of the data (see `SequentialAcquisitionFunction`). Smaller values lead to larger subsets.
+        :param seed: Seed of the random subsets (only used if `stochastic_greedy_epsilon` is not `None`) and of the shuffling of mini batches.
+        :param executor: Executor used for processing several mini batches concurrently (see activeft.acquisition_functions.AcquisitionFunction). Mini batches are processed sequentially if `None`.
+        :param tree_fan_in: Number of nodes merged in each step of tree reduction (see activeft.acquisition_functions.SequentialAcquisitionFunction). Batches are selected by hierarchical composition if `None`.
         """
         BaCE.__init__(
             self,
             noise_std=noise_std,
             mini_batch_size=mini_batch_size,
             embedding_batch_size=embedding_batch_size,
+            embedding_cache=embedding_cache,
             num_workers=num_workers,
             subsample=subsample,
             force_nonsequential=force_nonsequential,
+            stochastic_greedy_epsilon=stochastic_greedy_epsilon,
+            seed=seed,
+            executor=executor,
+            tree_fan_in=tree_fan_in,
         )
         Targeted.__init__(
             self,
@@ -187,21 +229,29 @@ class TargetedBaCE(Targeted, BaCE):
         device: torch.device | None,
     ) -> BaCEState:
         n = data.size(0)
-        target = self.get_target()
-        joint_data = torch.cat((data, target))
         if isinstance(model, ModelWithKernel):
+            target = self.get_target()
+            joint_data = torch.cat((data, target))
             model_device = get_device(model)
             _joint_data = joint_data.to(model_device)
             covariance_matrix = GaussianCovarianceMatrix(
-                model.kernel(_joint_data, _joint_data).to(device)
+                model.kernel(_joint_data, _joint_data).to(device, copy=True)
             )
         else:
-            embeddings = self.compute_embedding(
+            data_embeddings = self.compute_data_embedding(
+                model=model, data=data, indices=_dataset_indices()
+            )
+            target, target_embeddings = self.get_embedded_target(
                 model=model,
-                data=joint_data,
-                batch_size=self.embedding_batch_size,
-            ).to(device)
-            covariance_matrix = GaussianCovarianceMatrix.from_embeddings(
+                embed=lambda target: self.compute_embedding(
+                    model=model, data=target, batch_size=self.embedding_batch_size
+                ),
+            )  # embeddings of the prediction targets are reused across mini batches
+            joint_data = torch.cat((data, target))
+            embeddings = torch.cat(
+                (data_embeddings.to(device), target_embeddings.to(device))
+            )
+            covariance_matrix = covariance_matrix_from_embeddings(
                 Embeddings=embeddings,
                 Sigma=(
                     model.latent_covariance()
@@ -209,7 +259,7 @@ class TargetedBaCE(Targeted, BaCE):
                     else None
                 ),
             )
-        observed_indices = torch.tensor([])
+        observed_indices = torch.tensor([], dtype=torch.long)
         return BaCEState(
             covariance_matrix=covariance_matrix,
             n=n,
@@ -1,9 +1,11 @@
+from concurrent.futures import Executor
 import torch
 import torch.nn.functional as F
 from activeft.acquisition_functions import (
     BatchAcquisitionFunction,
     EmbeddingBased,
     Targeted,
+    _dataset_indices,
 )
 from activeft.model import ModelWithEmbedding
 from activeft.utils import (
@@ -12,6 +14,7 @@ from activeft.utils import (
     DEFAULT_NUM_WORKERS,
     DEFAULT_SUBSAMPLE,
 )
+from activeft.embeddings.cache import EmbeddingCache
 
 
 class CosineSimilarity(
@@ -41,8 +44,10 @@ class CosineSimilarity(
         max_target_size: int | None = None,
         mini_batch_size=DEFAULT_MINI_BATCH_SIZE,
         embedding_batch_size=DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_cache: EmbeddingCache | None = None,
         num_workers=DEFAULT_NUM_WORKERS,
         subsample=DEFAULT_SUBSAMPLE,
+        executor: Executor | None = None,
     ):
         r"""
         :param target: Tensor of prediction targets (shape $m \times d$).
@@ -50,6 +55,10 @@ class CosineSimilarity(
         :param max_target_size: Maximum size of the target to be subsampled in each iteration. Default is `None` in which case the target may be arbitrarily large. Ignored if `target` is `None`.
         :param mini_batch_size: Size of mini-batch used for computing the acquisition function.
         :param embedding_batch_size: Batch size used for computing the embeddings.
+        :param embedding_cache: Cache of the embeddings of the data set (see activeft.embeddings.cache.EmbeddingCache). Embeddings are not cached if `None`.
+        :param num_workers: Number of workers used for data loading.
+        :param subsample: Whether to subsample the data set.
+        :param executor: Executor used for processing several mini batches concurrently (see activeft.acquisition_functions.AcquisitionFunction). Mini batches are processed sequentially if `None`.
         """
 
         BatchAcquisitionFunction.__init__(
@@ -57,8 +66,13 @@ class CosineSimilarity(
             mini_batch_size=mini_batch_size,
             num_workers=num_workers,
             subsample=subsample,
+            executor=executor,
+        )
+        EmbeddingBased.__init__(
+            self,
+            embedding_batch_size=embedding_batch_size,
+            embedding_cache=embedding_cache,
         )
-        EmbeddingBased.__init__(self, embedding_batch_size=embedding_batch_size)
         Targeted.__init__(
             self,
             target=target,
@@ -72,12 +86,16 @@ class CosineSimilarity(
         data: torch.Tensor,
         device: torch.device | None = None,
     ) -> torch.Tensor:
-        data_latent = self.compute_embedding(
-            model=model, data=data, batch_size=self.embedding_batch_size
-        ).to(device)
-        target_latent = self.compute_embedding(
-            model=model, data=self.get_target(), batch_size=self.embedding_batch_size
+        data_latent = self.compute_data_embedding(
+            model=model, data=data, indices=_dataset_indices()
         ).to(device)
+        _, target_latent = self.get_embedded_target(
+            model=model,
+            embed=lambda target: self.compute_embedding(
+                model=model, data=target, batch_size=self.embedding_batch_size
+            ),
+        )  # embeddings of the prediction targets are reused across mini batches
+        target_latent = target_latent.to(device)
 
         data_latent_normalized = F.normalize(data_latent, p=2, dim=1)
         target_latent_normalized = F.normalize(target_latent, p=2, dim=1)
@@ -1,9 +1,18 @@
+from concurrent.futures import Executor
 import torch
+from activeft.acquisition_functions import LazyGreedy
 from activeft.acquisition_functions.bace import TargetedBaCE, BaCEState
-from activeft.gaussian import GaussianCovarianceMatrix
+from activeft.gaussian import CovarianceMatrix
+from activeft.utils import (
+    DEFAULT_EMBEDDING_BATCH_SIZE,
+    DEFAULT_MINI_BATCH_SIZE,
+    DEFAULT_NUM_WORKERS,
+    DEFAULT_SUBSAMPLE,
+)
+from activeft.embeddings.cache import EmbeddingCache
 
 
-class CTL(TargetedBaCE):
+class CTL(TargetedBaCE, LazyGreedy[BaCEState]):
     r"""
     `CTL` [^3] (*correlation-based transductive learning*) composes the batch by sequentially selecting the samples with the largest correlation to the prediction targets $\spA$: \\[\begin{align}
         \vx_{i+1} &= \argmax_{\vx}\ \sum_{\vxp \in \spA} \Cor{f(\vx), f(\vxp) \mid \spD_i}.
@@ -26,6 +35,60 @@ class CTL(TargetedBaCE):
     [^3]: see activeft.acquisition_functions.bace.BaCE
     """
 
+    def __init__(
+        self,
+        target: torch.Tensor,
+        noise_std: float | None = None,
+        subsampled_target_frac: float = 1,
+        max_target_size: int | None = None,
+        mini_batch_size=DEFAULT_MINI_BATCH_SIZE,
+        embedding_batch_size=DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_cache: EmbeddingCache | None = None,
+        num_workers=DEFAULT_NUM_WORKERS,
+        subsample=DEFAULT_SUBSAMPLE,
+        force_nonsequential=False,
+        stochastic_greedy_epsilon: float | None = None,
+        seed: int | None = None,
+        executor: Executor | None = None,
+        tree_fan_in: int | None = None,
+        lazy=False,
+    ):
+        r"""
+        :param target: Tensor of prediction targets (shape $m \times d$).
+        :param noise_std: Standard deviation of the noise. Determined automatically if set to `None`.
+        :param subsampled_target_frac: Fraction of the target to be subsampled in each iteration. Must be in $(0,1]$. Default is $1$. Ignored if `target` is `None`.
+        :param max_target_size: Maximum size of the target to be subsampled in each iteration. Default is `None` in which case the target may be arbitrarily large. Ignored if `target` is `None`.
+        :param mini_batch_size: Size of mini-batch used for computing the acquisition function.
+        :param embedding_batch_size: Batch size used for computing the embeddings.
+        :param embedding_cache: Cache of the embeddings of the data set (see activeft.embeddings.cache.EmbeddingCache). Embeddings are not cached if `None`.
+        :param num_workers: Number of workers used for parallel computation.
+        :param subsample: Whether to subsample the data set.
+        :param force_nonsequential: Whether to force non-sequential data selection.
+        :param stochastic_greedy_epsilon: If not `None`, each point of the batch is selected from a random subset of the data (see `SequentialAcquisitionFunction`). Smaller values lead to larger subsets.
+        :param seed: Seed of the random subsets (only used if `stochastic_greedy_epsilon` is not `None`) and of the shuffling of mini batches.
+        :param executor: Executor used for processing several mini batches concurrently (see activeft.acquisition_functions.AcquisitionFunction). Mini batches are processed sequentially if `None`.
+        :param tree_fan_in: Number of nodes merged in each step of tree reduction (see activeft.acquisition_functions.SequentialAcquisitionFunction). Batches are selected by hierarchical composition if `None`.
+        :param lazy: Whether to select batches using the lazy greedy algorithm (see activeft.acquisition_functions.LazyGreedy).
+        """
+        TargetedBaCE.__init__(
+            self,
+            target=target,
+            noise_std=noise_std,
+            subsampled_target_frac=subsampled_target_frac,
+            max_target_size=max_target_size,
+            mini_batch_size=mini_batch_size,
+            embedding_batch_size=embedding_batch_size,
+            embedding_cache=embedding_cache,
+            num_workers=num_workers,
+            subsample=subsample,
+            force_nonsequential=force_nonsequential,
+            stochastic_greedy_epsilon=stochastic_greedy_epsilon,
+            seed=seed,
+            executor=executor,
+            tree_fan_in=tree_fan_in,
+        )
+        LazyGreedy.__init__(self, lazy=lazy)
+
     def compute(self, state: BaCEState) -> torch.Tensor:
         correlations = _compute_correlations(
             covariance_matrix=state.covariance_matrix, n=state.n
@@ -33,18 +96,34 @@ class CTL(TargetedBaCE):
         average_correlations = torch.mean(correlations, dim=1)
         return average_correlations
 
+    def compute_at(self, state: BaCEState, indices: torch.Tensor) -> torch.Tensor:
+        correlations = _compute_correlations(
+            covariance_matrix=state.covariance_matrix, n=state.n, indices=indices
+        )
+        return torch.mean(correlations, dim=1)
+
+    def upper_bound(self, state: BaCEState) -> torch.Tensor:
+        return self.compute(state)
+
+    def marginal_gain(self, state: BaCEState, indices: torch.Tensor) -> torch.Tensor:
+        return self.compute_at(state, indices)
+
 
 def _compute_correlations(
-    covariance_matrix: GaussianCovarianceMatrix, n: int
+    covariance_matrix: CovarianceMatrix, n: int, indices: torch.Tensor | None = None
 ) -> torch.Tensor:
-    ind_a = torch.arange(n)
-    ind_b = torch.arange(n, covariance_matrix.dim)
-    covariance_aa = covariance_matrix[ind_a, :][:, ind_a]
-    covariance_bb = covariance_matrix[ind_b, :][:, ind_b]
-    covariance_ab = covariance_matrix[ind_a, :][:, ind_b]
-
-    std_a = torch.sqrt(torch.diag(covariance_aa))
-    std_b = torch.sqrt(torch.diag(covariance_bb))
+    if indices is None:
+        variances = covariance_matrix.diag()
+        variances_a = variances[:n]
+        variances_b = variances[n:]
+        covariance_ab = covariance_matrix[:n, n:]
+    else:
+        variances_a = covariance_matrix.diag(indices)
+        variances_b = covariance_matrix.diag(torch.arange(n, covariance_matrix.dim))
+        covariance_ab = covariance_matrix[indices, n:]
+
+    std_a = torch.sqrt(variances_a)
+    std_b = torch.sqrt(variances_b)
     std_ab = torch.ger(std_a, std_b)  # outer product of standard deviations
 
     correlations = covariance_ab / std_ab
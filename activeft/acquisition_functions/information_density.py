@@ -1,3 +1,4 @@
+from concurrent.futures import Executor
 import torch
 from activeft.acquisition_functions import BatchAcquisitionFunction
 from activeft.acquisition_functions.cosine_similarity import CosineSimilarity
@@ -9,6 +10,7 @@ from activeft.utils import (
     DEFAULT_NUM_WORKERS,
     DEFAULT_SUBSAMPLE,
 )
+from activeft.embeddings.cache import EmbeddingCache
 
 
 class InformationDensity(BatchAcquisitionFunction):
@@ -36,13 +38,16 @@ class InformationDensity(BatchAcquisitionFunction):
         max_target_size: int | None = None,
         mini_batch_size=DEFAULT_MINI_BATCH_SIZE,
         embedding_batch_size=DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_cache: EmbeddingCache | None = None,
         num_workers=DEFAULT_NUM_WORKERS,
         subsample=DEFAULT_SUBSAMPLE,
+        executor: Executor | None = None,
     ):
         super().__init__(
             mini_batch_size=mini_batch_size,
             num_workers=num_workers,
             subsample=subsample,
+            executor=executor,
         )
         self.cosine_similarity = CosineSimilarity(
             target=target,
@@ -50,6 +55,7 @@ class InformationDensity(BatchAcquisitionFunction):
             max_target_size=max_target_size,
             mini_batch_size=mini_batch_size,
             embedding_batch_size=embedding_batch_size,
+            embedding_cache=embedding_cache,
             num_workers=num_workers,
             subsample=subsample,
         )
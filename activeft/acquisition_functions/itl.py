@@ -1,9 +1,42 @@
+from concurrent.futures import Executor
+from typing import NamedTuple
 import torch
+from activeft.acquisition_functions import LazyGreedy
 from activeft.acquisition_functions.bace import TargetedBaCE, BaCEState
-from activeft.utils import wandb_log
-
-
-class ITL(TargetedBaCE):
+from activeft.gaussian import CovarianceMatrix, get_jitter
+from activeft.model import ModelWithEmbeddingOrKernel
+from activeft.utils import (
+    DEFAULT_EMBEDDING_BATCH_SIZE,
+    DEFAULT_MINI_BATCH_SIZE,
+    DEFAULT_NUM_WORKERS,
+    DEFAULT_SUBSAMPLE,
+    wandb_log,
+)
+from activeft.embeddings.cache import EmbeddingCache
+
+__all__ = ["ITL", "ITLState"]
+
+
+class ITLState(NamedTuple):
+    """State of sequential batch selection with ITL."""
+
+    covariance_matrix: CovarianceMatrix
+    r"""Kernel matrix of the data (of shape $n \times n$). Represented in feature space if the embedding dimension is smaller than $n$."""
+    n: int
+    """Length of the data set."""
+    observed_indices: torch.Tensor
+    """Indices of points that were already observed."""
+    joint_data: torch.Tensor
+    r"""Tensor of shape $(n + m) \times d$ which includes both sample space and target space."""
+    conditional_variances: torch.Tensor
+    r"""Variances $\tilde{k}_i(\vx,\vx)$ of the data which are additionally conditioned on the prediction targets. Tensor of shape $n$."""
+    target_weights: torch.Tensor
+    r"""Tensor $\vk_i(\spS,\spA) (\mK_i(\spA,\spA) + \sigma^2 \mI)^{-1}$ of shape $n \times m$."""
+    target_precision: torch.Tensor
+    r"""Tensor $(\mK_i(\spA,\spA) + \sigma^2 \mI)^{-1}$ of shape $m \times m$."""
+
+
+class ITL(TargetedBaCE, LazyGreedy[ITLState]):
     r"""
     `ITL` [^3] (*information-based transductive learning*) composes the batch by sequentially selecting the samples with the largest information gain about the prediction targets $\spA$: \\[\begin{align}
         \vx_{i+1} &= \argmax_{\vx \in \spS}\ \I{\vf(\spA)}{y(\vx) \mid \spD_i}.
@@ -41,6 +74,9 @@ class ITL(TargetedBaCE):
         \tilde{k}_i(\vx,\vx) &= k_i(\vx,\vx) - \vk_i(\vx,\spA) (\mK_i(\spA,\spA) + \sigma^2 \mI)^{-1} \vk_i(\spA,\vx)
     \end{align}\\] where $\sigma^2$ is the noise variance and $k_i$ denotes the conditional kernel (see activeft.acquisition_functions.bace.BaCE).
 
+    Rather than inverting $\mK_i(\spA,\spA) + \sigma^2 \mI$ in every step, the variances $\tilde{k}_i(\vx,\vx)$ are updated incrementally after each selection (conditioning on the prediction targets and on the selected data commutes).
+    This requires $O(nm)$ time per step rather than $O(m^3 + nm^2)$.
+
     [^1]: A kernel $k$ on domain $\spX$ induces a stochastic process $\\{f(\vx)\\}_{\vx \in \spX}$. See activeft.model.ModelWithKernel.
 
     [^3]: Hübotter, J., Sukhija, B., Treven, L., As, Y., and Krause, A. Transductive Active Learning: Theory and Applications. NeurIPS, 2024.
@@ -48,15 +84,90 @@ class ITL(TargetedBaCE):
     [^4]: see activeft.acquisition_functions.bace.BaCE
     """
 
-    def compute(self, state: BaCEState) -> torch.Tensor:
-        variances = torch.diag(state.covariance_matrix[: state.n, : state.n])
+    def __init__(
+        self,
+        target: torch.Tensor,
+        noise_std: float | None = None,
+        subsampled_target_frac: float = 1,
+        max_target_size: int | None = None,
+        mini_batch_size=DEFAULT_MINI_BATCH_SIZE,
+        embedding_batch_size=DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_cache: EmbeddingCache | None = None,
+        num_workers=DEFAULT_NUM_WORKERS,
+        subsample=DEFAULT_SUBSAMPLE,
+        force_nonsequential=False,
+        stochastic_greedy_epsilon: float | None = None,
+        seed: int | None = None,
+        executor: Executor | None = None,
+        tree_fan_in: int | None = None,
+        lazy=False,
+    ):
+        r"""
+        :param target: Tensor of prediction targets (shape $m \times d$).
+        :param noise_std: Standard deviation of the noise. Determined automatically if set to `None`.
+        :param subsampled_target_frac: Fraction of the target to be subsampled in each iteration. Must be in $(0,1]$. Default is $1$. Ignored if `target` is `None`.
+        :param max_target_size: Maximum size of the target to be subsampled in each iteration. Default is `None` in which case the target may be arbitrarily large. Ignored if `target` is `None`.
+        :param mini_batch_size: Size of mini-batch used for computing the acquisition function.
+        :param embedding_batch_size: Batch size used for computing the embeddings.
+        :param embedding_cache: Cache of the embeddings of the data set (see activeft.embeddings.cache.EmbeddingCache). Embeddings are not cached if `None`.
+        :param num_workers: Number of workers used for parallel computation.
+        :param subsample: Whether to subsample the data set.
+        :param force_nonsequential: Whether to force non-sequential data selection.
+        :param stochastic_greedy_epsilon: If not `None`, each point of the batch is selected from a random subset of the data (see `SequentialAcquisitionFunction`). Smaller values lead to larger subsets.
+        :param seed: Seed of the random subsets (only used if `stochastic_greedy_epsilon` is not `None`) and of the shuffling of mini batches.
+        :param executor: Executor used for processing several mini batches concurrently (see activeft.acquisition_functions.AcquisitionFunction). Mini batches are processed sequentially if `None`.
+        :param tree_fan_in: Number of nodes merged in each step of tree reduction (see activeft.acquisition_functions.SequentialAcquisitionFunction). Batches are selected by hierarchical composition if `None`.
+        :param lazy: Whether to select batches using the lazy greedy algorithm (see activeft.acquisition_functions.LazyGreedy).
+        """
+        TargetedBaCE.__init__(
+            self,
+            target=target,
+            noise_std=noise_std,
+            subsampled_target_frac=subsampled_target_frac,
+            max_target_size=max_target_size,
+            mini_batch_size=mini_batch_size,
+            embedding_batch_size=embedding_batch_size,
+            embedding_cache=embedding_cache,
+            num_workers=num_workers,
+            subsample=subsample,
+            force_nonsequential=force_nonsequential,
+            stochastic_greedy_epsilon=stochastic_greedy_epsilon,
+            seed=seed,
+            executor=executor,
+            tree_fan_in=tree_fan_in,
+        )
+        LazyGreedy.__init__(self, lazy=lazy)
+
+    def initialize(
+        self,
+        model: ModelWithEmbeddingOrKernel | None,
+        data: torch.Tensor,
+        device: torch.device | None,
+    ) -> ITLState:
+        state = super().initialize(model, data, device)
+        noise_var = self._noise_var(state.covariance_matrix, state.n)
+
+        variances = state.covariance_matrix.diag()
+        data_target_covariances = state.covariance_matrix[: state.n, state.n :]
+        target_covariances = state.covariance_matrix[state.n :, state.n :]
+        I = torch.eye(target_covariances.size(0)).to(target_covariances.device)
+        target_precision = torch.cholesky_inverse(
+            torch.linalg.cholesky(target_covariances + noise_var * I)
+        )
+        target_weights = data_target_covariances @ target_precision
+        conditional_variances = variances[: state.n] - torch.sum(
+            target_weights * data_target_covariances, dim=1
+        )
+        return ITLState(
+            *state,
+            conditional_variances=conditional_variances,
+            target_weights=target_weights,
+            target_precision=target_precision,
+        )
 
-        conditional_covariance_matrix = state.covariance_matrix.condition_on(
-            torch.arange(start=state.n, end=state.covariance_matrix.dim),
-            target_indices=torch.arange(state.n),
-            noise_std=self.noise_std,
-        )[:, :]
-        conditional_variances = torch.diag(conditional_covariance_matrix)
+    def compute(self, state: ITLState) -> torch.Tensor:
+        variances = state.covariance_matrix.diag()[: state.n]
+        conditional_variances = state.conditional_variances
 
         mi = 0.5 * torch.clamp(torch.log(variances / conditional_variances), min=0)
         wandb_log(
@@ -66,3 +177,55 @@ class ITL(TargetedBaCE):
             }
         )
         return mi
+
+    def compute_at(self, state: ITLState, indices: torch.Tensor) -> torch.Tensor:
+        variances = state.covariance_matrix.diag(indices)
+        conditional_variances = state.conditional_variances[indices]
+        return 0.5 * torch.clamp(torch.log(variances / conditional_variances), min=0)
+
+    def upper_bound(self, state: ITLState) -> torch.Tensor:
+        return self.compute(state)
+
+    def marginal_gain(self, state: ITLState, indices: torch.Tensor) -> torch.Tensor:
+        return self.compute_at(state, indices)
+
+    def step(self, state: ITLState, i: int) -> ITLState:
+        noise_var = self._noise_var(state.covariance_matrix, state.n)
+
+        # update the variances conditioned on the prediction targets, O(nm)
+        covariance_vector = state.covariance_matrix[:, i]
+        a = state.target_precision @ covariance_vector[state.n :]
+        conditional_covariance_vector = (
+            covariance_vector[: state.n]
+            - state.target_weights @ covariance_vector[state.n :]
+        )
+        beta = state.conditional_variances[i] + noise_var
+        state.target_weights.addr_(
+            conditional_covariance_vector / beta, a, alpha=-1
+        )  # Note: not treating as immutable!
+        state.target_precision.addr_(a / beta, a)
+        state.conditional_variances.sub_(conditional_covariance_vector**2 / beta)
+
+        bace_state = super().step(
+            BaCEState(
+                covariance_matrix=state.covariance_matrix,
+                n=state.n,
+                observed_indices=state.observed_indices,
+                joint_data=state.joint_data,
+            ),
+            i,
+        )
+        return ITLState(
+            *bace_state,
+            conditional_variances=state.conditional_variances,
+            target_weights=state.target_weights,
+            target_precision=state.target_precision,
+        )
+
+    def _noise_var(self, covariance_matrix: CovarianceMatrix, n: int) -> float:
+        if self.noise_std is None:
+            return get_jitter(
+                covariance_matrix=covariance_matrix,
+                indices=torch.arange(n, covariance_matrix.dim),
+            )
+        return self.noise_std**2
@@ -1,3 +1,4 @@
+from concurrent.futures import Executor
 import torch
 from activeft.acquisition_functions.bace import TargetedBaCE, BaCEState
 from activeft.utils import (
@@ -7,6 +8,7 @@ from activeft.utils import (
     DEFAULT_SUBSAMPLE,
     wandb_log,
 )
+from activeft.embeddings.cache import EmbeddingCache
 
 
 ABS_TOL = 1e-5
@@ -25,9 +27,14 @@ class ITLNoiseless(TargetedBaCE):
         max_target_size: int | None = None,
         mini_batch_size=DEFAULT_MINI_BATCH_SIZE,
         embedding_batch_size=DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_cache: EmbeddingCache | None = None,
         num_workers=DEFAULT_NUM_WORKERS,
         subsample=DEFAULT_SUBSAMPLE,
         force_nonsequential=False,
+        stochastic_greedy_epsilon: float | None = None,
+        seed: int | None = None,
+        executor: Executor | None = None,
+        tree_fan_in: int | None = None,
     ):
         r"""
         :param target: Tensor of prediction targets (shape $m \times d$).
@@ -36,9 +43,14 @@ class ITLNoiseless(TargetedBaCE):
         :param max_target_size: Maximum size of the target to be subsampled in each iteration. Default is `None` in which case the target may be arbitrarily large. Ignored if `target` is `None`.
         :param mini_batch_size: Size of mini-batch used for computing the acquisition function.
         :param embedding_batch_size: Batch size used for computing the embeddings.
+        :param embedding_cache: Cache of the embeddings of the data set (see activeft.embeddings.cache.EmbeddingCache). Embeddings are not cached if `None`.
         :param num_workers: Number of workers used for parallel computation.
         :param subsample: Whether to subsample the data set.
         :param force_nonsequential: Whether to force non-sequential data selection.
+        :param stochastic_greedy_epsilon: If not `None`, each point of the batch is selected from a random subset of the data (see `SequentialAcquisitionFunction`). Smaller values lead to larger subsets.
+        :param seed: Seed of the random subsets (only used if `stochastic_greedy_epsilon` is not `None`) and of the shuffling of mini batches.
+        :param executor: Executor used for processing several mini batches concurrently (see activeft.acquisition_functions.AcquisitionFunction). Mini batches are processed sequentially if `None`.
+        :param tree_fan_in: Number of nodes merged in each step of tree reduction (see activeft.acquisition_functions.SequentialAcquisitionFunction). Batches are selected by hierarchical composition if `None`.
         """
         TargetedBaCE.__init__(
             self,
@@ -47,28 +59,35 @@ class ITLNoiseless(TargetedBaCE):
             max_target_size=max_target_size,
             mini_batch_size=mini_batch_size,
             embedding_batch_size=embedding_batch_size,
+            embedding_cache=embedding_cache,
             num_workers=num_workers,
             subsample=subsample,
             force_nonsequential=force_nonsequential,
+            stochastic_greedy_epsilon=stochastic_greedy_epsilon,
+            seed=seed,
+            executor=executor,
+            tree_fan_in=tree_fan_in,
         )
         self.target_is_nonobersavble = target_is_nonobersavble
 
     def compute(self, state: BaCEState) -> torch.Tensor:
-        variances = torch.diag(state.covariance_matrix[: state.n, : state.n])
+        variances = state.covariance_matrix.diag()[: state.n]
         conditional_variances = torch.empty_like(variances)
 
-        unobserved_indices = torch.arange(state.n)[~state.observed_indices]
+        observed_mask = torch.zeros(state.n, dtype=torch.bool)
+        observed_mask[state.observed_indices] = True
+        unobserved_indices = torch.arange(state.n)[~observed_mask]
         target_indices = torch.arange(start=state.n, end=state.covariance_matrix.dim)
         if not self.target_is_nonobersavble and state.observed_indices.size(0) > 0:
             observed_target_mask = get_observed_target_mask(state)
             target_indices = target_indices[~observed_target_mask]
 
         if unobserved_indices.size(0) > 0:
-            conditional_variances[unobserved_indices] = torch.diag(
+            conditional_variances[unobserved_indices] = (
                 state.covariance_matrix.condition_on(
                     indices=target_indices,
                     target_indices=unobserved_indices,
-                )[:, :]
+                ).diag()
             )
 
         mi = 0.5 * torch.clamp(torch.log(variances / conditional_variances), min=0)
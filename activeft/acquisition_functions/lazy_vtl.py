@@ -1,19 +1,21 @@
-from typing import List, NamedTuple, Tuple
+from typing import Dict, NamedTuple, Tuple
 import numpy as np
 import torch
 from activeft.acquisition_functions import (
     EmbeddingBased,
     SequentialAcquisitionFunction,
     Targeted,
+    _dataset_indices,
 )
-from activeft.gaussian import GaussianCovarianceMatrix
+from activeft.embeddings.cache import EmbeddingCache
+from activeft.gaussian import INITIAL_CAPACITY, GaussianCovarianceMatrix, LazyKernel
 from activeft.model import ModelWithEmbeddingOrKernel
 from activeft.utils import (
     DEFAULT_EMBEDDING_BATCH_SIZE,
     DEFAULT_MINI_BATCH_SIZE,
     DEFAULT_NUM_WORKERS,
     DEFAULT_SUBSAMPLE,
-    PriorityQueue,
+    ArrayPriorityQueue,
 )
 
 __all__ = ["LazyVTL", "LazyVTLState"]
@@ -26,16 +28,22 @@ class LazyVTLState(NamedTuple):
     r"""Kernel matrix of the data. Tensor of shape $n \times n$."""
     m: int
     """Size of the target space."""
-    selected_indices: List[int]
-    """Indices of points that were already observed."""
-    covariance_matrix_indices: List[int]
-    """Indices of points that were added to the covariance matrix (excluding the initially added target space)."""
+    selected_indices: torch.Tensor
+    """Indices of points that were already observed. Preallocated tensor of which the first `num_selected` entries are valid."""
+    num_selected: int
+    """Number of points that were already observed."""
+    covariance_matrix_indices: torch.Tensor
+    """Indices of points that were added to the covariance matrix (excluding the initially added target space). Preallocated tensor of which the first `len(covariance_matrix_index_map)` entries are valid."""
+    covariance_matrix_index_map: Dict[int, int]
+    """Map from the indices of points that were added to the covariance matrix to their position within `covariance_matrix_indices`."""
     target: torch.Tensor
     r"""Tensor of shape $m \times d$ which includes target space."""
     data: torch.Tensor
     r"""Tensor of shape $n \times d$ which includes sample space."""
     current_inv: torch.Tensor
     """Current inverse of the covariance matrix of selected data."""
+    kernel: LazyKernel
+    """Kernel over the data and the prediction targets which is evaluated on demand."""
 
 
 class LazyVTL(
@@ -48,14 +56,21 @@ class LazyVTL(
 
     See Appendix F.2 of [Efficiently Learning at Test-Time: Active Fine-Tuning of LLMs](https://arxiv.org/abs/2410.08020).
 
+    The kernel is only evaluated for data points whose acquisition values are recomputed (see activeft.gaussian.LazyKernel).
+    If the initial priority queue is set using `set_initial_priority_queue` (e.g., based on inner products obtained from a nearest neighbor search), data points that are never recomputed are never passed through the model.
+    Otherwise, the acquisition values of all data are computed (in batches of size `embedding_batch_size`) before the first selection, and they are recomputed lazily thereafter.
+
     [^1]: Hübotter, J., Bongni, S., Hakimi, I., and Krause, A. Efficiently Learning at Test-Time: Active Fine-Tuning of LLMs. Preprint, 2024.
     """
 
     noise_std: float
     """Standard deviation of the noise. Determined automatically if set to `None`."""
 
-    priority_queue: PriorityQueue | None = None
-    """Priority queue over the data set."""
+    priority_queue: ArrayPriorityQueue | None = None
+    """Priority queue over (upper bounds of) the acquisition values of the data set. Consumed by the next batch selection. If `None`, the next batch selection computes the acquisition values of all data."""
+
+    refresh_batch_size: int
+    """Number of data points whose acquisition values are recomputed at once."""
 
     def __init__(
         self,
@@ -65,8 +80,10 @@ class LazyVTL(
         max_target_size: int | None = None,
         mini_batch_size=DEFAULT_MINI_BATCH_SIZE,
         embedding_batch_size=DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_cache: EmbeddingCache | None = None,
         num_workers=DEFAULT_NUM_WORKERS,
         subsample=DEFAULT_SUBSAMPLE,
+        refresh_batch_size: int = 1,
     ):
         """
         :param target: Tensor of prediction targets (shape $m \times d$).
@@ -75,8 +92,10 @@ class LazyVTL(
         :param max_target_size: Maximum size of the target to be subsampled in each iteration. Default is `None` in which case the target may be arbitrarily large. Ignored if `target` is `None`.
         :param mini_batch_size: Size of mini-batch used for computing the acquisition function.
         :param embedding_batch_size: Batch size used for computing the embeddings.
+        :param embedding_cache: Cache of the embeddings of the data set (see activeft.embeddings.cache.EmbeddingCache). Embeddings are not cached across batch selections if `None`.
         :param num_workers: Number of workers used for parallel computation.
         :param subsample: Whether to subsample the data set.
+        :param refresh_batch_size: Number of data points with the largest upper bounds whose acquisition values are recomputed at once (in a single vectorized computation). Larger values reduce the number of iterations if the upper bounds are loose. As the priorities are not guaranteed to be upper bounds of the acquisition values, the selected batch may depend on this parameter.
         """
         SequentialAcquisitionFunction.__init__(
             self,
@@ -91,8 +110,14 @@ class LazyVTL(
             subsampled_target_frac=subsampled_target_frac,
             max_target_size=max_target_size,
         )
-        EmbeddingBased.__init__(self, embedding_batch_size=embedding_batch_size)
+        EmbeddingBased.__init__(
+            self,
+            embedding_batch_size=embedding_batch_size,
+            embedding_cache=embedding_cache,
+        )
+        assert refresh_batch_size > 0, "Refresh batch size must be positive"
         self.noise_std = noise_std
+        self.refresh_batch_size = refresh_batch_size
 
     def set_initial_priority_queue(
         self,
@@ -114,7 +139,7 @@ class LazyVTL(
             self_inner_products + self.noise_var
         )
 
-        self.priority_queue = PriorityQueue(values=values.cpu().tolist())
+        self.priority_queue = ArrayPriorityQueue(values=values)
 
     def select_from_minibatch(
         self,
@@ -134,28 +159,38 @@ class LazyVTL(
         """
         state = self.initialize(model, data, device)
 
-        assert (
-            self.priority_queue is not None
-        ), "Initial priority queue must be set."  # TODO: make optional, compute from scratch if not provided
-        assert self.priority_queue.size() == data.size(
+        priority_queue = self.priority_queue
+        self.priority_queue = None  # the priority queue is only valid for `data`
+        if priority_queue is None:  # requires evaluating the kernel at all data
+            values = []
+            for indices in torch.arange(data.size(0)).split(self.embedding_batch_size):
+                new_values, state = self.recompute(state, indices)
+                values.append(new_values)
+            priority_queue = ArrayPriorityQueue(values=torch.cat(values))
+        assert priority_queue.size() == data.size(
             0
         ), "Size of the priority queue must match the size of the data set."
 
         selected_values = []
         for _ in range(batch_size):
             while True:
-                i, _ = self.priority_queue.pop()
-                new_value, new_covariance_matrix, state = self.recompute(state, i)
+                indices, upper_bounds = priority_queue.top(self.refresh_batch_size + 1)
+                candidates = indices[: self.refresh_batch_size]
+                new_values, state = self.recompute(state, candidates)
+                priority_queue.update(candidates, new_values)
 
-                prev_top_value = self.priority_queue.top_value
-                self.priority_queue.push(i, new_value)
+                j = int(torch.argmax(new_values).item())
+                new_value = new_values[j].item()
                 if (
-                    new_value >= prev_top_value
+                    upper_bounds.size(0) <= self.refresh_batch_size
+                    or new_value >= upper_bounds[-1].item()
                 ):  # done if the value is larger than the largest upper bound of other points
-                    break  # (i, new_value) contains the next selected index and its value
+                    break
             selected_values.append(new_value)
-            state = self.step(state, i, new_covariance_matrix)
-        return torch.tensor(state.selected_indices), torch.tensor(selected_values)
+            state = self.step(state, int(candidates[j].item()))
+        return state.selected_indices[: state.num_selected].cpu(), torch.tensor(
+            selected_values
+        )
 
     def initialize(
         self,
@@ -165,120 +200,159 @@ class LazyVTL(
     ) -> LazyVTLState:
         target = self.get_target()
         m = target.size(0)
-
-        # Compute covariance matrix of targets
-        assert model is None, "embedding computation via model not supported"
-        covariance_matrix = GaussianCovarianceMatrix.from_embeddings(
-            Embeddings=target.to(device)
+        kernel = LazyKernel(
+            model=model,
+            data=data,
+            target=target,
+            embed_data=lambda indices, batch: self._embed_data(model, indices, batch),
+            embed_target=lambda target: self.compute_embedding(
+                model=model,  # type: ignore
+                data=target,
+                batch_size=self.embedding_batch_size,
+            ),
+            device=device,
         )
 
-        if self.priority_queue is None:
-            self.set_initial_priority_queue(
-                embeddings=data,
-                target_embedding=torch.mean(target, dim=0),
-            )
+        # Compute covariance matrix of targets
+        covariance_matrix = GaussianCovarianceMatrix(kernel.target_target())
 
         return LazyVTLState(
             covariance_matrix=covariance_matrix,
             m=m,
-            selected_indices=[],
-            covariance_matrix_indices=[],
+            selected_indices=torch.empty(INITIAL_CAPACITY, dtype=torch.long),
+            num_selected=0,
+            covariance_matrix_indices=torch.empty(INITIAL_CAPACITY, dtype=torch.long),
+            covariance_matrix_index_map={},
             target=target,
             data=data,
-            current_inv=torch.empty(0, 0),
+            current_inv=torch.empty(0, 0, device=device),
+            kernel=kernel,
         )
 
+    def _embed_data(
+        self,
+        model: ModelWithEmbeddingOrKernel | None,
+        indices: torch.Tensor,
+        data: torch.Tensor,
+    ) -> torch.Tensor:
+        return self.compute_data_embedding(
+            model=model, data=data, indices=_dataset_indices(indices)  # type: ignore
+        )  # embeddings are cached with respect to indices within the data set
+
     def recompute(
-        self, state: LazyVTLState, data_idx: int
-    ) -> Tuple[float, GaussianCovarianceMatrix, LazyVTLState]:
+        self, state: LazyVTLState, data_indices: torch.Tensor
+    ) -> Tuple[torch.Tensor, LazyVTLState]:
         """
-        Update value of data point `data_idx`.
+        Update values of data points `data_indices`.
+        The values of data points which were not yet added to the covariance matrix are computed in a single vectorized computation.
         """
-        try:  # index of data point within covariance matrix
-            idx = state.m + state.covariance_matrix_indices.index(data_idx)
-            new_covariance_matrix = state.covariance_matrix
-            new_state = state
-        except ValueError:
-            # update cached inverse covariance matrix of previously selected data, O(n^2)
-            i = state.current_inv.size(0)
-            if len(state.selected_indices) > i:
-                d = state.data.size(1)
-                prev_data = (
-                    state.data[
-                        torch.tensor(state.selected_indices[:i]).to(state.data.device)
-                    ]
-                    if i > 0
-                    else torch.empty(0, d)
-                )  # (i, d)
-                new_data = state.data[
-                    torch.tensor(state.selected_indices[i:]).to(state.data.device)
-                ]  # (n-1-i, d)
-                B = prev_data @ new_data.T  # (n-1,)
-                I = torch.eye(new_data.size(0)).to(new_data.device)
-                C = new_data @ new_data.T + self.noise_var * I  # (n-1-i, n-1-i)
-                new_inv = update_inverse(A_inv=state.current_inv, B=B, C=C)
-                new_state = LazyVTLState(
-                    covariance_matrix=state.covariance_matrix,
-                    m=state.m,
-                    selected_indices=state.selected_indices,
-                    covariance_matrix_indices=state.covariance_matrix_indices,
-                    target=state.target,
-                    data=state.data,
-                    current_inv=new_inv,
-                )
-            else:
-                new_state = state
-
-            # expand the stored covariance matrix if selected data has not been selected before, O(n^2)
-            new_covariance_matrix = expand_covariance_matrix(
+        values = torch.empty(data_indices.size(0))
+        positions = [
+            state.covariance_matrix_index_map.get(int(data_idx), -1)
+            for data_idx in data_indices.tolist()
+        ]
+        _positions = torch.tensor(positions)
+        is_added = _positions >= 0
+        if bool(torch.any(is_added)):  # values of data points within covariance matrix
+            idx = state.m + _positions[is_added]
+            values[is_added] = compute(
                 covariance_matrix=state.covariance_matrix,
-                current_inv=new_state.current_inv,
-                data=state.data,
-                target=state.target,
-                data_idx=data_idx,
-                covariance_matrix_indices=state.covariance_matrix_indices,
-                selected_indices=state.selected_indices,
-            )
-            idx = new_covariance_matrix.dim - 1
+                idx=idx,
+                noise_var=self.noise_var,
+                m=state.m,
+            ).cpu()
+
+        new_state = state
+        if not bool(torch.all(is_added)):
+            new_state = self._update_inverse(state)
+            x = data_indices[~is_added]
+            selected_indices = state.selected_indices[: state.num_selected]
+            covariances = state.kernel.target_data(x)  # (m, r)
+            variances = state.kernel.diag(x)  # (r,)
+            if selected_indices.size(0) > 0:
+                k_Sx = state.kernel(selected_indices, x)  # (n, r)
+                A_inv_k_Sx = new_state.current_inv @ k_Sx  # (n, r)
+                covariances = (
+                    covariances
+                    - state.kernel.target_data(selected_indices) @ A_inv_k_Sx
+                )
+                variances = variances - torch.sum(k_Sx * A_inv_k_Sx, dim=0)
+            values[~is_added] = torch.sum(
+                covariances**2 / (variances + self.noise_var), dim=0
+            ).cpu()
+        return values, new_state
 
-        value = compute(
-            covariance_matrix=new_covariance_matrix,
-            idx=idx,
-            noise_var=self.noise_var,
+    def _update_inverse(self, state: LazyVTLState) -> LazyVTLState:
+        """
+        Updates the cached inverse covariance matrix of previously selected data, O(n^2).
+        """
+        i = state.current_inv.size(0)
+        if state.num_selected <= i:
+            return state
+
+        prev_indices = state.selected_indices[:i]
+        new_indices = state.selected_indices[i : state.num_selected]
+        B = state.kernel(prev_indices, new_indices)  # (i, n-i)
+        I = torch.eye(new_indices.size(0), device=B.device)
+        C = state.kernel(new_indices, new_indices) + self.noise_var * I  # (n-i, n-i)
+        new_inv = update_inverse(A_inv=state.current_inv, B=B, C=C)
+        return LazyVTLState(
+            covariance_matrix=state.covariance_matrix,
             m=state.m,
+            selected_indices=state.selected_indices,
+            num_selected=state.num_selected,
+            covariance_matrix_indices=state.covariance_matrix_indices,
+            covariance_matrix_index_map=state.covariance_matrix_index_map,
+            target=state.target,
+            data=state.data,
+            current_inv=new_inv,
+            kernel=state.kernel,
         )
-        return value, new_covariance_matrix, new_state
 
-    def step(
-        self,
-        state: LazyVTLState,
-        data_idx: int,
-        new_covariance_matrix: GaussianCovarianceMatrix,
-    ) -> LazyVTLState:
+    def step(self, state: LazyVTLState, i: int) -> LazyVTLState:
         """
         Advances the state.
         Updates the stored covariance matrix and the inverse of the covariance matrix (restricted to selected data).
         """
-        if data_idx not in state.covariance_matrix_indices:
-            state.covariance_matrix_indices.append(
-                data_idx
+        covariance_matrix = state.covariance_matrix
+        covariance_matrix_indices = state.covariance_matrix_indices
+        if i not in state.covariance_matrix_index_map:
+            # expand the stored covariance matrix if selected data has not been selected before, O(n^2)
+            state = self._update_inverse(state)
+            k = len(state.covariance_matrix_index_map)
+            covariance_matrix = expand_covariance_matrix(
+                covariance_matrix=covariance_matrix,
+                current_inv=state.current_inv,
+                kernel=state.kernel,
+                data_idx=i,
+                covariance_matrix_indices=covariance_matrix_indices[:k],
+                selected_indices=state.selected_indices[: state.num_selected],
+            )
+            covariance_matrix_indices = append(
+                covariance_matrix_indices, k, i
             )  # Note: not treating as immutable!
+            state.covariance_matrix_index_map[i] = k  # Note: not treating as immutable!
 
         # update the stored covariance matrix by conditioning on the new data point, O(n^2)
-        idx = state.m + state.covariance_matrix_indices.index(data_idx)
-        posterior_covariance_matrix = new_covariance_matrix.condition_on(
+        idx = state.m + state.covariance_matrix_index_map[i]
+        posterior_covariance_matrix = covariance_matrix.condition_on_(
             idx, noise_std=self.noise_std
-        )
+        )  # Note: not treating as immutable!
 
-        state.selected_indices.append(data_idx)  # Note: not treating as immutable!
+        selected_indices = append(
+            state.selected_indices, state.num_selected, i
+        )  # Note: not treating as immutable!
         return LazyVTLState(
             covariance_matrix=posterior_covariance_matrix,
             m=state.m,
-            selected_indices=state.selected_indices,
-            covariance_matrix_indices=state.covariance_matrix_indices,
+            selected_indices=selected_indices,
+            num_selected=state.num_selected + 1,
+            covariance_matrix_indices=covariance_matrix_indices,
+            covariance_matrix_index_map=state.covariance_matrix_index_map,
             target=state.target,
             data=state.data,
             current_inv=state.current_inv,
+            kernel=state.kernel,
         )
 
     @property
@@ -290,62 +364,72 @@ class LazyVTL(
 
 
 def compute(
-    covariance_matrix: GaussianCovarianceMatrix, idx: int, noise_var: float, m: int
-) -> float:
+    covariance_matrix: GaussianCovarianceMatrix,
+    idx: torch.Tensor,
+    noise_var: float,
+    m: int,
+) -> torch.Tensor:
     """
-    Computes the acquisition value of the data point at index `idx` within the covariance matrix.
+    Computes the acquisition values of the data points at indices `idx` within the covariance matrix.
 
-    Time complexity: O(1)
+    Time complexity: O(|idx| m)
     """
-
-    def engine(i, j):
-        return covariance_matrix[i, j] ** 2 / (covariance_matrix[j, j] + noise_var)
-
-    target_indices = torch.arange(m)
-    values = engine(target_indices, idx)
-    value = torch.sum(values, dim=0).cpu().item()
-    return value
+    target_indices = torch.arange(m).unsqueeze(1)
+    covariances = covariance_matrix[target_indices, idx.unsqueeze(0)]  # (m, |idx|)
+    variances = covariance_matrix.diag(idx)  # (|idx|,)
+    return torch.sum(covariances**2 / (variances + noise_var), dim=0)
 
 
 def expand_covariance_matrix(
     covariance_matrix: GaussianCovarianceMatrix,
     current_inv: torch.Tensor,
-    data: torch.Tensor,
-    target: torch.Tensor,
+    kernel: LazyKernel,
     data_idx: int,
-    covariance_matrix_indices: List[int],
-    selected_indices: List[int],
+    covariance_matrix_indices: torch.Tensor,
+    selected_indices: torch.Tensor,
 ) -> GaussianCovarianceMatrix:
     """
     Expands the given covariance matrix with `data_idx`.
 
     :return: Expanded covariance matrix.
 
-    Time complexity: O(n^2)
+    Time complexity: O(n^2) kernel evaluations
     """
-    d = data.size(1)
-    unique_selected_data = (
-        data[torch.tensor(covariance_matrix_indices).to(data.device)]
-        if len(covariance_matrix_indices) > 0
-        else torch.empty(0, d)
-    )  # (n', d)
-    selected_data = (
-        data[torch.tensor(selected_indices).to(data.device)]
-        if len(selected_indices) > 0
-        else torch.empty(0, d)
-    )  # (n, d)
-    new_data = data[data_idx]  # (d,)
-    joint_data = torch.cat(
-        (target, unique_selected_data, new_data.unsqueeze(0)), dim=0
-    )  # (m+n'+1, d)
-    I_d = torch.eye(d).to(selected_data.device)
-    covariance_vector = (
-        joint_data @ (I_d - selected_data.T @ current_inv @ selected_data) @ new_data
+    x = torch.tensor([data_idx])
+    joint_indices = torch.cat((covariance_matrix_indices, x))  # (n'+1,)
+    k_Jx = torch.cat((kernel.target_data(x), kernel(joint_indices, x))).squeeze(
+        1
     )  # (m+n'+1,)
+    if selected_indices.size(0) == 0:
+        covariance_vector = k_Jx
+    else:
+        k_JS = torch.cat(
+            (
+                kernel.target_data(selected_indices),
+                kernel(joint_indices, selected_indices),
+            )
+        )  # (m+n'+1, n)
+        covariance_vector = k_Jx - k_JS @ (
+            current_inv @ kernel(selected_indices, x).squeeze(1)
+        )  # (m+n'+1,)
     assert covariance_vector.size(0) == covariance_matrix.dim + 1
     return covariance_matrix.expand(covariance_vector)
 
 
+def append(buffer: torch.Tensor, size: int, value: int) -> torch.Tensor:
+    """
+    Writes `value` to position `size` of the preallocated `buffer`, doubling its capacity if it is full.
+
+    :return: Buffer containing `value` at position `size`. Only a new buffer if the capacity was exceeded.
+
+    Time complexity: O(1) amortized
+    """
+    if size == buffer.size(0):
+        buffer = torch.cat((buffer, torch.empty_like(buffer)))
+    buffer[size] = value
+    return buffer
+
+
 def update_inverse(
     A_inv: torch.Tensor, B: torch.Tensor, C: torch.Tensor
 ) -> torch.Tensor:
@@ -1,6 +1,10 @@
 from typing import NamedTuple
 import torch
-from activeft.acquisition_functions import EmbeddingBased, SequentialAcquisitionFunction
+from activeft.acquisition_functions import (
+    EmbeddingBased,
+    SequentialAcquisitionFunction,
+    _dataset_indices,
+)
 from activeft.model import (
     ModelWithEmbedding,
     ModelWithEmbeddingOrKernel,
@@ -13,6 +17,7 @@ from activeft.utils import (
     DEFAULT_SUBSAMPLE,
     get_device,
 )
+from activeft.embeddings.cache import EmbeddingCache
 
 __all__ = ["MaxDist", "DistanceState", "sqd_kernel_distance"]
 
@@ -65,6 +70,7 @@ class MaxDist(
         self,
         mini_batch_size=DEFAULT_MINI_BATCH_SIZE,
         embedding_batch_size=DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_cache: EmbeddingCache | None = None,
         num_workers=DEFAULT_NUM_WORKERS,
         subsample=DEFAULT_SUBSAMPLE,
         force_nonsequential=False,
@@ -73,6 +79,7 @@ class MaxDist(
         :param mini_batch_size: Size of mini-batch used for computing the acquisition function.
         :param num_workers: Number of workers used for parallelizing the computation of the acquisition function.
         :param embedding_batch_size: Batch size used for computing the embeddings.
+        :param embedding_cache: Cache of the embeddings of the data set (see activeft.embeddings.cache.EmbeddingCache). Embeddings are not cached if `None`.
         :param num_workers: Number of workers used for parallel computation.
         :param subsample: Whether to subsample the data set.
         :param force_nonsequential: Whether to force non-sequential data selection.
@@ -84,7 +91,11 @@ class MaxDist(
             subsample=subsample,
             force_nonsequential=force_nonsequential,
         )
-        EmbeddingBased.__init__(self, embedding_batch_size=embedding_batch_size)
+        EmbeddingBased.__init__(
+            self,
+            embedding_batch_size=embedding_batch_size,
+            embedding_cache=embedding_cache,
+        )
 
     def initialize(
         self,
@@ -93,8 +104,8 @@ class MaxDist(
         device: torch.device | None,
     ) -> DistanceState:
         if model is None or isinstance(model, ModelWithEmbedding):
-            embeddings = self.compute_embedding(
-                model=model, data=data, batch_size=self.embedding_batch_size
+            embeddings = self.compute_data_embedding(
+                model=model, data=data, indices=_dataset_indices()
             ).to(device)
 
         centroid_indices = torch.tensor([])
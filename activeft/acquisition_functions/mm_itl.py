@@ -25,14 +25,24 @@ class MMITL(TargetedBaCE):
         correlations = _compute_correlations(
             covariance_matrix=state.covariance_matrix, n=state.n
         )
-        sqd_correlations = torch.square(correlations)
-
-        marginal_mi = -0.5 * torch.log(1 - sqd_correlations)
-        wandb.log(
-            {
-                "max_mi": torch.max(marginal_mi),
-                "min_mi": torch.min(marginal_mi),
-            }
+        return _compute_mean_marginal_mi(correlations)
+
+    def compute_at(self, state: BaCEState, indices: torch.Tensor) -> torch.Tensor:
+        correlations = _compute_correlations(
+            covariance_matrix=state.covariance_matrix, n=state.n, indices=indices
         )
-        mean_marginal_mi = torch.mean(marginal_mi, dim=1)
-        return mean_marginal_mi
+        return _compute_mean_marginal_mi(correlations)
+
+
+def _compute_mean_marginal_mi(correlations: torch.Tensor) -> torch.Tensor:
+    sqd_correlations = torch.square(correlations)
+
+    marginal_mi = -0.5 * torch.log(1 - sqd_correlations)
+    wandb.log(
+        {
+            "max_mi": torch.max(marginal_mi),
+            "min_mi": torch.min(marginal_mi),
+        }
+    )
+    mean_marginal_mi = torch.mean(marginal_mi, dim=1)
+    return mean_marginal_mi
@@ -1,9 +1,18 @@
+from concurrent.futures import Executor
 import torch
+from activeft.acquisition_functions import LazyGreedy
 from activeft.acquisition_functions.bace import BaCE, BaCEState
-from activeft.utils import wandb_log
+from activeft.utils import (
+    DEFAULT_EMBEDDING_BATCH_SIZE,
+    DEFAULT_MINI_BATCH_SIZE,
+    DEFAULT_NUM_WORKERS,
+    DEFAULT_SUBSAMPLE,
+    wandb_log,
+)
+from activeft.embeddings.cache import EmbeddingCache
 
 
-class UndirectedITL(BaCE):
+class UndirectedITL(BaCE, LazyGreedy[BaCEState]):
     r"""
     `UndirectedITL` composes the batch by sequentially selecting the samples with the largest prior variance: \\[\begin{align}
         \vx_{i+1} &= \argmax_\vx\ \sigma_{i}^2(\vx)
@@ -59,8 +68,53 @@ class UndirectedITL(BaCE):
     [^4]: see activeft.acquisition_functions.bace.BaCE
     """
 
+    def __init__(
+        self,
+        noise_std: float | None = None,
+        mini_batch_size=DEFAULT_MINI_BATCH_SIZE,
+        embedding_batch_size=DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_cache: EmbeddingCache | None = None,
+        num_workers=DEFAULT_NUM_WORKERS,
+        subsample=DEFAULT_SUBSAMPLE,
+        force_nonsequential=False,
+        stochastic_greedy_epsilon: float | None = None,
+        seed: int | None = None,
+        executor: Executor | None = None,
+        tree_fan_in: int | None = None,
+        lazy=False,
+    ):
+        """
+        :param noise_std: Standard deviation of the noise. Determined automatically if set to `None`.
+        :param mini_batch_size: Size of mini-batch used for computing the acquisition function.
+        :param embedding_batch_size: Batch size used for computing the embeddings.
+        :param embedding_cache: Cache of the embeddings of the data set (see activeft.embeddings.cache.EmbeddingCache). Embeddings are not cached if `None`.
+        :param num_workers: Number of workers used for parallel computation.
+        :param subsample: Whether to subsample the data set.
+        :param force_nonsequential: Whether to force non-sequential data selection.
+        :param stochastic_greedy_epsilon: If not `None`, each point of the batch is selected from a random subset of the data (see `SequentialAcquisitionFunction`). Smaller values lead to larger subsets.
+        :param seed: Seed of the random subsets (only used if `stochastic_greedy_epsilon` is not `None`) and of the shuffling of mini batches.
+        :param executor: Executor used for processing several mini batches concurrently (see activeft.acquisition_functions.AcquisitionFunction). Mini batches are processed sequentially if `None`.
+        :param tree_fan_in: Number of nodes merged in each step of tree reduction (see activeft.acquisition_functions.SequentialAcquisitionFunction). Batches are selected by hierarchical composition if `None`.
+        :param lazy: Whether to select batches using the lazy greedy algorithm (see activeft.acquisition_functions.LazyGreedy).
+        """
+        BaCE.__init__(
+            self,
+            noise_std=noise_std,
+            mini_batch_size=mini_batch_size,
+            embedding_batch_size=embedding_batch_size,
+            embedding_cache=embedding_cache,
+            num_workers=num_workers,
+            subsample=subsample,
+            force_nonsequential=force_nonsequential,
+            stochastic_greedy_epsilon=stochastic_greedy_epsilon,
+            seed=seed,
+            executor=executor,
+            tree_fan_in=tree_fan_in,
+        )
+        LazyGreedy.__init__(self, lazy=lazy)
+
     def compute(self, state: BaCEState) -> torch.Tensor:
-        variances = torch.diag(state.covariance_matrix[:, :])
+        variances = state.covariance_matrix.diag()
         wandb_log(
             {
                 "max_var": torch.max(variances),
@@ -68,3 +122,12 @@ class UndirectedITL(BaCE):
             }
         )
         return variances
+
+    def compute_at(self, state: BaCEState, indices: torch.Tensor) -> torch.Tensor:
+        return state.covariance_matrix.diag(indices)
+
+    def upper_bound(self, state: BaCEState) -> torch.Tensor:
+        return self.compute(state)
+
+    def marginal_gain(self, state: BaCEState, indices: torch.Tensor) -> torch.Tensor:
+        return self.compute_at(state, indices)
@@ -1,15 +1,19 @@
+from concurrent.futures import Executor
 import torch
+from activeft.acquisition_functions import LazyGreedy
 from activeft.acquisition_functions.bace import BaCEState, TargetedBaCE
 from activeft.acquisition_functions.vtl import VTL
+from activeft.model import ModelWithEmbeddingOrKernel
 from activeft.utils import (
     DEFAULT_EMBEDDING_BATCH_SIZE,
     DEFAULT_MINI_BATCH_SIZE,
     DEFAULT_NUM_WORKERS,
     DEFAULT_SUBSAMPLE,
 )
+from activeft.embeddings.cache import EmbeddingCache
 
 
-class UndirectedVTL(VTL):
+class UndirectedVTL(VTL, LazyGreedy[BaCEState]):
     r"""
     `UndirectedVTL` is the special case of [VTL](vtl) without specified prediction targets.[^1]
     In the literature, this acquisition function is also known as BAIT.[^4][^2]
@@ -30,15 +34,27 @@ class UndirectedVTL(VTL):
         noise_std=None,
         mini_batch_size=DEFAULT_MINI_BATCH_SIZE,
         embedding_batch_size=DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_cache: EmbeddingCache | None = None,
         num_workers=DEFAULT_NUM_WORKERS,
         subsample=DEFAULT_SUBSAMPLE,
         force_nonsequential=False,
+        stochastic_greedy_epsilon: float | None = None,
+        seed: int | None = None,
+        executor: Executor | None = None,
+        tree_fan_in: int | None = None,
+        lazy=False,
     ):
         """
         :param noise_std: Standard deviation of the noise.
         :param mini_batch_size: Size of mini-batch used for computing the acquisition function.
         :param embedding_batch_size: Batch size used for computing the embeddings.
+        :param embedding_cache: Cache of the embeddings of the data set (see activeft.embeddings.cache.EmbeddingCache). Embeddings are not cached if `None`.
         :param force_nonsequential: Whether to force non-sequential data selection.
+        :param stochastic_greedy_epsilon: If not `None`, each point of the batch is selected from a random subset of the data (see `SequentialAcquisitionFunction`). Smaller values lead to larger subsets.
+        :param seed: Seed of the random subsets (only used if `stochastic_greedy_epsilon` is not `None`) and of the shuffling of mini batches.
+        :param executor: Executor used for processing several mini batches concurrently (see activeft.acquisition_functions.AcquisitionFunction). Mini batches are processed sequentially if `None`.
+        :param tree_fan_in: Number of nodes merged in each step of tree reduction (see activeft.acquisition_functions.SequentialAcquisitionFunction). Batches are selected by hierarchical composition if `None`.
+        :param lazy: Whether to select batches using the lazy greedy algorithm (see activeft.acquisition_functions.LazyGreedy). The marginal gains are the reductions of the total variance.
         """
         TargetedBaCE.__init__(
             self,
@@ -46,10 +62,54 @@ class UndirectedVTL(VTL):
             noise_std=noise_std,
             mini_batch_size=mini_batch_size,
             embedding_batch_size=embedding_batch_size,
+            embedding_cache=embedding_cache,
             num_workers=num_workers,
             subsample=subsample,
             force_nonsequential=force_nonsequential,
+            stochastic_greedy_epsilon=stochastic_greedy_epsilon,
+            seed=seed,
+            executor=executor,
+            tree_fan_in=tree_fan_in,
         )
+        LazyGreedy.__init__(self, lazy=lazy)
+
+    def initialize(
+        self,
+        model: ModelWithEmbeddingOrKernel | None,
+        data: torch.Tensor,
+        device: torch.device | None,
+    ) -> BaCEState:
+        # the prediction targets coincide with the data, so the full (conditional) kernel matrix is required
+        return TargetedBaCE.initialize(self, model, data, device)
 
     def compute(self, state: BaCEState) -> torch.Tensor:
-        return self._compute(state=state, _target_indices=torch.arange(state.n))
+        return self._total_posterior_variances(state, slice(None, state.n))
+
+    def step(self, state: BaCEState, i: int) -> BaCEState:
+        return TargetedBaCE.step(self, state, i)
+
+    def compute_at(self, state: BaCEState, indices: torch.Tensor) -> torch.Tensor:
+        return self._total_posterior_variances(state, indices)
+
+    def upper_bound(self, state: BaCEState) -> torch.Tensor:
+        return self._variance_reductions(state, slice(None, state.n))
+
+    def marginal_gain(self, state: BaCEState, indices: torch.Tensor) -> torch.Tensor:
+        return self._variance_reductions(state, indices)
+
+    def _total_posterior_variances(
+        self, state: BaCEState, indices: torch.Tensor | slice
+    ) -> torch.Tensor:
+        # negated total posterior variance, computed from the variance reductions so that no n x n block of the covariance matrix is required
+        total_variance = torch.sum(state.covariance_matrix.diag()[: state.n])
+        return self._variance_reductions(state, indices) - total_variance
+
+    def _variance_reductions(
+        self, state: BaCEState, indices: torch.Tensor | slice
+    ) -> torch.Tensor:
+        variances = state.covariance_matrix.diag()[: state.n][indices]
+        squared_covariances = state.covariance_matrix.sum_of_squared_covariances(
+            indices, n=state.n
+        )
+        noise_var = self._noise_var()
+        return squared_covariances / (variances + noise_var)
@@ -1,8 +1,30 @@
+from typing import NamedTuple
 import torch
-from activeft.acquisition_functions.bace import TargetedBaCE, BaCEState
-from activeft.gaussian import get_jitter
+from activeft.acquisition_functions import _dataset_indices
+from activeft.acquisition_functions.bace import TargetedBaCE
+from activeft.gaussian import INITIAL_CAPACITY, JITTER_ADJUSTMENT, LazyKernel
+from activeft.model import ModelWithEmbeddingOrKernel, ModelWithKernel
 from activeft.utils import wandb_log
 
+__all__ = ["VTL", "VTLState"]
+
+
+class VTLState(NamedTuple):
+    """State of sequential batch selection with VTL."""
+
+    kernel: LazyKernel
+    """Prior kernel over the data and the prediction targets, from which the covariances among the data are computed on demand."""
+    n: int
+    """Length of the data set."""
+    observed_indices: torch.Tensor
+    """Indices of points that were already observed."""
+    variances: torch.Tensor
+    r"""Conditional variances $k_i(\vx,\vx)$ of the data and prediction targets. Tensor of shape $n + m$."""
+    covariances: torch.Tensor
+    r"""Conditional covariances $\mK_i(\spS,\spA)$ between the data and prediction targets. Tensor of shape $n \times m$."""
+    update_vectors: torch.Tensor
+    r"""Scaled conditional covariance vectors $k_{j-1}(\spS,\vx_j) / \sqrt{k_{j-1}(\vx_j,\vx_j) + \sigma^2}$ of the selected data. Preallocated tensor of shape $c \times n$ of which the first $i$ rows are valid, and whose capacity $c$ is doubled whenever it is exhausted."""
+
 
 class VTL(TargetedBaCE):
     r"""
@@ -31,6 +53,13 @@ class VTL(TargetedBaCE):
     In practice, this difference amounts to a different "weighting" of the prediction targets in $\spA$.
     While `VTL` attributes equal importance to all prediction targets, [ITL](itl) attributes more importance to the "most uncertain" prediction targets.
 
+    #### Computation
+
+    `VTL` only depends on the covariances $\mK_i(\spS,\spA)$ between data and prediction targets and on the variances of data and prediction targets.
+    Rather than conditioning the full $(n + m) \times (n + m)$ kernel matrix, only these blocks are stored and updated after each selection.
+    The required covariances $k_i(\spS,\vx)$ among the data are recovered from the prior kernel (which is evaluated on demand, see activeft.gaussian.LazyKernel) and the previous updates.
+    Each step thus requires $O(n (m + i))$ time (in addition to computing the prior column $k_0(\spS,\vx)$) and memory grows as $O(n (m + i))$ rather than $O(n^2)$.
+
     [^1]: A kernel $k$ on domain $\spX$ induces a stochastic process $\\{f(\vx)\\}_{\vx \in \spX}$. See activeft.model.ModelWithKernel.
 
     [^2]: Seo, S., Wallat, M., Graepel, T., and Obermayer, K. Gaussian process regression: Active data selection and test point rejection. In Mustererkennung 2000. Springer, 2000.
@@ -40,31 +69,123 @@ class VTL(TargetedBaCE):
     [^4]: see activeft.acquisition_functions.bace.BaCE
     """
 
-    def compute(self, state: BaCEState) -> torch.Tensor:
+    def initialize(
+        self,
+        model: ModelWithEmbeddingOrKernel | None,
+        data: torch.Tensor,
+        device: torch.device | None,
+    ) -> VTLState:
+        n = data.size(0)
+        if isinstance(model, ModelWithKernel):
+            target, target_embeddings = self.get_target(), None
+        else:
+            target, target_embeddings = self.get_embedded_target(
+                model=model,
+                embed=lambda target: self.compute_embedding(
+                    model=model, data=target, batch_size=self.embedding_batch_size
+                ),
+            )  # embeddings of the prediction targets are reused across mini batches
+        kernel = LazyKernel(
+            model=model,
+            data=data,
+            target=target,
+            embed_data=lambda indices, data: self.compute_data_embedding(
+                model=model, data=data, indices=_dataset_indices(indices)  # type: ignore
+            ),
+            embed_target=lambda _: target_embeddings,  # type: ignore
+            device=device,
+        )
+
+        all_indices = torch.arange(n)
+        covariances = kernel.target_data(all_indices).T.contiguous()
+        variances = torch.cat(
+            (kernel.diag(all_indices), torch.diagonal(kernel.target_target()))
+        )
+        return VTLState(
+            kernel=kernel,
+            n=n,
+            observed_indices=torch.tensor([], dtype=torch.long),
+            variances=variances,
+            covariances=covariances,
+            update_vectors=torch.empty(
+                (INITIAL_CAPACITY, n),
+                dtype=covariances.dtype,
+                device=covariances.device,
+            ),
+        )
+
+    def compute(self, state: VTLState) -> torch.Tensor:
         return self._compute(
-            state=state,
-            _target_indices=torch.arange(state.n, state.covariance_matrix.dim),
+            data_variances=state.variances[: state.n],
+            target_variances=state.variances[state.n :],
+            covariances=state.covariances,
+            noise_var=self._noise_var(),
         )
 
-    def _compute(self, state: BaCEState, _target_indices: torch.Tensor) -> torch.Tensor:
-        if self.noise_std is None:
-            noise_var = get_jitter(
-                covariance_matrix=state.covariance_matrix, indices=torch.arange(state.n)
-            )
-        else:
-            noise_var = self.noise_std**2
+    def compute_at(self, state: VTLState, indices: torch.Tensor) -> torch.Tensor:
+        return self._compute(
+            data_variances=state.variances[indices],
+            target_variances=state.variances[state.n :],
+            covariances=state.covariances[indices],
+            noise_var=self._noise_var(),
+        )
 
-        def compute_posterior_variance(i, j):
-            return state.covariance_matrix[i, i] - state.covariance_matrix[
-                i, j
-            ] ** 2 / (state.covariance_matrix[j, j] + noise_var)
+    def step(self, state: VTLState, i: int) -> VTLState:
+        noise_var = self._noise_var()
+        t = state.observed_indices.size(0)
 
-        data_indices = torch.arange(state.n).unsqueeze(
-            1
-        )  # Expand dims for broadcasting
-        target_indices = _target_indices.unsqueeze(0)  # Expand dims for broadcasting
+        covariance_vector = state.kernel.data_column(torch.tensor([i])).squeeze(1)
+        if t > 0:
+            update_vectors = state.update_vectors[:t]
+            covariance_vector = (
+                covariance_vector - update_vectors[:, i] @ update_vectors
+            )
+        scale = torch.sqrt(state.variances[i] + noise_var)
+        scaled_covariance_vector = covariance_vector / scale
+        scaled_target_covariance_vector = state.covariances[i] / scale
+
+        state.covariances.addr_(
+            scaled_covariance_vector, scaled_target_covariance_vector, alpha=-1
+        )  # Note: not treating as immutable!
+        state.variances[: state.n].sub_(torch.square(scaled_covariance_vector))
+        state.variances[state.n :].sub_(torch.square(scaled_target_covariance_vector))
+
+        update_vectors = state.update_vectors
+        if update_vectors.size(0) == t:  # capacity exhausted
+            update_vectors = torch.cat(
+                (update_vectors, torch.empty_like(update_vectors))
+            )
+        update_vectors[t] = scaled_covariance_vector  # Note: not treating as immutable!
+        observed_indices = torch.cat(
+            [
+                state.observed_indices,
+                torch.tensor([i]).to(state.observed_indices.device),
+            ]
+        )
+        return VTLState(
+            kernel=state.kernel,
+            n=state.n,
+            observed_indices=observed_indices,
+            variances=state.variances,
+            covariances=state.covariances,
+            update_vectors=update_vectors,
+        )
 
-        posterior_variances = compute_posterior_variance(target_indices, data_indices)
+    def _noise_var(self) -> float:
+        if self.noise_std is None:
+            return JITTER_ADJUSTMENT
+        return self.noise_std**2
+
+    def _compute(
+        self,
+        data_variances: torch.Tensor,
+        target_variances: torch.Tensor,
+        covariances: torch.Tensor,
+        noise_var: float,
+    ) -> torch.Tensor:
+        posterior_variances = target_variances.unsqueeze(0) - covariances**2 / (
+            data_variances.unsqueeze(1) + noise_var
+        )
         total_posterior_variances = torch.sum(posterior_variances, dim=1)
         wandb_log(
             {
@@ -1,4 +1,7 @@
 from __future__ import annotations
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+import copy
 from typing import Generic, Tuple
 import torch
 from activeft.acquisition_functions import M, AcquisitionFunction, Targeted
@@ -11,6 +14,7 @@ from activeft.utils import (
     DEFAULT_NUM_WORKERS,
     DEFAULT_SUBSAMPLE,
 )
+from activeft.embeddings.cache import EmbeddingCache
 
 
 class ActiveDataLoader(Generic[M]):
@@ -41,6 +45,20 @@ class ActiveDataLoader(Generic[M]):
     for target in targets:
         batch = dataset[data_loader.with_target(target).next(model)]
     ```
+
+    The next batch can be selected in the background while the model is trained on the current batch:
+
+    ```python
+    future = data_loader.prefetch(model)
+    for _ in range(num_rounds):
+        indices, _ = future.result()
+        future = data_loader.prefetch(model)  # selects the next batch using a snapshot of the current model
+        train(model, dataset[indices])
+    data_loader.close()
+    ```
+
+    The wall-clock time of each round is then roughly the maximum rather than the sum of the time spent on training and on data selection.
+    Within `asyncio` code, `await data_loader.next_async(model)` can be used instead.
     """
 
     dataset: Dataset
@@ -74,6 +92,8 @@ class ActiveDataLoader(Generic[M]):
         self.batch_size = batch_size
         self.acquisition_function = acquisition_function
         self.device = device
+        self._prefetch_executor: ThreadPoolExecutor | None = None
+        self._prefetched: Future[Tuple[torch.Tensor, torch.Tensor]] | None = None
 
     @classmethod
     def initialize(
@@ -86,6 +106,7 @@ class ActiveDataLoader(Generic[M]):
         max_target_size: int | None = None,
         mini_batch_size: int = DEFAULT_MINI_BATCH_SIZE,
         embedding_batch_size: int = DEFAULT_EMBEDDING_BATCH_SIZE,
+        embedding_cache: EmbeddingCache | None = None,
         num_workers: int = DEFAULT_NUM_WORKERS,
         subsample_acquisition: bool = DEFAULT_SUBSAMPLE,
         force_targeted: bool = False,
@@ -101,6 +122,7 @@ class ActiveDataLoader(Generic[M]):
         :param max_target_size: Maximum size of the target to be subsampled in each iteration. Default is `None` in which case the target may be arbitrarily large. Ignored if `target` is `None`.
         :param mini_batch_size: Size of mini batches used for computing the acquisition function.
         :param embedding_batch_size: Batch size used for computing the embeddings.
+        :param embedding_cache: Cache of the embeddings of the data set (see activeft.embeddings.cache.EmbeddingCache). Embeddings are not cached if `None`.
         :param num_workers: Number of workers used for data loading.
         :param subsample_acquisition: Whether to subsample the data to a single mini batch before computing the acquisition function.
         :param force_targeted: Whether to force targeted data selection. If `True`, `target` must be provided subsequently using `with_target`.
@@ -113,6 +135,7 @@ class ActiveDataLoader(Generic[M]):
                 max_target_size=max_target_size,
                 mini_batch_size=mini_batch_size,
                 embedding_batch_size=embedding_batch_size,
+                embedding_cache=embedding_cache,
                 num_workers=num_workers,
                 subsample=subsample_acquisition,
             )
@@ -120,6 +143,7 @@ class ActiveDataLoader(Generic[M]):
             acquisition_function = UndirectedVTL(
                 mini_batch_size=mini_batch_size,
                 embedding_batch_size=embedding_batch_size,
+                embedding_cache=embedding_cache,
                 num_workers=num_workers,
                 subsample=subsample_acquisition,
             )
@@ -149,9 +173,47 @@ class ActiveDataLoader(Generic[M]):
             device=self.device,
         )
 
+    def prefetch(
+        self, model: M | None = None, snapshot: bool = True
+    ) -> Future[Tuple[torch.Tensor, torch.Tensor]]:
+        r"""
+        Starts selecting the next batch of data in a background thread (analogously to `next`).
+        Batches are selected one after another, i.e., a batch is only selected once all previously prefetched batches have been selected.
+
+        .. warning::
+
+            The acquisition function (e.g., its target or embedding cache) must not be modified until the returned future is done.
+            `with_target` and `close` wait for prefetched batches automatically.
+
+        :param model: Model to be used for data selection. For embedding-based acquisition functions, `model` can be `None` in which case the data is treated as if it was already embedded.
+        :param snapshot: Whether to select the batch using a copy of `model`, so that `model` can be trained while the batch is selected. If `False`, `model` must not be modified until the returned future is done.
+        :return: Future of the indices of the selected data and corresponding value of the acquisition function in the format `(indices, values)`.
+        """
+
+        if snapshot and model is not None:
+            model = copy.deepcopy(model)
+        if self._prefetch_executor is None:
+            self._prefetch_executor = ThreadPoolExecutor(max_workers=1)
+        self._prefetched = self._prefetch_executor.submit(self.next, model)
+        return self._prefetched
+
+    async def next_async(
+        self, model: M | None = None, snapshot: bool = True
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        r"""
+        Awaitable version of `next` which selects the next batch of data in a background thread (see `prefetch`).
+
+        :param model: Model to be used for data selection. For embedding-based acquisition functions, `model` can be `None` in which case the data is treated as if it was already embedded.
+        :param snapshot: Whether to select the batch using a copy of `model`, so that `model` can be trained while the batch is selected.
+        :return: Indices of the selected data and corresponding value of the acquisition function in the format `(indices, values)`.
+        """
+
+        return await asyncio.wrap_future(self.prefetch(model, snapshot=snapshot))
+
     def with_target(self, target: torch.Tensor) -> ActiveDataLoader[M]:
         r"""
         Returns the active data loader with a new target.
+        Waits until all prefetched batches have been selected (with the previous target).
 
         :param target: Tensor of prediction targets (shape $m \times d$).
         :return: Updated active data loader.
@@ -160,5 +222,28 @@ class ActiveDataLoader(Generic[M]):
         assert isinstance(
             self.acquisition_function, Targeted
         ), "Acquisition function must be targeted"
+        self._wait_for_prefetched()
         self.acquisition_function.set_target(target)
         return self
+
+    def close(self):
+        r"""
+        Waits until all prefetched batches have been selected and releases the background thread used by `prefetch`.
+        The data loader can still be used afterwards.
+        """
+
+        if self._prefetch_executor is not None:
+            self._prefetch_executor.shutdown(wait=True)
+            self._prefetch_executor = None
+        self._prefetched = None
+
+    def __enter__(self) -> ActiveDataLoader[M]:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _wait_for_prefetched(self):
+        if self._prefetched is not None:
+            wait([self._prefetched])  # batches are selected in order of submission
+            self._prefetched = None
@@ -11,6 +11,26 @@ class Dataset(TorchDataset[torch.Tensor], Sized):
     """Dataset over data in "input" space."""
 
 
+class TensorDataset(Dataset):
+    r"""
+    Dataset over data in "input" space which is stored in a single tensor (of shape $n \times d$).
+
+    Acquisition functions select from a `TensorDataset` by slicing the tensor directly rather than by loading (and collating) individual data points.
+    """
+
+    data: torch.Tensor
+    r"""Tensor of inputs (shape $n \times d$)."""
+
+    def __init__(self, data: torch.Tensor):
+        self.data = data
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def __getitem__(self, index) -> torch.Tensor:
+        return self.data[index]
+
+
 DataLoader = TorchDataLoader[torch.Tensor]
 """Data loader over data in "input" space."""
 
@@ -0,0 +1,177 @@
+r"""
+Distributed data selection from a data set which is sharded across several processes (e.g., machines) using `torch.distributed`.
+
+```python
+torch.distributed.init_process_group("gloo")
+data_loader = DistributedActiveDataLoader(shard, batch_size=64, acquisition_function=VTL(target))
+ranks, indices, values = data_loader.next(model)
+batch = shard[indices[ranks == torch.distributed.get_rank()]]
+```
+
+where `shard` is the part of the data set which is stored by the current process.
+Each process first selects candidates from its own shard (see activeft.acquisition_functions.SequentialAcquisitionFunction).
+The embeddings of all candidates are then gathered on a single process which selects the batch among all candidates, and the selected batch is broadcast to all processes.
+"""
+
+from __future__ import annotations
+import copy
+from typing import Generic, Tuple
+import torch
+import torch.distributed as dist
+from activeft.acquisition_functions import (
+    M,
+    Targeted,
+    _gather,
+)
+from activeft.acquisition_functions.bace import BaCE
+from activeft.data import Dataset
+from activeft.model import ModelWithKernel, ModelWithLatentCovariance
+
+__all__ = ["DistributedActiveDataLoader"]
+
+
+class DistributedActiveDataLoader(Generic[M]):
+    r"""
+    Analogue of activeft.ActiveDataLoader for data sets which are sharded across the processes of a `torch.distributed` process group.
+    `next` has to be called by all processes of the group.
+
+    If the model is a activeft.model.ModelWithKernel, the inputs of the candidates are gathered rather than their embeddings.
+    """
+
+    dataset: Dataset
+    r"""Shard of the inputs (shape $n \times d$) to be selected from which is stored by the current process."""
+
+    batch_size: int
+    r"""Size of the batch to be selected."""
+
+    acquisition_function: BaCE
+    r"""Acquisition function to be used for data selection."""
+
+    device: torch.device | None = None
+    r"""Device used for computation of the acquisition function."""
+
+    group: dist.ProcessGroup | None = None
+    r"""Process group across which the data set is sharded. The default process group is used if `None`."""
+
+    src: int = 0
+    r"""Rank of the process selecting the batch among all candidates."""
+
+    def __init__(
+        self,
+        dataset: Dataset,
+        batch_size: int,
+        acquisition_function: BaCE,
+        device: torch.device | None = None,
+        group: dist.ProcessGroup | None = None,
+        src: int = 0,
+    ):
+        """
+        :param dataset: Shard of the inputs to be selected from which is stored by the current process.
+        :param batch_size: Size of the batch to be selected.
+        :param acquisition_function: Acquisition function to be used for data selection.
+        :param device: Device used for computation of the acquisition function.
+        :param group: Process group across which the data set is sharded (e.g., using the `gloo` backend). The default process group is used if `None`.
+        :param src: Rank of the process selecting the batch among all candidates.
+        """
+
+        assert len(dataset) > 0, "Data must be non-empty"
+        assert batch_size > 0, "Batch size must be positive"
+
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.acquisition_function = acquisition_function
+        self.device = device
+        self.group = group
+        self.src = src
+
+    def next(
+        self, model: M | None = None
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        r"""
+        Selects the next batch of data provided a `model` which is a PyTorch `nn.Module`.
+
+        :param model: Model to be used for data selection. `model` can be `None` in which case the data is treated as if it was already embedded.
+        :return: Ranks of the processes storing the selected data, indices of the selected data within the respective shards, and corresponding values of the acquisition function in the format `(ranks, indices, values)`. The same batch is returned on all processes.
+        """
+
+        local_indices, _ = self.acquisition_function.select(
+            batch_size=min(self.batch_size, len(self.dataset)),
+            model=model,  # type: ignore
+            dataset=self.dataset,
+            device=self.device,
+        )
+        local_indices = torch.unique(local_indices)
+        data = _gather(self.dataset, local_indices)
+        if isinstance(model, ModelWithKernel):
+            candidates = data
+        else:
+            candidates = self.acquisition_function.compute_data_embedding(
+                model=model, data=data, indices=local_indices  # type: ignore
+            )  # reuses cached embeddings
+
+        rank = dist.get_rank(self.group)
+        src = (
+            dist.get_global_rank(self.group, self.src)
+            if self.group is not None
+            else self.src
+        )
+        gathered: list | None = (
+            [None] * dist.get_world_size(self.group) if rank == self.src else None
+        )
+        dist.gather_object(
+            (candidates.cpu(), local_indices.cpu()),
+            gathered,
+            dst=src,
+            group=self.group,
+        )
+
+        result = [None]
+        if rank == self.src:
+            assert gathered is not None
+            result[0] = self._select_globally(model, gathered)  # type: ignore
+        dist.broadcast_object_list(
+            result,
+            src=src,
+            group=self.group,
+        )
+        ranks, indices, values = result[0]  # type: ignore
+        return ranks, indices, values
+
+    def _select_globally(
+        self,
+        model: M | None,
+        gathered: list[Tuple[torch.Tensor, torch.Tensor]],
+    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+        candidates = torch.cat([c for c, _ in gathered])
+        ranks = torch.cat(
+            [
+                torch.full((idx.size(0),), r, dtype=torch.long)
+                for r, (_, idx) in enumerate(gathered)
+            ]
+        )
+        local_indices = torch.cat([idx for _, idx in gathered])
+
+        acquisition_function = copy.copy(self.acquisition_function)
+        if isinstance(model, ModelWithKernel):
+            global_model = model
+        else:  # candidates are already embedded
+            global_model = None
+            if isinstance(model, ModelWithLatentCovariance):
+                L = torch.linalg.cholesky(model.latent_covariance().cpu())
+                candidates = candidates @ L  # \Phi \Sigma \Phi^T = (\Phi L) (\Phi L)^T
+            else:
+                L = None
+            if isinstance(acquisition_function, Targeted) and model is not None:
+                target_embeddings = acquisition_function.compute_embedding(
+                    model=model,  # type: ignore
+                    data=acquisition_function._target,
+                    batch_size=acquisition_function.embedding_batch_size,
+                ).cpu()
+                acquisition_function.set_target(
+                    target_embeddings @ L if L is not None else target_embeddings
+                )
+
+        sub_idx, values = acquisition_function.select_from_minibatch(
+            self.batch_size, global_model, candidates, self.device  # type: ignore
+        )
+        return ranks[sub_idx], local_indices[sub_idx], values.cpu()
@@ -4,6 +4,8 @@ This module contains implementations for a selection of embeddings:
 - activeft.embeddings.empirical_ntk provides implementations for embeddings associated with the empirical NTK kernel.
 - activeft.embeddings.classification provides embeddings for classification models.
 
+Embeddings of a data set can be cached across batch selections using activeft.embeddings.cache.EmbeddingCache.
+
 The respective implementations can be subclassed to implement activeft.model.ModelWithEmbedding.
 For more details regarding embeddings, see activeft.model.ModelWithEmbedding.
 """
@@ -0,0 +1,168 @@
+from __future__ import annotations
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from typing import Callable
+import numpy as np
+import torch
+
+__all__ = ["EmbeddingCache"]
+
+
+class EmbeddingCache:
+    r"""
+    Cache of the embeddings of a data set which can be passed to any acquisition function that is based on embeddings (see activeft.acquisition_functions.EmbeddingBased).
+
+    ```python
+    embedding_cache = EmbeddingCache(size=len(dataset))
+    acquisition_function = VTL(target, embedding_cache=embedding_cache)
+    data_loader = ActiveDataLoader(dataset, batch_size=64, acquisition_function=acquisition_function)
+    for _ in range(num_rounds):
+        batch = dataset[data_loader.next(model)]
+        train(model, batch)
+        embedding_cache.bump_version()  # the model has changed
+    ```
+
+    Embeddings are keyed by their index within the data set and by the version of the model.
+    As long as the version is not bumped, the embedding of each data point is computed at most once.
+    The embeddings are stored in a memory-mapped file, so that the cache may be larger than the available memory.
+    Only the location of the file is pickled, so that a cache which is sent to other processes (e.g., the workers of a `concurrent.futures.ProcessPoolExecutor`) reads and writes the same embeddings.
+    If `path` refers to an existing cache of the same size and data type, its embeddings (and its version) are kept, so that the cache persists across runs:
+
+    ```python
+    embedding_cache = EmbeddingCache(size=len(dataset), path="embeddings.bin")
+    ```
+
+    .. warning::
+
+        The cache does not detect changes of the model. `bump_version` needs to be called whenever the embeddings change (e.g., after training the model).
+    """
+
+    size: int
+    """Number of data points in the data set."""
+
+    def __init__(
+        self,
+        size: int,
+        path: str | None = None,
+        dtype: np.typing.DTypeLike = np.float32,
+    ):
+        """
+        :param size: Number of data points in the data set.
+        :param path: Path of the file in which embeddings are stored. The versions of the embeddings are stored alongside in `path + ".versions"`. An existing cache at `path` is reopened if it has the same size and data type, and is overwritten otherwise. A temporary directory (which is removed once the cache is garbage collected) is used if `None`.
+        :param dtype: Data type of stored embeddings.
+        """
+        if path is None:
+            directory = tempfile.mkdtemp()
+            weakref.finalize(self, shutil.rmtree, directory, ignore_errors=True)
+            path = os.path.join(directory, "embeddings")
+        self.size = size
+        self._path = path
+        self._dtype = np.dtype(dtype)
+        self._embeddings: np.memmap | None = None
+        self._lock = threading.Lock()
+        if self._exists():
+            self._versions = self._open_versions(mode="r+")
+            return
+
+        open(path, "wb").close()  # embeddings are written once their dimension is known
+        self._versions = self._open_versions(mode="w+")
+        self._versions[:size] = -1
+        self._versions[size] = 0  # version of the model
+
+    @property
+    def version(self) -> int:
+        """Version of the model. Only embeddings computed with the current version are valid."""
+        return int(self._versions[self.size])
+
+    def __getstate__(self):
+        return {"size": self.size, "_path": self._path, "_dtype": self._dtype}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._embeddings = None  # opened once it is accessed
+        self._versions = self._open_versions(mode="r+")
+        self._lock = threading.Lock()
+
+    def bump_version(self):
+        """Invalidates all cached embeddings. Should be called whenever the model changes."""
+        with self._lock:
+            self._versions[self.size] += 1
+
+    def is_cached(self, indices: torch.Tensor) -> torch.Tensor:
+        """
+        :param indices: Indices of data points within the data set.
+        :return: Mask of the data points whose embeddings are cached for the current version.
+        """
+        return torch.from_numpy(self._versions[indices.cpu().numpy()] == self.version)
+
+    def get(
+        self,
+        indices: torch.Tensor,
+        data: torch.Tensor,
+        embed: Callable[[torch.Tensor], torch.Tensor],
+    ) -> torch.Tensor:
+        r"""
+        Returns the embeddings of the given data, computing (and caching) only the embeddings which are not yet cached.
+
+        :param indices: Indices of data points within the data set.
+        :param data: Tensor of inputs (shape $n \times d$) at `indices`.
+        :param embed: Function computing the embeddings of a tensor of inputs.
+        :return: Embeddings of the given data. Always returned on the CPU with the default floating point data type of torch (irrespective of whether they were cached).
+        """
+        missing = ~self.is_cached(indices)
+        if bool(torch.all(missing)):
+            return self._store(indices, embed(data))
+        if bool(torch.any(missing)):
+            self._store(indices[missing], embed(data[missing.to(data.device)]))
+
+        embeddings = self._open()
+        assert embeddings is not None
+        return torch.from_numpy(embeddings[indices.cpu().numpy()]).to(
+            torch.get_default_dtype()
+        )
+
+    def _store(self, indices: torch.Tensor, embeddings: torch.Tensor) -> torch.Tensor:
+        _embeddings = embeddings.detach().cpu().numpy().astype(self._dtype, copy=False)
+        _indices = indices.cpu().numpy()
+        with self._lock:  # mini batches may be processed concurrently
+            cache = self._open(dim=_embeddings.shape[1])
+            assert cache is not None
+            cache[_indices] = _embeddings
+            self._versions[_indices] = self.version
+        return torch.from_numpy(_embeddings).to(torch.get_default_dtype())
+
+    def _exists(self) -> bool:
+        """Whether a cache of the same size and data type is stored at `path`."""
+        versions_path = f"{self._path}.versions"
+        return (
+            self.size > 0
+            and os.path.isfile(self._path)
+            and os.path.isfile(versions_path)
+            and os.path.getsize(versions_path)
+            == (self.size + 1) * np.dtype(np.int64).itemsize
+            and os.path.getsize(self._path) % (self.size * self._dtype.itemsize) == 0
+        )
+
+    def _open_versions(self, mode: str) -> np.memmap:
+        """Opens the file of versions, which holds the version of each embedding followed by the version of the model."""
+        return np.memmap(
+            f"{self._path}.versions",
+            dtype=np.int64,
+            mode=mode,  # type: ignore
+            shape=(self.size + 1,),
+        )
+
+    def _open(self, dim: int | None = None) -> np.memmap | None:
+        """Opens the file of embeddings, which is extended (without overwriting embeddings written by other processes) if the dimension `dim` of embeddings is given."""
+        if self._embeddings is None:
+            if dim is None:  # the file was extended by another process
+                dim = os.path.getsize(self._path) // (self._dtype.itemsize * self.size)
+                if dim == 0:
+                    return None
+            self._embeddings = np.memmap(
+                self._path, dtype=self._dtype, mode="r+", shape=(self.size, dim)
+            )
+        return self._embeddings
@@ -1,15 +1,30 @@
 from __future__ import annotations
-from typing import List
+from typing import Callable, List, Tuple
 import torch
+from activeft.model import (
+    ModelWithEmbeddingOrKernel,
+    ModelWithKernel,
+    ModelWithLatentCovariance,
+)
+from activeft.utils import DEFAULT_EMBEDDING_BATCH_SIZE, get_device, mini_batch_wrapper
 
 JITTER_ADJUSTMENT = 0.01
 
+INITIAL_CAPACITY = 64
+"""Initial capacity of the preallocated index tensors, which grow by doubling."""
+
 
 class GaussianCovarianceMatrix:
     _matrix: torch.Tensor
+    _buffer: torch.Tensor
 
-    def __init__(self, matrix: torch.Tensor):
+    def __init__(self, matrix: torch.Tensor, buffer: torch.Tensor | None = None):
+        """
+        :param matrix: Covariance matrix.
+        :param buffer: Preallocated (square) buffer whose upper-left block is `matrix`. Used to expand the matrix in-place. Defaults to `matrix` itself.
+        """
         self._matrix = matrix
+        self._buffer = buffer if buffer is not None else matrix
 
     @staticmethod
     def from_embeddings(Embeddings: torch.Tensor, Sigma: torch.Tensor | None = None):
@@ -25,23 +40,60 @@ class GaussianCovarianceMatrix:
     def dim(self) -> int:
         return self._matrix.size(0)
 
+    def diag(self, indices: torch.Tensor | None = None) -> torch.Tensor:
+        """
+        Returns (a copy of) the diagonal of the covariance matrix, i.e., the variances.
+
+        :param indices: Indices at which to return the variances. All indices if `None`.
+        """
+        if indices is None:
+            return torch.diag(self._matrix)
+        return self._matrix[indices, indices]
+
     @property
     def device(self) -> torch.device | None:
         return self._matrix.device
 
+    def sum_of_squared_covariances(
+        self, indices: torch.Tensor | slice, n: int | None = None
+    ) -> torch.Tensor:
+        r"""
+        Returns the sums of squared covariances $\sum_{j < n} \Sigma_{ji}^2$ of the columns $i$ given by `indices`.
+
+        :param indices: Indices of the columns.
+        :param n: Number of leading rows over which to sum. All rows if `None`.
+        """
+        return torch.sum(self._matrix[:n, indices] ** 2, dim=0)
+
     def expand(self, u: torch.Tensor) -> GaussianCovarianceMatrix:
         """
         Adds covariance vector $u$ to the covariance matrix (as final row and final column).
+
+        The matrix is stored in a preallocated buffer (on the same device and with the same dtype) whose capacity is doubled whenever it is exhausted.
+        Hence, expansion has amortized cost $O(n)$.
+        The expanded matrix is a view of the active block of the buffer, which it shares with this matrix.
+
+        .. warning::
+
+            Expanding the same matrix multiple times overwrites the final row and column of previously expanded matrices.
         """
         n = self.dim
-        new_matrix = torch.zeros((n + 1, n + 1))
-        new_matrix[:n, :n] = self._matrix
+        if self._buffer.size(0) <= n:  # capacity exhausted
+            self._buffer = torch.empty(
+                (max(2 * n, 1), max(2 * n, 1)),
+                dtype=self._matrix.dtype,
+                device=self._matrix.device,
+            )
+            self._buffer[:n, :n] = self._matrix
+            self._matrix = self._buffer[:n, :n]
 
-        new_matrix[n, :n] = u[:-1]
-        new_matrix[:n, n] = u[:-1]
-        new_matrix[n, n] = u[-1]
+        self._buffer[n, :n] = u[:-1]
+        self._buffer[:n, n] = u[:-1]
+        self._buffer[n, n] = u[-1]
 
-        return GaussianCovarianceMatrix(new_matrix)
+        return GaussianCovarianceMatrix(
+            self._buffer[: n + 1, : n + 1], buffer=self._buffer
+        )
 
     def condition_on(
         self,
@@ -69,23 +121,427 @@ class GaussianCovarianceMatrix:
         else:
             noise_var = noise_std**2
 
-        Sigma_AA = self._matrix[target_indices][:, target_indices]
-        Sigma_ii = self._matrix[_indices][:, _indices]
-        Sigma_Ai = self._matrix[target_indices][:, _indices]
-        posterior_Sigma_AA = (
-            Sigma_AA
-            - Sigma_Ai
-            @ torch.inverse(
-                Sigma_ii + noise_var * torch.eye(Sigma_ii.size(0)).to(Sigma_AA.device)
-            )
-            @ Sigma_Ai.T
+        posterior_Sigma_AA = conditional_covariance(
+            Sigma=self._matrix,
+            indices=_indices,
+            target_indices=target_indices,
+            noise_var=noise_var,
         )
         return GaussianCovarianceMatrix(posterior_Sigma_AA)
 
+    def condition_on_(
+        self, index: int, noise_std: float | None = None
+    ) -> GaussianCovarianceMatrix:
+        r"""
+        Conditions the covariance matrix on a (noisy) observation of a single index in-place.
+        This is a rank-1 update $\mSigma \gets \mSigma - \mSigma_{:,i} \mSigma_{i,:} / (\Sigma_{ii} + \sigma^2)$ which does not allocate a new matrix.
+
+        :param index: Index on which to condition.
+        :param noise_std: Standard deviation of observation noise. Determined automatically if `None`.
+
+        :return: The conditioned covariance matrix (i.e., `self`).
+        """
+        if noise_std is None:
+            noise_var = get_jitter(
+                covariance_matrix=self, indices=torch.tensor([index])
+            )
+        else:
+            noise_var = noise_std**2
+
+        covariance_vector = self._matrix[index].clone()
+        scaled_covariance_vector = covariance_vector / torch.sqrt(
+            covariance_vector[index] + noise_var
+        )
+        self._matrix.addr_(scaled_covariance_vector, scaled_covariance_vector, alpha=-1)
+        return self
+
+
+class FeatureSpaceCovarianceMatrix:
+    r"""
+    Covariance matrix $\mPhi \mSigma \mPhi^\top$ which is represented in feature space by the $n \times d$ embeddings $\mPhi$ and the $d \times d$ latent covariance matrix $\mSigma$.
+
+    As opposed to `GaussianCovarianceMatrix`, the $n \times n$ matrix is never materialized.
+    Memory therefore grows as $O(nd + d^2)$ rather than $O(n^2)$, which is preferable if $d < n$.
+    Conditioning on an observation updates the posterior precision $\mSigma^{-1}$ of the latent space, which amounts to a rank-1 (Sherman-Morrison) update of $\mSigma$.
+    The variances are cached and updated alongside $\mSigma$.
+    """
+
+    _embeddings: torch.Tensor
+    _Sigma: torch.Tensor
+    _variances: torch.Tensor
+    _gram: Tuple[int, torch.Tensor] | None
+
+    def __init__(
+        self,
+        embeddings: torch.Tensor,
+        Sigma: torch.Tensor,
+        variances: torch.Tensor | None = None,
+    ):
+        self._embeddings = embeddings
+        self._Sigma = Sigma
+        self._variances = (
+            variances
+            if variances is not None
+            else torch.sum((embeddings @ Sigma) * embeddings, dim=1)
+        )
+        self._gram = None
+
+    @staticmethod
+    def from_embeddings(Embeddings: torch.Tensor, Sigma: torch.Tensor | None = None):
+        if Sigma is None:
+            Sigma = torch.eye(
+                Embeddings.size(1), dtype=Embeddings.dtype, device=Embeddings.device
+            )
+        return FeatureSpaceCovarianceMatrix(Embeddings, Sigma.clone())
+
+    def __getitem__(self, indices):
+        i, j = indices
+        rows = self._embeddings[i]
+        cols = self._embeddings[j]
+        if _is_advanced_index(i) and _is_advanced_index(j):
+            return torch.sum((rows @ self._Sigma) * cols, dim=-1)
+        if cols.dim() == 1:
+            return rows @ (self._Sigma @ cols)
+        if rows.dim() == 1 or rows.size(0) >= cols.size(0):
+            return rows @ (self._Sigma @ cols.T)
+        return (rows @ self._Sigma) @ cols.T
+
+    @property
+    def dim(self) -> int:
+        return self._embeddings.size(0)
+
+    @property
+    def device(self) -> torch.device | None:
+        return self._embeddings.device
+
+    def sum_of_squared_covariances(
+        self, indices: torch.Tensor | slice, n: int | None = None
+    ) -> torch.Tensor:
+        r"""
+        Returns the sums of squared covariances $\sum_{j < n} \Sigma_{ji}^2$ of the columns $i$ given by `indices`.
+
+        The sums are computed in feature space as $\vphi_i^\top \mSigma \mPhi_{:n}^\top \mPhi_{:n} \mSigma \vphi_i$, so that no $n \times n$ block of the covariance matrix is materialized.
+        The $d \times d$ Gram matrix $\mPhi_{:n}^\top \mPhi_{:n}$ is cached since the embeddings do not change when conditioning in-place.
+
+        :param indices: Indices of the columns.
+        :param n: Number of leading rows over which to sum. All rows if `None`.
+        """
+        if n is None:
+            n = self.dim
+        if self._gram is None or self._gram[0] != n:
+            self._gram = (n, self._embeddings[:n].T @ self._embeddings[:n])
+        A = self._Sigma @ self._gram[1] @ self._Sigma
+        embeddings = self._embeddings[indices]
+        return torch.sum((embeddings @ A) * embeddings, dim=-1)
+
+    def diag(self, indices: torch.Tensor | None = None) -> torch.Tensor:
+        """
+        Returns (a copy of) the diagonal of the covariance matrix, i.e., the variances.
+
+        :param indices: Indices at which to return the variances. All indices if `None`.
+        """
+        if indices is None:
+            return self._variances.clone()
+        return self._variances[indices]
+
+    def condition_on(
+        self,
+        indices: torch.Tensor | List[int] | int,
+        target_indices: torch.Tensor | None = None,
+        noise_std: float | None = None,
+    ):
+        """
+        Computes the conditional covariance matrix.
+
+        :param indices: Indices on which to condition.
+        :param target_indices: Indices on which to compute conditional covariance. All indices if `None`.
+        :param noise_std: Standard deviation of observation noise. Determined automatically if `None`.
+
+        :return: Conditional covariance of target_indices upon observing indices
+        """
+        _indices: torch.Tensor = torch.tensor(indices) if not torch.is_tensor(indices) else indices  # type: ignore
+        if _indices.dim() == 0:
+            _indices = _indices.unsqueeze(0)
+        if target_indices is None:
+            target_indices = torch.arange(self.dim)
+
+        if noise_std is None:
+            noise_var = get_jitter(covariance_matrix=self, indices=_indices)
+        else:
+            noise_var = noise_std**2
+
+        _target_indices = _as_slice(target_indices)
+        Sigma_Phi_i = self._Sigma @ self._embeddings[_as_slice(_indices)].T
+        Sigma_ii = self._embeddings[_as_slice(_indices)] @ Sigma_Phi_i
+        L = torch.linalg.cholesky(
+            Sigma_ii + noise_var * torch.eye(Sigma_ii.size(0)).to(Sigma_ii.device)
+        )
+        posterior_Sigma = self._Sigma - Sigma_Phi_i @ torch.cholesky_solve(
+            Sigma_Phi_i.T, L
+        )
+
+        embeddings_A = self._embeddings[_target_indices]
+        Sigma_Ai = embeddings_A @ Sigma_Phi_i
+        posterior_variances = self._variances[_target_indices] - torch.sum(
+            torch.cholesky_solve(Sigma_Ai.T, L).T * Sigma_Ai, dim=1
+        )
+        return FeatureSpaceCovarianceMatrix(
+            embeddings_A, posterior_Sigma, posterior_variances
+        )
+
+    def condition_on_(
+        self, index: int, noise_std: float | None = None
+    ) -> FeatureSpaceCovarianceMatrix:
+        r"""
+        Conditions the covariance matrix on a (noisy) observation of a single index in-place.
+        This is a rank-1 update of the latent covariance matrix $\mSigma$ and of the cached variances.
+
+        :param index: Index on which to condition.
+        :param noise_std: Standard deviation of observation noise. Determined automatically if `None`.
+
+        :return: The conditioned covariance matrix (i.e., `self`).
+        """
+        if noise_std is None:
+            noise_var = get_jitter(
+                covariance_matrix=self, indices=torch.tensor([index])
+            )
+        else:
+            noise_var = noise_std**2
+
+        Sigma_phi = self._Sigma @ self._embeddings[index]
+        scale = torch.sqrt(self._variances[index] + noise_var)
+        scaled_Sigma_phi = Sigma_phi / scale
+        scaled_covariance_vector = (self._embeddings @ Sigma_phi) / scale
+        self._Sigma.addr_(scaled_Sigma_phi, scaled_Sigma_phi, alpha=-1)
+        self._variances.sub_(torch.square(scaled_covariance_vector))
+        return self
+
+
+CovarianceMatrix = GaussianCovarianceMatrix | FeatureSpaceCovarianceMatrix
+"""Covariance matrix which is either represented densely or in feature space."""
+
+
+class LazyKernel:
+    r"""
+    Kernel over the data and the prediction targets which is evaluated on demand.
+
+    - If the model is a activeft.model.ModelWithKernel, kernel entries are computed by the model only for the requested data points.
+    - Otherwise, data points are embedded once they are first requested, and their embeddings are cached. If `model` is `None`, the data is treated as if it was already embedded.
+
+    Hence, data points that are never requested are never passed through the model.
+    """
+
+    def __init__(
+        self,
+        model: ModelWithEmbeddingOrKernel | None,
+        data: torch.Tensor,
+        target: torch.Tensor,
+        embed_data: Callable[[torch.Tensor, torch.Tensor], torch.Tensor],
+        embed_target: Callable[[torch.Tensor], torch.Tensor],
+        device: torch.device | None = None,
+    ):
+        r"""
+        :param model: Model used for computing the kernel.
+        :param data: Tensor of inputs (shape $n \times d$).
+        :param target: Tensor of prediction targets (shape $m \times d$).
+        :param embed_data: Function computing the embeddings of the given inputs (second argument) at the given indices (first argument) of `data`. Not used if `model` is a activeft.model.ModelWithKernel.
+        :param embed_target: Function computing the embeddings of the prediction targets. Not used if `model` is a activeft.model.ModelWithKernel.
+        :param device: Device on which kernel entries are returned.
+        """
+        self.model = model
+        self.data = data
+        self.target = target
+        self.device = device
+        self._kernel_model = model if isinstance(model, ModelWithKernel) else None
+        if self._kernel_model is not None:
+            return
+
+        self._embed_data = embed_data
+        self._Sigma = (
+            model.latent_covariance().to(device)
+            if isinstance(model, ModelWithLatentCovariance)
+            else None
+        )
+        if model is None:  # data is already embedded
+            self._embeddings = data.to(device)
+            self._is_embedded = torch.ones(data.size(0), dtype=torch.bool)
+            self._target_embeddings = target.to(device)
+        else:
+            self._embeddings = None
+            self._is_embedded = torch.zeros(data.size(0), dtype=torch.bool)
+            self._target_embeddings = embed_target(target).to(device)
+
+    def embeddings(self, indices: torch.Tensor) -> torch.Tensor:
+        """
+        Returns the embeddings of the data points at `indices`, embedding the data points which were not embedded before.
+        """
+        if self.model is None:  # data is already embedded
+            assert self._embeddings is not None
+            return self._embeddings[indices.to(self._embeddings.device)]
+
+        indices = indices.cpu()
+        missing = indices[~self._is_embedded[indices]].unique()
+        if missing.size(0) > 0:
+            embeddings = self._embed_data(
+                missing, self.data[missing.to(self.data.device)]
+            ).to(self.device)
+            if self._embeddings is None:
+                self._embeddings = torch.empty(
+                    (self.data.size(0), embeddings.size(1)),
+                    dtype=embeddings.dtype,
+                    device=embeddings.device,
+                )
+            self._embeddings[missing.to(embeddings.device)] = embeddings
+            self._is_embedded[missing] = True
+        assert self._embeddings is not None
+        return self._embeddings[indices.to(self._embeddings.device)]
+
+    def __call__(self, x: torch.Tensor, y: torch.Tensor) -> torch.Tensor:
+        """
+        :return: Kernel matrix between the data points at indices `x` and `y`.
+        """
+        if self._kernel_model is not None:
+            return self._kernel(
+                self.data[x.to(self.data.device)], self.data[y.to(self.data.device)]
+            )
+        return self._inner_products(self.embeddings(x), self.embeddings(y))
+
+    def data_column(self, y: torch.Tensor) -> torch.Tensor:
+        """
+        :return: Kernel matrix between all data points and the data points at indices `y`. Embeds all data points.
+        """
+        if self._kernel_model is not None:
+            return self._kernel(self.data, self.data[y.to(self.data.device)])
+        if not bool(torch.all(self._is_embedded)):
+            self.embeddings(torch.arange(self.data.size(0)))
+        assert self._embeddings is not None
+        embeddings = self.embeddings(y)
+        if self._Sigma is None:
+            return self._embeddings @ embeddings.T
+        return self._embeddings @ (self._Sigma @ embeddings.T)
+
+    def target_data(self, y: torch.Tensor) -> torch.Tensor:
+        """
+        :return: Kernel matrix between the prediction targets and the data points at indices `y`.
+        """
+        if self._kernel_model is not None:
+            return self._kernel(self.target, self.data[y.to(self.data.device)])
+        return self._inner_products(self._target_embeddings, self.embeddings(y))
+
+    def target_target(self) -> torch.Tensor:
+        """
+        :return: Kernel matrix of the prediction targets.
+        """
+        if self._kernel_model is not None:
+            return self._kernel(self.target, self.target)
+        return self._inner_products(self._target_embeddings, self._target_embeddings)
+
+    def diag(self, x: torch.Tensor) -> torch.Tensor:
+        """
+        :return: Variances of the data points at indices `x`.
+        """
+        if self._kernel_model is not None:
+            return mini_batch_wrapper(
+                fn=lambda batch: torch.diagonal(self._kernel(batch, batch)),
+                data=self.data[x.to(self.data.device)],
+                batch_size=DEFAULT_EMBEDDING_BATCH_SIZE,
+            )
+        embeddings = self.embeddings(x)
+        if self._Sigma is None:
+            return torch.sum(embeddings * embeddings, dim=1)
+        return torch.sum((embeddings @ self._Sigma) * embeddings, dim=1)
+
+    def _kernel(self, x1: torch.Tensor, x2: torch.Tensor) -> torch.Tensor:
+        assert self._kernel_model is not None
+        model_device = get_device(self._kernel_model)
+        return self._kernel_model.kernel(x1.to(model_device), x2.to(model_device)).to(
+            self.device
+        )
+
+    def _inner_products(self, x: torch.Tensor, y: torch.Tensor) -> torch.Tensor:
+        if self._Sigma is None:
+            return x @ y.T
+        return x @ self._Sigma @ y.T
+
+
+def covariance_matrix_from_embeddings(
+    Embeddings: torch.Tensor, Sigma: torch.Tensor | None = None
+) -> CovarianceMatrix:
+    r"""
+    Constructs the covariance matrix $\mPhi \mSigma \mPhi^\top$ of the given embeddings.
+    The covariance matrix is represented in feature space if the embedding dimension $d$ is smaller than the number of embeddings $n$, and densely otherwise.
+    """
+    if Embeddings.size(1) < Embeddings.size(0):
+        return FeatureSpaceCovarianceMatrix.from_embeddings(Embeddings, Sigma)
+    return GaussianCovarianceMatrix.from_embeddings(Embeddings, Sigma)
+
+
+def conditional_covariance(
+    Sigma: torch.Tensor,
+    indices: torch.Tensor,
+    target_indices: torch.Tensor,
+    noise_var: float | torch.Tensor,
+) -> torch.Tensor:
+    r"""
+    Computes the conditional covariance matrix of `target_indices` upon (noisy) observations of `indices`: \\[
+        \mSigma_{AA} - \mSigma_{Ai} (\mSigma_{ii} + \sigma^2 \mI)^{-1} \mSigma_{iA}.
+    \\]
+    The linear system is solved using a Cholesky decomposition, and blocks are gathered without intermediate copies (contiguous ranges of indices are not copied at all).
+
+    Multiple independent covariance matrices can be conditioned at once by passing a batch of matrices of shape $b \times n \times n$.
+    In this case, `indices` and `target_indices` either apply to all matrices of the batch, or have shapes $b \times k$ and $b \times m$, respectively, to condition each matrix on different indices.
+
+    :param Sigma: Covariance matrix of shape $n \times n$ or batch of covariance matrices of shape $b \times n \times n$.
+    :param indices: Indices on which to condition.
+    :param target_indices: Indices on which to compute conditional covariance.
+    :param noise_var: Variance of observation noise. For batches, can be a tensor of shape $b$.
+
+    :return: Conditional covariance of target_indices upon observing indices (of shape $m \times m$ or $b \times m \times m$).
+    """
+    Sigma_AA = _gather_block(Sigma, target_indices, target_indices)
+    Sigma_iA = _gather_block(Sigma, indices, target_indices)
+    Sigma_ii = _gather_block(Sigma, indices, indices)
+
+    _noise_var = torch.as_tensor(noise_var, dtype=Sigma.dtype, device=Sigma.device)
+    if _noise_var.dim() > 0:
+        _noise_var = _noise_var.view(-1, 1, 1)
+    I = torch.eye(Sigma_ii.size(-1), dtype=Sigma.dtype, device=Sigma.device)
+    L = torch.linalg.cholesky(Sigma_ii + _noise_var * I)
+    return Sigma_AA - Sigma_iA.mT @ torch.cholesky_solve(Sigma_iA, L)
+
+
+def _gather_block(
+    Sigma: torch.Tensor, rows: torch.Tensor, cols: torch.Tensor
+) -> torch.Tensor:
+    """Gathers the block `rows` x `cols` of the (batch of) matrices `Sigma` in a single indexing operation."""
+    if rows.dim() > 1 or cols.dim() > 1:  # batch-specific indices
+        b = Sigma.size(0)
+        batch = torch.arange(b, device=Sigma.device).view(-1, 1, 1)
+        _rows = rows.expand(b, -1) if rows.dim() == 1 else rows
+        _cols = cols.expand(b, -1) if cols.dim() == 1 else cols
+        return Sigma[batch, _rows.unsqueeze(-1), _cols.unsqueeze(-2)]
+
+    _rows, _cols = _as_slice(rows), _as_slice(cols)
+    if isinstance(_rows, torch.Tensor) and isinstance(_cols, torch.Tensor):
+        return Sigma[..., _rows.unsqueeze(-1), _cols]
+    return Sigma[..., _rows, _cols]
+
+
+def _as_slice(indices: torch.Tensor) -> torch.Tensor | slice:
+    """Returns a slice if `indices` is a contiguous range, so that indexing returns a view rather than a copy."""
+    if indices.dim() != 1 or indices.size(0) == 0:
+        return indices
+    start, stop = int(indices[0]), int(indices[-1]) + 1
+    if stop - start == indices.size(0) and bool(torch.all(indices[1:] > indices[:-1])):
+        return slice(start, stop)
+    return indices
+
+
+def _is_advanced_index(index) -> bool:
+    return isinstance(index, list) or (torch.is_tensor(index) and index.dim() > 0)
+
 
-def get_jitter(
-    covariance_matrix: GaussianCovarianceMatrix, indices: torch.Tensor
-) -> float:
+def get_jitter(covariance_matrix: CovarianceMatrix, indices: torch.Tensor) -> float:
     if indices.dim() < 2:
         return JITTER_ADJUSTMENT
 
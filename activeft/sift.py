@@ -1,26 +1,31 @@
+from __future__ import annotations
+import copy
+import math
+import multiprocessing
+import pickle
+from multiprocessing.shared_memory import SharedMemory
 from typing import NamedTuple, Tuple
 from warnings import warn
-from activeft.acquisition_functions import AcquisitionFunction, Targeted
+from activeft.acquisition_functions import (
+    AcquisitionFunction,
+    EmbeddingBased,
+    SequentialAcquisitionFunction,
+    Targeted,
+)
 from activeft.acquisition_functions.lazy_vtl import LazyVTL
 from activeft.acquisition_functions.vtl import VTL
 import faiss
 import torch
 import time
+import weakref
 import concurrent.futures
 import numpy as np
 from activeft import ActiveDataLoader
-from activeft.data import Dataset as AbstractDataset
+from activeft.data import TensorDataset
 
 
-class Dataset(AbstractDataset):
-    def __init__(self, data: torch.Tensor):
-        self.data = data
-
-    def __len__(self) -> int:
-        return len(self.data)
-
-    def __getitem__(self, index) -> torch.Tensor:
-        return self.data[index]
+class Dataset(TensorDataset):
+    """Dataset of (pre-computed) embeddings, see activeft.data.TensorDataset."""
 
 
 class RetrievalTime(NamedTuple):
@@ -44,10 +49,24 @@ class Retriever:
     retriever = Retriever(index, acquisition_function)
     indices = retriever.search(query_embeddings, N=10)
     ```
+
+    With the default VTL acquisition function, the candidates of all queries are processed at once with batched matrix products (see `batched_vtl`).
+    Otherwise, the selection can be distributed across a persistent pool of worker processes (see `processes`) which access the candidates and write their results through shared memory.
+    The Faiss search itself runs in the calling process (parallelized by Faiss, see `threads`), so the index is not copied to the worker processes.
+    The worker processes are shut down by `close`, or when leaving a `with` block:
+
+    ```python
+    with Retriever(index, acquisition_function, processes=8) as retriever:
+        indices = retriever.batch_search(query_embeddings, N=10, K=1000)
+    ```
+
+    If `index` cannot reconstruct exact embeddings (e.g., a compressed IVF-PQ index), the candidates can be gathered from a separate, memory-mapped store of `vectors`.
     """
 
     index: faiss.Index
     only_faiss: bool = False
+    processes: int | None = None
+    vectors: np.ndarray | None = None
 
     def __init__(
         self,
@@ -59,21 +78,43 @@ class Retriever:
         alpha: float | None = None,
         only_faiss: bool = False,
         device: torch.device | None = None,
+        processes: int | None = None,
+        vectors: np.ndarray | str | None = None,
+        vectors_dtype: np.typing.DTypeLike = np.float32,
     ):
         """
         :param index: Faiss index object.
         :param acquisition_function: Acquisition function object.
         :param lambda_: Value of the lambda parameter of SIFT. Ignored if `acquisition_function` is set.
         :param fast: Whether to use the SIFT-Fast. Ignored if `acquisition_function` is set.
-        :param also_query_opposite: If using an inner product index, setting this to `True` will also query the opposite of the query embeddings, pre-selecting points with high *absolute* inner product.
+        :param also_query_opposite: If using an inner product index, setting this to `True` will also query the opposite of the query embeddings, pre-selecting points with high *absolute* inner product. The query and its opposite are searched in a single call to Faiss (which costs as much as two searches), and only the final candidates are reconstructed. If `vectors` is not set, candidates are reconstructed by id, so the first search adds a direct map to IVF indexes (see `faiss.IndexIVF.make_direct_map`), i.e., it modifies `index` in-place.
         :param alpha: Adaptive stopping criterion. Does not apply stopping criterion if set to `None`.
         :param only_faiss: Whether to only use Faiss for search.
         :param device: Device to use for computation.
+        :param processes: Number of worker processes to distribute the queries across. Uses threads within the current process if set to `None`.
+        :param vectors: Exact embeddings of the indexed data (of shape $N_{\text{total}} \times d$), where row $i$ corresponds to id $i$ of `index`. Candidates are gathered from `vectors` by id rather than reconstructed from `index`, which allows for compressed indexes (e.g., IVF-PQ). Either an array (e.g., a `np.memmap`) or a path which is memory-mapped: `.npy` files are loaded with `np.load`, other files are read as raw arrays of `vectors_dtype`. Reconstructs candidates from `index` if set to `None`.
+        :param vectors_dtype: Data type of a raw file of `vectors` (e.g., `np.float16`).
         """
         self.index = index
         self.also_query_opposite = also_query_opposite
         self.alpha = alpha
         self.only_faiss = only_faiss
+        self.processes = processes
+        if isinstance(vectors, str):
+            if vectors.endswith(".npy"):
+                self.vectors = np.load(vectors, mmap_mode="r")
+            else:
+                self.vectors = np.memmap(vectors, dtype=vectors_dtype, mode="r")
+                self.vectors = self.vectors.reshape(-1, index.d)
+        else:
+            self.vectors = vectors
+        assert (
+            self.vectors is None
+            or self.vectors.ndim == 2
+            and self.vectors.shape[1] == index.d
+        ), "`vectors` must be of shape (N, d)."
+        self._pool: concurrent.futures.ProcessPoolExecutor | None = None
+        self._pool_finalizer: weakref.finalize | None = None
         self.device = (
             device
             if device is not None
@@ -159,82 +200,320 @@ class Retriever:
         k = K or self.index.ntotal
         t_start = time.time()
         faiss.omp_set_num_threads(threads)
-        D, I, V = self.index.search_and_reconstruct(mean_queries, k)  # type: ignore
         if self.also_query_opposite:
             assert (
                 self.index.metric_type == faiss.METRIC_INNER_PRODUCT
             ), "`also_query_opposite` should only be used with inner product indexes."
-            D_, I_, V_ = self.index.search_and_reconstruct(-mean_queries, k)  # type: ignore
-            D__, I__, V__ = (
-                np.concatenate([D, D_], axis=1),
-                np.concatenate([I, I_], axis=1),
-                np.concatenate([V, V_], axis=1),
-            )
+            # searches for the query and its opposite in a single call, and merges the results by their score
+            # (Faiss still evaluates 2n queries, but only the final k candidates per query are reconstructed)
+            D__, I__ = self.index.search(np.concatenate([mean_queries, -mean_queries]), k)  # type: ignore
+            D__ = np.concatenate([D__[:n], D__[n:]], axis=1)
+            I__ = np.concatenate([I__[:n], I__[n:]], axis=1)
             sorted_indices = np.argsort(-D__)[:, :k]
-            D, I, V = (
-                np.take_along_axis(D__, sorted_indices, axis=1),
-                np.take_along_axis(I__, sorted_indices, axis=1),
-                np.take_along_axis(V__, sorted_indices[:, :, np.newaxis], axis=1),
-            )
+            D = np.take_along_axis(D__, sorted_indices, axis=1)
+            I = np.take_along_axis(I__, sorted_indices, axis=1)
+            V = self._reconstruct(I)  # only reconstructs the final candidates
+        elif self.vectors is not None:
+            D, I = self.index.search(mean_queries, k)  # type: ignore
+            V = self._reconstruct(I)
+        else:
+            D, I, V = self.index.search_and_reconstruct(mean_queries, k)  # type: ignore
         t_faiss = time.time() - t_start
 
         if self.only_faiss:
             retrieval_time = RetrievalTime(faiss=t_faiss, sift=0)
             return D[:, :N], I[:, :N], V[:, :N], retrieval_time
 
-        def engine(i: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
-            dataset = Dataset(torch.tensor(V[i]))
-            target = torch.tensor(
-                queries[i] if not mean_pooling else mean_queries[i].reshape(1, -1)
-            )
-
-            if isinstance(self.acquisition_function, Targeted):
-                self.acquisition_function.set_target(target)
-
-            sub_indexes, values = ActiveDataLoader(
-                dataset=dataset,
+        t_start = time.time()
+        targets = queries if not mean_pooling else mean_queries.reshape(n, 1, d)
+        if self._is_batchable(K=k):
+            assert isinstance(self.acquisition_function, VTL)
+            values, sub_indexes = batched_vtl(
+                data=torch.tensor(V),
+                target=torch.tensor(targets),
                 batch_size=N,
-                acquisition_function=self.acquisition_function,
+                noise_var=self.acquisition_function.noise_std**2,  # type: ignore
                 device=self.device,
-            ).next()
-            values = np.array(values)
-            indices = np.array(I[i][sub_indexes])
-            embeddings = np.array(V[i][sub_indexes])
-
-            # Adaptive SIFT
-            if self.alpha is not None:
-                uncertainty = np.sqrt(-values)
-                iteration = np.arange(uncertainty.shape[0]) + 1
-                stopped = uncertainty > 1 / (self.alpha * iteration)
-                values, indices, embeddings = (
-                    values[~stopped],
-                    indices[~stopped],
-                    embeddings[~stopped],
+            )
+        elif self.processes is not None:
+            values, sub_indexes = self._select_in_processes(V, targets, N)
+        else:
+            values = np.empty((n, N), dtype=np.float32)
+            sub_indexes = np.empty((n, N), dtype=np.int64)
+
+            def engine(i: int):
+                sub_indexes[i], values[i] = _select(
+                    self.acquisition_function, V[i], targets[i], N, self.device, i
                 )
 
-            return values, indices, embeddings
+            with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+                for future in [executor.submit(engine, i) for i in range(n)]:
+                    future.result()
 
-        t_start = time.time()
-        resulting_values = []
-        resulting_indices = []
-        resulting_embeddings = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
-            futures = []
-            for i in range(n):
-                futures.append(executor.submit(engine, i))
-            for future in concurrent.futures.as_completed(futures):
-                values, indices, embeddings = future.result()
-                resulting_values.append(values)
-                resulting_indices.append(indices)
-                resulting_embeddings.append(embeddings)
+        indices = np.take_along_axis(I, sub_indexes, axis=1)
+        embeddings = np.take_along_axis(V, sub_indexes[:, :, np.newaxis], axis=1)
+        if self.alpha is not None:
+            values, indices, embeddings = self._adaptive_stopping(
+                values, indices, embeddings
+            )
         t_sift = time.time() - t_start
-        retrieval_time = RetrievalTime(faiss=t_faiss, sift=t_sift)
-        dtype = (
-            None if self.alpha is None else object
-        )  # Array of adaptive SIFT might have inconsistent lengths
+        return values, indices, embeddings, RetrievalTime(faiss=t_faiss, sift=t_sift)
+
+    def _reconstruct(self, I: np.ndarray) -> np.ndarray:
+        """Reconstructs the embeddings of the given ids (from `vectors` if set), where missing results (with id `-1`) are left as zeros."""
+        V = np.zeros((*I.shape, self.index.d), dtype=np.float32)
+        valid = I >= 0
+        if self.vectors is not None:
+            # reads each row once and in order of ids, which is fast for memory-mapped files
+            ids, inverse = np.unique(I[valid], return_inverse=True)
+            V[valid] = np.asarray(self.vectors[ids], dtype=np.float32)[inverse]
+        else:
+            index_ivf = faiss.try_extract_index_ivf(self.index)
+            if index_ivf is not None and index_ivf.direct_map.no():
+                index_ivf.make_direct_map()  # required by `reconstruct_batch`
+            V[valid] = self.index.reconstruct_batch(I[valid])  # type: ignore
+        return V
+
+    def _select_in_processes(
+        self, candidates: np.ndarray, targets: np.ndarray, N: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        assert self.processes is not None
+        if self._pool is None:
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.processes,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+            self._pool_finalizer = weakref.finalize(
+                self, self._pool.shutdown, wait=False
+            )
+        # sent with every chunk, so that workers use the current acquisition function
+        # (pickled upfront, as the (empty) tensors are not shared through torch.multiprocessing)
+        acquisition_function = pickle.dumps(self.acquisition_function)
+
+        n = candidates.shape[0]
+        shared = [
+            _SharedArray.create(x)
+            for x in [
+                candidates,
+                targets,
+                np.empty((n, N), dtype=np.float32),
+                np.empty((n, N), dtype=np.int64),
+            ]
+        ]
+        try:
+            chunk_size = math.ceil(n / (4 * self.processes))  # balances the load
+            futures = [
+                self._pool.submit(
+                    _select_chunk,
+                    acquisition_function,
+                    self.device,
+                    range(start, min(start + chunk_size, n)),
+                    N,
+                    *[array.spec for array in shared],
+                )
+                for start in range(0, n, chunk_size)
+            ]
+            for future in futures:
+                future.result()
+            return shared[2].array.copy(), shared[3].array.copy()
+        finally:
+            for array in shared:
+                array.close(unlink=True)
+
+    def close(self):
+        """Shuts down the worker processes (if any)."""
+        if self._pool is not None:
+            assert self._pool_finalizer is not None
+            self._pool_finalizer.detach()
+            self._pool.shutdown()
+            self._pool = None
+
+    def __enter__(self) -> Retriever:
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _is_batchable(self, K: int) -> bool:
+        """Whether the queries can be processed at once by `batched_vtl` (yielding the same results as `self.acquisition_function`)."""
+        acquisition_function = self.acquisition_function
         return (
-            np.array(resulting_values, dtype=dtype),
-            np.array(resulting_indices, dtype=dtype),
-            np.array(resulting_embeddings, dtype=dtype),
-            retrieval_time,
+            type(acquisition_function) is VTL
+            and acquisition_function.noise_std is not None
+            and acquisition_function.subsampled_target_frac == 1
+            and acquisition_function.max_target_size is None
+            and acquisition_function.stochastic_greedy_epsilon is None
+            and not acquisition_function.force_nonsequential
+            and K <= acquisition_function.mini_batch_size
+        )
+
+    def _adaptive_stopping(
+        self, values: np.ndarray, indices: np.ndarray, embeddings: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Adaptive SIFT: discards the results of each query after the stopping criterion is met."""
+        assert self.alpha is not None
+        uncertainty = np.sqrt(-values)
+        iteration = np.arange(uncertainty.shape[1]) + 1
+        stopped = uncertainty > 1 / (self.alpha * iteration)
+
+        # Array of adaptive SIFT might have inconsistent lengths
+        def split(x: np.ndarray) -> np.ndarray:
+            result = np.empty(len(x), dtype=object)
+            for i in range(len(x)):
+                result[i] = x[i][~stopped[i]]
+            return result
+
+        return split(values), split(indices), split(embeddings)
+
+
+def _select(
+    acquisition_function: AcquisitionFunction,
+    candidates: np.ndarray,
+    target: np.ndarray,
+    N: int,
+    device: torch.device | None,
+    query_index: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    # each query uses its own shallow copy as the target (and the cache of its embeddings) is part of the state
+    acquisition_function = copy.copy(acquisition_function)
+    if isinstance(acquisition_function, Targeted):
+        acquisition_function.set_target(torch.tensor(target))
+    if isinstance(acquisition_function, EmbeddingBased):
+        acquisition_function.embedding_cache = None  # candidates differ across queries
+    if isinstance(acquisition_function, SequentialAcquisitionFunction):
+        # independent of the order in which queries are processed
+        seed = acquisition_function.seed
+        acquisition_function.set_seed(seed + query_index if seed is not None else None)
+
+    sub_indexes, values = ActiveDataLoader(
+        dataset=Dataset(torch.tensor(candidates)),
+        batch_size=N,
+        acquisition_function=acquisition_function,
+        device=device,
+    ).next()
+    return sub_indexes.cpu().numpy(), values.cpu().numpy()
+
+
+class _SharedArray:
+    """Numpy array backed by shared memory, which can be attached to by other processes using its `spec`."""
+
+    def __init__(self, shm: SharedMemory, shape: Tuple[int, ...], dtype: str):
+        self.shm = shm
+        self.array: np.ndarray = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        self.spec = (shm.name, shape, dtype)
+
+    @staticmethod
+    def create(x: np.ndarray) -> _SharedArray:
+        shm = SharedMemory(create=True, size=max(x.nbytes, 1))
+        shared = _SharedArray(shm, x.shape, x.dtype.str)
+        shared.array[...] = x
+        return shared
+
+    @staticmethod
+    def attach(spec: Tuple[str, Tuple[int, ...], str]) -> _SharedArray:
+        name, shape, dtype = spec
+        return _SharedArray(SharedMemory(name=name), shape, dtype)
+
+    def close(self, unlink: bool = False):
+        del self.array  # releases the buffer
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def _init_worker():
+    torch.set_num_threads(1)  # parallelism is across processes
+
+
+def _select_chunk(
+    acquisition_function: bytes,
+    device: torch.device | None,
+    query_indices: range,
+    N: int,
+    candidates_spec: Tuple[str, Tuple[int, ...], str],
+    targets_spec: Tuple[str, Tuple[int, ...], str],
+    values_spec: Tuple[str, Tuple[int, ...], str],
+    sub_indexes_spec: Tuple[str, Tuple[int, ...], str],
+):
+    _acquisition_function: AcquisitionFunction = pickle.loads(acquisition_function)
+    candidates, targets, values, sub_indexes = [
+        _SharedArray.attach(spec)
+        for spec in [candidates_spec, targets_spec, values_spec, sub_indexes_spec]
+    ]
+    try:
+        for i in query_indices:
+            sub_indexes.array[i], values.array[i] = _select(
+                _acquisition_function,
+                candidates.array[i],
+                targets.array[i],
+                N,
+                device,
+                i,
+            )
+    finally:
+        for array in [candidates, targets, values, sub_indexes]:
+            array.close()
+
+
+def batched_vtl(
+    data: torch.Tensor,
+    target: torch.Tensor,
+    batch_size: int,
+    noise_var: float,
+    device: torch.device | None = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    r"""
+    Selects batches with [VTL](acquisition_functions/vtl) for several independent problems at once, given embeddings of the data and prediction targets of each problem.
+    All problems are conditioned simultaneously using batched matrix products, analogously to `activeft.acquisition_functions.vtl.VTL.step`.
+
+    :param data: Tensor of data embeddings of shape $b \times n \times d$ for $b$ problems.
+    :param target: Tensor of prediction target embeddings of shape $b \times m \times d$.
+    :param batch_size: Size of the batch to be selected for each problem.
+    :param noise_var: Variance of the observation noise.
+    :param device: Device used for computation.
+    :return: Array of acquisition values (of shape $b \times$ `batch_size`) and array of selected indices (of shape $b \times$ `batch_size`).
+    """
+    data = data.to(device)
+    target = target.to(device)
+    b, n, _ = data.shape
+    batch = torch.arange(b, device=data.device)
+
+    covariances = data @ target.mT  # (b, n, m)
+    data_variances = torch.sum(data * data, dim=2)  # (b, n)
+    target_variances = torch.sum(target * target, dim=2)  # (b, m)
+    update_vectors = torch.empty((b, 0, n), dtype=data.dtype, device=data.device)
+
+    selected_values = []
+    selected_indices = []
+    for _ in range(batch_size):
+        posterior_variances = target_variances.unsqueeze(1) - covariances**2 / (
+            data_variances.unsqueeze(2) + noise_var
+        )  # (b, n, m)
+        values = -torch.sum(posterior_variances, dim=2)  # (b, n)
+        i = torch.argmax(values, dim=1)  # (b,)
+        selected_values.append(values[batch, i])
+        selected_indices.append(i)
+
+        x = data[batch, i]  # (b, d)
+        covariance_vector = torch.bmm(data, x.unsqueeze(2)).squeeze(2)  # (b, n)
+        if update_vectors.size(1) > 0:
+            covariance_vector = covariance_vector - torch.bmm(
+                update_vectors[batch, :, i].unsqueeze(1), update_vectors
+            ).squeeze(1)
+        scale = torch.sqrt(data_variances[batch, i] + noise_var).unsqueeze(1)  # (b, 1)
+        scaled_covariance_vector = covariance_vector / scale  # (b, n)
+        scaled_target_covariance_vector = covariances[batch, i] / scale  # (b, m)
+
+        covariances -= scaled_covariance_vector.unsqueeze(
+            2
+        ) * scaled_target_covariance_vector.unsqueeze(1)
+        data_variances -= torch.square(scaled_covariance_vector)
+        target_variances -= torch.square(scaled_target_covariance_vector)
+        update_vectors = torch.cat(
+            [update_vectors, scaled_covariance_vector.unsqueeze(1)], dim=1
         )
+    return (
+        torch.stack(selected_values, dim=1).cpu().numpy(),
+        torch.stack(selected_indices, dim=1).cpu().numpy(),
+    )
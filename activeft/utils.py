@@ -1,3 +1,4 @@
+import math
 import torch
 import heapq
 from typing import List, Tuple
@@ -81,3 +82,96 @@ class PriorityQueue(object):
     def empty(self):
         """Checks if the priority queue is empty"""
         return self.size() == 0
+
+
+class ArrayPriorityQueue(object):
+    r"""Array-backed priority queue (largest value first) whose top elements can be retrieved and updated in batches. NaN values are treated as $-\infty$."""
+
+    frontier_size: int = 256
+    """Number of elements with the largest values which are tracked separately, such that the top elements can typically be retrieved without scanning all values"""
+
+    def __init__(self, values: torch.Tensor):
+        r"""
+        Initializes the priority queue with the values of elements $0, \dots, n-1$.
+        """
+        self.values = values.masked_fill(torch.isnan(values), -math.inf)
+        self._frontier: torch.Tensor | None = None
+        self._threshold = -math.inf  # largest value outside of the frontier
+        self._in_frontier = torch.zeros(
+            self.size(), dtype=torch.bool, device=self.values.device
+        )
+
+    def top(self, r: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        r"""Returns the indices and values of the (at most) $r$ elements with the largest values, largest values first"""
+        r = min(r, self.size())
+        if self._frontier is not None:
+            values, indices = torch.topk(
+                self.values[self._frontier], min(r, self._frontier.size(0))
+            )
+            if values.size(0) == r and values[-1].item() >= self._threshold:
+                return self._frontier[indices], values
+
+        self._rebuild_frontier(r)  # the frontier contains the top r elements
+        assert self._frontier is not None
+        values, indices = torch.topk(self.values[self._frontier], r)
+        return self._frontier[indices], values
+
+    def update(self, indices: torch.Tensor, values: torch.Tensor):
+        """Updates the values of the given elements"""
+        indices = indices.to(self.values.device)
+        values = values.to(self.values.device, self.values.dtype)
+        self.values[indices] = values.masked_fill(torch.isnan(values), -math.inf)
+        if not bool(torch.all(self._in_frontier[indices])):
+            self._frontier = None  # values outside of the frontier may have increased
+
+    def size(self) -> int:
+        """Returns the size of the priority queue"""
+        return self.values.size(0)
+
+    def _rebuild_frontier(self, r: int):
+        k = min(max(self.frontier_size, 2 * r), self.size())
+        values, indices = torch.topk(self.values, min(k + 1, self.size()))
+        self._threshold = values[k].item() if values.size(0) > k else -math.inf
+        self._in_frontier[:] = False
+        self._frontier = indices[:k]
+        self._in_frontier[self._frontier] = True
+
+
+class StreamingTopK(object):
+    """
+    Top-$k$ values (largest values first) of a stream of batches of values, using memory $O(k)$
+
+    The values are the same as those of `torch.topk` over the concatenated batches, where ties may be resolved differently.
+    If fewer than $k$ values are streamed, the buffer holds all of them (i.e., fewer than $k$ values).
+    """
+
+    def __init__(self, k: int):
+        """
+        Initializes the empty top-$k$ buffer.
+        """
+        self.k = k
+        self.values = torch.empty(0)
+        self.indices = torch.empty(0, dtype=torch.long)
+
+    def update(self, values: torch.Tensor, indices: torch.Tensor):
+        """Merges a batch of values (with corresponding indices) into the top-$k$ buffer"""
+        local_values, local_top_indices = torch.topk(
+            values, min(self.k, values.size(0))
+        )
+        local_indices = indices[local_top_indices.to(indices.device)]
+        if self.values.size(0) == 0:
+            self.values, self.indices = local_values, local_indices
+            return
+
+        merged_values = torch.cat([self.values.to(local_values.device), local_values])
+        merged_indices = torch.cat(
+            [self.indices, local_indices.to(self.indices.device)]
+        )
+        self.values, top_indices = torch.topk(
+            merged_values, min(self.k, merged_values.size(0))
+        )
+        self.indices = merged_indices[top_indices.to(merged_indices.device)]
+
+    def size(self) -> int:
+        """Returns the number of values in the buffer"""
+        return self.values.size(0)
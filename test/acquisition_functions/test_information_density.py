@@ -0,0 +1,33 @@
+import torch
+from activeft.acquisition_functions.information_density import InformationDensity
+from activeft.data import TensorDataset
+
+torch.manual_seed(0)
+data = torch.randn(40, 6)
+target = torch.randn(3, 6) + 100  # distinguishes the prediction targets from the data
+
+
+class Classifier(torch.nn.Module):
+    target_embedding_calls: int
+
+    def __init__(self):
+        super().__init__()
+        self.linear = torch.nn.Linear(6, 4)
+        self.target_embedding_calls = 0
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.linear(x)
+
+    def embed(self, x: torch.Tensor) -> torch.Tensor:
+        if torch.any(x > 50):
+            self.target_embedding_calls += 1
+        return x
+
+
+def test_target_embedded_once_per_select():
+    model = Classifier()
+    acquisition_function = InformationDensity(target=target, mini_batch_size=10)
+    for i in range(2):
+        indices, _ = acquisition_function.select(5, model, TensorDataset(data))
+        assert indices.size(0) == 5
+        assert model.target_embedding_calls == i + 1
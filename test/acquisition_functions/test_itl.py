@@ -0,0 +1,84 @@
+import pytest
+import torch
+from activeft.acquisition_functions.itl import ITL
+from activeft.acquisition_functions.undirected_vtl import UndirectedVTL
+from activeft.gaussian import conditional_covariance
+
+torch.manual_seed(0)
+data = torch.randn(30, 5)
+target = torch.randn(4, 5)
+noise_std = 0.5
+n, m = data.size(0), target.size(0)
+Sigma = torch.cat([data, target]) @ torch.cat([data, target]).T
+
+
+def _conditional_variances(observed: list[int], targets: bool) -> torch.Tensor:
+    indices = torch.tensor(observed, dtype=torch.long)
+    if targets:
+        indices = torch.cat([indices, torch.arange(n, n + m)])
+    if indices.size(0) == 0:
+        return Sigma.diag()[:n]
+    return conditional_covariance(
+        Sigma, indices, torch.arange(n), noise_var=noise_std**2
+    ).diag()
+
+
+def test_incremental_conditional_variances():
+    acquisition_function = ITL(target, noise_std=noise_std)
+    state = acquisition_function.initialize(None, data, None)
+    observed = []
+    for i in [3, 17, 3, 8]:
+        state = acquisition_function.step(state, i)
+        observed.append(i)
+        assert torch.allclose(
+            state.conditional_variances,
+            _conditional_variances(observed, targets=True),
+            atol=1e-4,
+        )
+
+
+def test_selection_matches_full_recomputation():
+    observed = []
+    for _ in range(6):
+        variances = _conditional_variances(observed, targets=False)
+        conditional_variances = _conditional_variances(observed, targets=True)
+        observed.append(int(torch.argmax(variances / conditional_variances).item()))
+
+    indices, _ = ITL(target, noise_std=noise_std).select_from_minibatch(
+        6, None, data, None  # type: ignore
+    )
+    assert indices.tolist() == observed
+
+
+class CachedKernel(torch.nn.Module):
+    """Returns the same (model-owned) kernel matrix whenever it is called with the same inputs."""
+
+    def __init__(self):
+        super().__init__()
+        self.scale = torch.nn.Parameter(torch.tensor(1.0))  # determines the device
+        self.cache: dict[int, torch.Tensor] = {}
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return x
+
+    def kernel(self, x1: torch.Tensor, x2: torch.Tensor) -> torch.Tensor:
+        key = hash((x1.numpy().tobytes(), x2.numpy().tobytes()))
+        if key not in self.cache:
+            self.cache[key] = x1 @ x2.T
+        return self.cache[key]
+
+
+@pytest.mark.parametrize("cls", [ITL, UndirectedVTL])
+def test_selection_does_not_modify_kernel_of_model(cls):
+    model = CachedKernel()
+    acquisition_function = (
+        ITL(target, noise_std=noise_std)
+        if cls is ITL
+        else UndirectedVTL(noise_std=noise_std)
+    )
+    for _ in range(2):
+        acquisition_function.select_from_minibatch(6, model, data, None)
+        for kernel_matrix in model.cache.values():
+            assert torch.equal(
+                kernel_matrix, Sigma[: kernel_matrix.size(0), : kernel_matrix.size(1)]
+            )
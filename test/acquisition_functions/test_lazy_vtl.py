@@ -0,0 +1,117 @@
+import pytest
+import torch
+from activeft.acquisition_functions.lazy_vtl import LazyVTL
+from activeft.gaussian import conditional_covariance
+
+torch.manual_seed(0)
+data = torch.randn(60, 8)
+target = torch.randn(3, 8)
+noise_std = 0.5
+n, m = data.size(0), target.size(0)
+Sigma = torch.cat([data, target]) @ torch.cat([data, target]).T
+
+
+class Embedding(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.weight = torch.nn.Parameter(torch.eye(8))
+        self.embedded = 0
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return x
+
+    def embed(self, x: torch.Tensor) -> torch.Tensor:
+        self.embedded += x.size(0)
+        return (x @ self.weight).detach()
+
+
+def _values(observed: list[int]) -> torch.Tensor:
+    posterior = Sigma
+    if len(observed) > 0:
+        posterior = conditional_covariance(
+            Sigma, torch.tensor(observed), torch.arange(n + m), noise_var=noise_std**2
+        )
+    return torch.sum(posterior[n:, :n] ** 2, dim=0) / (
+        posterior.diag()[:n] + noise_std**2
+    )
+
+
+def _lazy_greedy(
+    priorities: torch.Tensor, batch_size: int, refresh_batch_size: int = 1
+) -> list[int]:
+    priorities = priorities.clone()
+    observed = []
+    for _ in range(batch_size):
+        values = _values(observed)
+        while True:
+            upper_bounds, indices = torch.topk(priorities, refresh_batch_size + 1)
+            candidates = indices[:refresh_batch_size]
+            priorities[candidates] = values[candidates]
+            i = int(candidates[torch.argmax(values[candidates])].item())
+            if values[i] >= upper_bounds[-1]:
+                break
+        observed.append(i)
+    return observed
+
+
+def _initial_priorities() -> torch.Tensor:
+    return (data @ target.mean(dim=0)) ** 2 / (
+        torch.sum(data * data, dim=1) + noise_std**2
+    )
+
+
+def test_selection_matches_lazy_greedy():
+    acquisition_function = LazyVTL(target, noise_std=noise_std)
+    acquisition_function.set_initial_priority_queue(data, target.mean(dim=0))
+    indices, values = acquisition_function.select_from_minibatch(
+        8, None, data, None  # type: ignore
+    )
+    expected = _lazy_greedy(_initial_priorities(), 8)
+    assert indices.tolist() == expected
+    assert torch.allclose(
+        values, torch.stack([_values(expected[:t])[i] for t, i in enumerate(expected)])
+    )
+
+
+def test_model_embeds_only_recomputed_data():
+    model = Embedding()
+    acquisition_function = LazyVTL(target, noise_std=noise_std)
+    acquisition_function.initialize(model, data, None)  # type: ignore
+    assert model.embedded == m
+
+    model = Embedding()
+    acquisition_function.set_initial_priority_queue(data, target.mean(dim=0))
+    indices, _ = acquisition_function.select_from_minibatch(
+        8, model, data, None  # type: ignore
+    )
+    assert model.embedded < m + n
+    assert indices.tolist() == _lazy_greedy(
+        _initial_priorities(), 8
+    )  # identical to selection from embedded data
+
+
+def test_model_selection_matches_embedded_data():
+    model = Embedding()
+    indices, _ = LazyVTL(target, noise_std=noise_std).select_from_minibatch(
+        8, model, data, None  # type: ignore
+    )
+    assert model.embedded == m + n  # each data point is embedded once
+    assert indices.tolist() == _lazy_greedy(_values([]), 8)
+
+
+@pytest.mark.parametrize("refresh_batch_size", [1, 4])
+@pytest.mark.parametrize("initial_priority_queue", [True, False])
+def test_batched_refresh_matches_lazy_greedy(
+    refresh_batch_size: int, initial_priority_queue: bool
+):
+    acquisition_function = LazyVTL(
+        target, noise_std=noise_std, refresh_batch_size=refresh_batch_size
+    )
+    priorities = _values([])
+    if initial_priority_queue:
+        acquisition_function.set_initial_priority_queue(data, target.mean(dim=0))
+        priorities = _initial_priorities()
+    indices, _ = acquisition_function.select_from_minibatch(
+        8, None, data, None  # type: ignore
+    )
+    assert indices.tolist() == _lazy_greedy(priorities, 8, refresh_batch_size)
@@ -0,0 +1,121 @@
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+import pytest
+import torch
+from activeft.acquisition_functions.undirected_itl import UndirectedITL
+from activeft.acquisition_functions.vtl import VTL
+from activeft.data import TensorDataset
+
+torch.manual_seed(0)
+data = torch.randn(60, 8)
+
+
+def test_lazy_greedy_matches_greedy():
+    indices, values = UndirectedITL(noise_std=0.5).select_from_minibatch(
+        10, None, data, None  # type: ignore
+    )
+    lazy_indices, lazy_values = UndirectedITL(
+        noise_std=0.5, lazy=True
+    ).select_from_minibatch(
+        10, None, data, None  # type: ignore
+    )
+    assert lazy_indices.tolist() == indices.tolist()
+    assert torch.allclose(lazy_values, values)
+
+
+def test_lazy_greedy_excludes_stochastic_greedy():
+    acquisition_function = UndirectedITL(
+        noise_std=0.5, lazy=True, stochastic_greedy_epsilon=0.1
+    )
+    with pytest.raises(AssertionError):
+        acquisition_function.select_from_minibatch(10, None, data, None)  # type: ignore
+
+
+def test_stochastic_greedy_is_reproducible():
+    def select(seed: int) -> torch.Tensor:
+        acquisition_function = UndirectedITL(
+            noise_std=0.5, stochastic_greedy_epsilon=0.5, seed=seed
+        )
+        indices, _ = acquisition_function.select_from_minibatch(
+            10, None, data, None  # type: ignore
+        )
+        return indices
+
+    assert torch.equal(select(seed=1), select(seed=1))
+    assert any(not torch.equal(select(seed=1), select(seed=s)) for s in range(2, 6))
+
+
+def test_tree_reduction_selects_distinct_batch():
+    generator = torch.Generator().manual_seed(0)
+    dataset = TensorDataset(torch.randn(500, 8, generator=generator))
+    target = torch.randn(20, 8, generator=generator)
+    acquisition_function = VTL(target, noise_std=0.1, mini_batch_size=40, tree_fan_in=3)
+    indices, values = acquisition_function.select(10, None, dataset)  # type: ignore
+    assert indices.size(0) == values.size(0) == 10
+    assert torch.unique(indices).size(0) == 10
+    assert torch.all((indices >= 0) & (indices < 500))
+
+
+def _tree_reduction(
+    acquisition_function: VTL, batch_size: int, leaves: list[torch.Tensor]
+) -> torch.Tensor:
+    def select(idx: torch.Tensor) -> torch.Tensor:
+        sub_idx, _ = acquisition_function.select_from_minibatch(
+            batch_size, None, data[idx], None  # type: ignore
+        )
+        return idx[sub_idx]
+
+    nodes = [select(idx) for idx in leaves]
+    while len(nodes) > 1:
+        nodes = [select(torch.cat(nodes[i : i + 2])) for i in range(0, len(nodes), 2)]
+    return nodes[0]
+
+
+def test_tree_reduction_matches_reference():
+    target = torch.randn(3, 8, generator=torch.Generator().manual_seed(0))
+
+    def select(**kwargs) -> torch.Tensor:
+        acquisition_function = VTL(
+            target, noise_std=0.5, mini_batch_size=15, seed=0, **kwargs
+        )
+        indices, _ = acquisition_function.select(
+            3, None, TensorDataset(data)  # type: ignore
+        )
+        return indices
+
+    # a single merge of all leaves coincides with hierarchical composition
+    assert select(tree_fan_in=4).tolist() == select().tolist()
+
+    permutation = torch.randperm(60, generator=torch.Generator().manual_seed(0))
+    expected = _tree_reduction(
+        VTL(target, noise_std=0.5), 3, list(torch.split(permutation, 15))
+    )
+    assert select(tree_fan_in=2).tolist() == expected.tolist()
+
+
+@pytest.mark.parametrize("force_nonsequential", [False, True])
+@pytest.mark.parametrize("tree_fan_in", [None, 2])
+@pytest.mark.parametrize("executor_type", [ThreadPoolExecutor, ProcessPoolExecutor])
+def test_executor_matches_sequential_processing(
+    force_nonsequential, tree_fan_in, executor_type
+):
+    dataset = TensorDataset(data)
+    target = torch.randn(3, 8, generator=torch.Generator().manual_seed(0))
+
+    def select(executor: Executor | None):
+        torch.manual_seed(0)  # mini batches are shuffled
+        acquisition_function = VTL(
+            target,
+            noise_std=0.5,
+            mini_batch_size=15,
+            force_nonsequential=force_nonsequential,
+            executor=executor,
+            tree_fan_in=tree_fan_in,
+        )
+        return acquisition_function.select(5, None, dataset)  # type: ignore
+
+    indices, values = select(executor=None)
+    with executor_type(max_workers=2) as executor:
+        concurrent_indices, concurrent_values = select(executor=executor)
+        assert select(executor=executor)[0].tolist() == indices.tolist()  # reuse
+    assert concurrent_indices.tolist() == indices.tolist()
+    assert torch.allclose(concurrent_values, values)
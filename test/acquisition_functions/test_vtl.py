@@ -0,0 +1,67 @@
+import torch
+from activeft.acquisition_functions.vtl import VTL
+from activeft.gaussian import conditional_covariance
+
+torch.manual_seed(0)
+data = torch.randn(40, 6)
+target = torch.randn(3, 6)
+noise_std = 0.5
+n, m = data.size(0), target.size(0)
+Sigma = torch.cat([data, target]) @ torch.cat([data, target]).T
+
+
+class RBFKernel(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.bandwidth = torch.nn.Parameter(torch.tensor(10.0))
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return x
+
+    def kernel(self, x1: torch.Tensor, x2: torch.Tensor) -> torch.Tensor:
+        return torch.exp(-torch.cdist(x1, x2) ** 2 / self.bandwidth).detach()
+
+
+def _greedy(Sigma: torch.Tensor, batch_size: int) -> list[int]:
+    observed = []
+    for _ in range(batch_size):
+        values = torch.tensor(
+            [
+                -conditional_covariance(
+                    Sigma,
+                    torch.tensor(observed + [i]),
+                    torch.arange(n, n + m),
+                    noise_var=noise_std**2,
+                ).trace()
+                for i in range(n)
+            ]
+        )
+        observed.append(int(torch.argmax(values).item()))
+    return observed
+
+
+def test_selection_matches_full_conditioning():
+    indices, _ = VTL(target, noise_std=noise_std).select_from_minibatch(
+        5, None, data, None  # type: ignore
+    )
+    assert indices.tolist() == _greedy(Sigma, 5)
+
+
+def test_kernel_selection_matches_full_conditioning():
+    model = RBFKernel()
+    joint_data = torch.cat([data, target])
+    indices, _ = VTL(target, noise_std=noise_std).select_from_minibatch(
+        5, model, data, None  # type: ignore
+    )
+    assert indices.tolist() == _greedy(model.kernel(joint_data, joint_data), 5)
+
+
+def test_state_stores_only_target_blocks():
+    acquisition_function = VTL(target, noise_std=noise_std)
+    state = acquisition_function.initialize(None, data, None)
+    for i in range(100):  # exceeds the initial capacity of the update vectors
+        state = acquisition_function.step(state, i % n)
+    assert state.covariances.shape == (n, m)
+    assert state.variances.shape == (n + m,)
+    assert state.update_vectors.size(0) >= 100
+    assert not hasattr(state, "covariance_matrix")
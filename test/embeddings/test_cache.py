@@ -0,0 +1,120 @@
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pytest
+import torch
+from activeft.acquisition_functions.undirected_vtl import UndirectedVTL
+from activeft.embeddings.cache import EmbeddingCache
+
+data = torch.randn(100, 10)
+W = torch.randn(10, 4)
+
+
+def test_cache():
+    calls = []
+
+    def embed(x: torch.Tensor) -> torch.Tensor:
+        calls.append(x.size(0))
+        return x @ W
+
+    cache = EmbeddingCache(size=100)
+    indices = torch.arange(20, 60)
+    embeddings = cache.get(indices, data[indices], embed)
+    assert torch.allclose(embeddings, data[indices] @ W)
+
+    indices = torch.arange(40, 80)
+    embeddings = cache.get(indices, data[indices], embed)
+    assert torch.allclose(embeddings, data[indices] @ W)
+    assert calls == [40, 20]
+
+    cache.bump_version()
+    assert not torch.any(cache.is_cached(indices))
+    cache.get(indices, data[indices], embed)
+    assert calls == [40, 20, 40]
+
+
+def _embed_in_worker(cache: EmbeddingCache, indices: torch.Tensor) -> int:
+    return cache.get(indices, data[indices], lambda x: x @ W).size(0)
+
+
+def test_cache_across_processes():
+    cache = EmbeddingCache(size=100)
+    cache.get(torch.arange(10), data[:10], lambda x: x @ W)
+    assert len(pickle.dumps(cache)) < 1000  # embeddings are not pickled
+
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        chunks = torch.arange(10, 100).chunk(3)
+        assert sum(executor.map(_embed_in_worker, [cache] * 3, chunks)) == 90
+
+    assert torch.all(cache.is_cached(torch.arange(100)))
+    embeddings = cache.get(torch.arange(100), data, lambda x: x @ W + 1)
+    assert torch.allclose(embeddings, data @ W)
+
+
+def test_cache_returns_consistent_embeddings():
+    cache = EmbeddingCache(size=100, dtype=np.float16)
+    embed = lambda x: (x @ W).double()
+    fresh = cache.get(torch.arange(10), data[:10], embed)
+    partial = cache.get(torch.arange(20), data[:20], embed)
+    cached = cache.get(torch.arange(20), data[:20], embed)
+    for embeddings in [fresh, partial, cached]:
+        assert embeddings.dtype == torch.get_default_dtype()
+        assert embeddings.device == torch.device("cpu")
+    assert torch.equal(fresh, partial[:10])
+    assert torch.equal(partial, cached)
+
+
+def test_cache_persists_across_constructions(tmp_path):
+    path = str(tmp_path / "embeddings")
+    calls = []
+
+    def embed(x: torch.Tensor) -> torch.Tensor:
+        calls.append(x.size(0))
+        return x @ W
+
+    EmbeddingCache(size=100, path=path).get(torch.arange(20), data[:20], embed)
+    cache = EmbeddingCache(size=100, path=path)
+    embeddings = cache.get(torch.arange(30), data[:30], embed)
+    assert torch.allclose(embeddings, data[:30] @ W)
+    assert calls == [20, 10]
+
+    cache.bump_version()
+    assert EmbeddingCache(size=100, path=path).version == 1
+    assert not torch.any(
+        EmbeddingCache(size=100, path=path).is_cached(torch.arange(30))
+    )
+
+    cache = EmbeddingCache(size=50, path=path)  # overwrites a cache of different size
+    assert cache.version == 0
+    assert not torch.any(cache.is_cached(torch.arange(50)))
+
+
+class Embedding(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.weight = torch.nn.Parameter(W.clone())
+        self.embedded = 0
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return x
+
+    def embed(self, x: torch.Tensor) -> torch.Tensor:
+        self.embedded += x.size(0)
+        return (x @ self.weight).detach()
+
+
+def test_cache_requires_explicit_indices():
+    model = Embedding()
+    acquisition_function = UndirectedVTL(embedding_cache=EmbeddingCache(size=100))
+    acquisition_function.compute_data_embedding(model, data[:10], torch.arange(10))
+    assert model.embedded == 10
+
+    other_data = data[50:60]  # of the same size, but not cached
+    embeddings = acquisition_function.compute_data_embedding(model, other_data)
+    assert torch.allclose(embeddings, other_data @ W)
+    assert model.embedded == 20
+
+    acquisition_function.compute_data_embedding(model, data[:10], torch.arange(10))
+    assert model.embedded == 20
+    with pytest.raises(AssertionError):
+        acquisition_function.compute_data_embedding(model, data[:10], torch.arange(5))
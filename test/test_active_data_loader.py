@@ -0,0 +1,39 @@
+import asyncio
+import torch
+from activeft import ActiveDataLoader
+from activeft.data import TensorDataset
+
+torch.manual_seed(0)
+data = TensorDataset(torch.randn(50, 6))
+target = torch.randn(3, 6)
+
+
+def _next(data_loader: ActiveDataLoader, mode: str):
+    torch.manual_seed(1)  # mini batches are shuffled
+    if mode == "prefetch":
+        return data_loader.prefetch().result()
+    if mode == "async":
+        return asyncio.run(data_loader.next_async())
+    return data_loader.next()
+
+
+def test_prefetch_matches_next():
+    with ActiveDataLoader.initialize(data, target, batch_size=5) as data_loader:
+        indices, values = _next(data_loader, "serial")
+        for mode in ["prefetch", "async"]:
+            prefetched_indices, prefetched_values = _next(data_loader, mode)
+            assert torch.equal(prefetched_indices, indices)
+            assert torch.allclose(prefetched_values, values)
+
+
+def test_with_target_waits_for_prefetched_batches():
+    other_target = torch.randn(3, 6)
+    data_loader = ActiveDataLoader.initialize(data, target, batch_size=5)
+    torch.manual_seed(1)
+    future = data_loader.prefetch()
+    data_loader.with_target(other_target)
+    assert future.done()
+    data_loader.close()
+    torch.manual_seed(1)
+    expected, _ = ActiveDataLoader.initialize(data, target, batch_size=5).next()
+    assert torch.equal(future.result()[0], expected)
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import torch
+import torch.distributed as dist
+from torch.multiprocessing.spawn import spawn
+from activeft.acquisition_functions.vtl import VTL
+from activeft.data import TensorDataset
+from activeft.distributed import DistributedActiveDataLoader
+
+WORLD_SIZE = 2
+SHARD_SIZE = 100
+
+
+def _data() -> tuple[torch.Tensor, torch.Tensor]:
+    torch.manual_seed(0)
+    return torch.randn(WORLD_SIZE * SHARD_SIZE, 8), torch.randn(3, 8)
+
+
+def _shard(data: torch.Tensor, rank: int) -> TensorDataset:
+    return TensorDataset(data[rank * SHARD_SIZE : (rank + 1) * SHARD_SIZE])
+
+
+def _run(rank: int, init_file: str, results: str):
+    dist.init_process_group(
+        "gloo", init_method=f"file://{init_file}", rank=rank, world_size=WORLD_SIZE
+    )
+    data, target = _data()
+    data_loader = DistributedActiveDataLoader(
+        _shard(data, rank),
+        batch_size=5,
+        acquisition_function=VTL(target, mini_batch_size=50, seed=0),
+    )
+    torch.save(data_loader.next(), os.path.join(results, f"{rank}.pt"))
+    dist.destroy_process_group()
+
+
+def test_distributed_selection():
+    with tempfile.TemporaryDirectory() as results:
+        init_file = os.path.join(results, "init")
+        spawn(_run, args=(init_file, results), nprocs=WORLD_SIZE)
+        outputs = [
+            torch.load(os.path.join(results, f"{rank}.pt"))
+            for rank in range(WORLD_SIZE)
+        ]
+
+    ranks, indices, values = outputs[0]
+    assert ranks.size(0) == indices.size(0) == values.size(0) == 5
+    assert torch.all((ranks >= 0) & (ranks < WORLD_SIZE))
+    assert torch.all((indices >= 0) & (indices < SHARD_SIZE))
+    for other in outputs[1:]:
+        assert all(torch.equal(a, b) for a, b in zip(outputs[0], other))
+
+    # selects among the union of the candidates of all shards in a single process
+    data, target = _data()
+    candidates, candidate_ranks, candidate_indices = [], [], []
+    for rank in range(WORLD_SIZE):
+        shard = _shard(data, rank)
+        local_indices, _ = VTL(target, mini_batch_size=50, seed=0).select(
+            5, None, shard
+        )
+        local_indices = torch.unique(local_indices)
+        candidates.append(shard[local_indices])
+        candidate_ranks.append(torch.full_like(local_indices, rank))
+        candidate_indices.append(local_indices)
+    sub_idx, expected_values = VTL(
+        target, mini_batch_size=50, seed=0
+    ).select_from_minibatch(5, None, torch.cat(candidates), None)
+    assert torch.equal(ranks, torch.cat(candidate_ranks)[sub_idx])
+    assert torch.equal(indices, torch.cat(candidate_indices)[sub_idx])
+    assert torch.allclose(values, expected_values)
@@ -1,6 +1,10 @@
 from pytest import approx
 import torch
-from activeft.gaussian import GaussianCovarianceMatrix
+from activeft.gaussian import (
+    FeatureSpaceCovarianceMatrix,
+    GaussianCovarianceMatrix,
+    conditional_covariance,
+)
 
 matrix = torch.tensor([[1, 0.5], [0.5, 3]])
 noise_std = 1
@@ -28,3 +32,106 @@ def test_condition_on():
 
     conditioned_gaussian = gaussian.condition_on([1, 1], noise_std=noise_std)
     assert conditioned_gaussian[0, 0] == approx(0.9286, abs=1e-4)
+
+
+def test_condition_on_inplace():
+    inplace_gaussian = GaussianCovarianceMatrix(matrix.clone())
+    conditioned_gaussian = inplace_gaussian.condition_on_(1, noise_std=noise_std)
+    assert conditioned_gaussian is inplace_gaussian
+    assert torch.allclose(
+        conditioned_gaussian[:, :],
+        gaussian.condition_on(1, noise_std=noise_std)[:, :],
+    )
+
+    conditioned_gaussian.condition_on_(1, noise_std=noise_std)
+    assert conditioned_gaussian[0, 0] == approx(0.9286, abs=1e-4)
+
+
+def test_feature_space():
+    embeddings = torch.randn(10, 3)
+    dense_gaussian = GaussianCovarianceMatrix.from_embeddings(embeddings)
+    feature_space_gaussian = FeatureSpaceCovarianceMatrix.from_embeddings(embeddings)
+    assert feature_space_gaussian.dim == 10
+    assert torch.allclose(feature_space_gaussian[:, :], dense_gaussian[:, :])
+    assert torch.allclose(feature_space_gaussian.diag(), dense_gaussian.diag())
+
+    conditioned_gaussian = feature_space_gaussian.condition_on(
+        [1, 2], target_indices=torch.arange(5), noise_std=noise_std
+    )
+    expected_gaussian = dense_gaussian.condition_on(
+        [1, 2], target_indices=torch.arange(5), noise_std=noise_std
+    )
+    assert torch.allclose(
+        conditioned_gaussian[:, :], expected_gaussian[:, :], atol=1e-5
+    )
+    assert torch.allclose(
+        conditioned_gaussian.diag(), expected_gaussian.diag(), atol=1e-5
+    )
+
+    feature_space_gaussian.condition_on_(1, noise_std=noise_std)
+    dense_gaussian.condition_on_(1, noise_std=noise_std)
+    assert torch.allclose(feature_space_gaussian[:, :], dense_gaussian[:, :], atol=1e-5)
+    assert torch.allclose(
+        feature_space_gaussian.diag(), dense_gaussian.diag(), atol=1e-5
+    )
+
+
+def test_sum_of_squared_covariances():
+    embeddings = torch.randn(10, 3)
+    dense_gaussian = GaussianCovarianceMatrix.from_embeddings(embeddings)
+    feature_space_gaussian = FeatureSpaceCovarianceMatrix.from_embeddings(embeddings)
+    for _ in range(2):
+        for indices in [slice(None, 8), torch.tensor([0, 4, 7])]:
+            assert torch.allclose(
+                feature_space_gaussian.sum_of_squared_covariances(indices, n=8),
+                dense_gaussian.sum_of_squared_covariances(indices, n=8),
+                atol=1e-4,
+            )
+        feature_space_gaussian.condition_on_(4, noise_std=noise_std)
+        dense_gaussian.condition_on_(4, noise_std=noise_std)
+
+
+def test_expand():
+    expanded_gaussian = gaussian.expand(torch.tensor([0.1, 0.2, 2.0]))
+    assert expanded_gaussian.dim == 3
+    assert expanded_gaussian.device == gaussian.device
+    assert expanded_gaussian[:, :].dtype == matrix.dtype
+    assert expanded_gaussian[2, 0] == approx(0.1)
+    assert expanded_gaussian[1, 2] == approx(0.2)
+    assert expanded_gaussian[2, 2] == approx(2.0)
+    assert torch.equal(expanded_gaussian[:2, :2], matrix)
+
+    expanded_gaussian = expanded_gaussian.expand(torch.tensor([0.3, 0.4, 0.5, 4.0]))
+    assert expanded_gaussian.dim == 4
+    assert expanded_gaussian[3, 3] == approx(4.0)
+    assert expanded_gaussian[2, 2] == approx(2.0)
+    assert torch.equal(expanded_gaussian[:2, :2], matrix)
+
+
+def test_conditional_covariance_batched():
+    embeddings = torch.randn(3, 6, 4)
+    Sigma = embeddings @ embeddings.mT
+    indices = torch.tensor([[0, 1], [2, 3], [4, 5]])
+    target_indices = torch.arange(6)
+
+    posterior_Sigma = conditional_covariance(
+        Sigma, indices=indices, target_indices=target_indices, noise_var=noise_std**2
+    )
+    assert posterior_Sigma.shape == (3, 6, 6)
+    for b in range(3):
+        expected_Sigma = GaussianCovarianceMatrix(Sigma[b]).condition_on(
+            indices[b], noise_std=noise_std
+        )[:, :]
+        assert torch.allclose(posterior_Sigma[b], expected_Sigma, atol=1e-5)
+
+    posterior_Sigma = conditional_covariance(
+        Sigma,
+        indices=torch.tensor([1]),
+        target_indices=torch.tensor([0, 2]),
+        noise_var=noise_std**2,
+    )
+    for b in range(3):
+        expected_Sigma = GaussianCovarianceMatrix(Sigma[b]).condition_on(
+            1, target_indices=torch.tensor([0, 2]), noise_std=noise_std
+        )[:, :]
+        assert torch.allclose(posterior_Sigma[b], expected_Sigma, atol=1e-5)
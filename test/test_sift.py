@@ -0,0 +1,159 @@
+import faiss
+import numpy as np
+import pytest
+import torch
+from activeft.acquisition_functions.vtl import VTL
+from activeft.sift import Retriever
+
+rng = np.random.default_rng(0)
+d = 16
+embeddings = rng.standard_normal((500, d)).astype(np.float32)
+queries = rng.standard_normal((6, 3, d)).astype(np.float32)
+
+
+class UnbatchedVTL(VTL):
+    """Processes queries one by one (see `Retriever._is_batchable`)."""
+
+
+def _index() -> faiss.Index:
+    index = faiss.IndexFlatIP(d)
+    index.add(embeddings)  # type: ignore
+    return index
+
+
+def _vtl(cls: type[VTL], **kwargs) -> VTL:
+    return cls(
+        target=torch.Tensor(),
+        num_workers=1,
+        subsample=False,
+        force_nonsequential=False,
+        noise_std=0.1,
+        **kwargs,
+    )
+
+
+@pytest.mark.parametrize("also_query_opposite", [True, False])
+@pytest.mark.parametrize("alpha", [None, 0.07])
+def test_batched_search_matches_per_query_search(
+    also_query_opposite: bool, alpha: float | None
+):
+    results = [
+        Retriever(
+            _index(),
+            acquisition_function=_vtl(cls),
+            also_query_opposite=also_query_opposite,
+            alpha=alpha,
+        ).batch_search(queries, N=8, K=50)
+        for cls in [VTL, UnbatchedVTL]
+    ]
+    (values, indices, embeddings_, _), (
+        expected_values,
+        expected_indices,
+        expected_embeddings,
+        _,
+    ) = results
+    for i in range(len(queries)):
+        assert np.array_equal(indices[i], expected_indices[i])
+        assert np.allclose(values[i], expected_values[i], atol=1e-4)
+        assert np.allclose(embeddings_[i], expected_embeddings[i])
+        assert np.allclose(embeddings_[i], embeddings[indices[i]])
+
+
+def test_threaded_search_matches_serial_search():
+    def search(threads: int):
+        acquisition_function = _vtl(UnbatchedVTL, stochastic_greedy_epsilon=0.5, seed=0)
+        return Retriever(
+            _index(), acquisition_function=acquisition_function
+        ).batch_search(queries, N=8, K=50, threads=threads)
+
+    values, indices, _, _ = search(threads=1)
+    threaded_values, threaded_indices, _, _ = search(threads=4)
+    assert np.array_equal(threaded_indices, indices)
+    assert np.allclose(threaded_values, values)
+
+
+def test_process_pool_matches_serial_search():
+    acquisition_function = _vtl(VTL, stochastic_greedy_epsilon=0.5, seed=0)
+    other_acquisition_function = _vtl(VTL, stochastic_greedy_epsilon=0.5, seed=1)
+    with Retriever(
+        _index(), acquisition_function=acquisition_function, processes=2
+    ) as retriever:
+        for af in [acquisition_function, other_acquisition_function]:
+            retriever.acquisition_function = af  # the pool is reused
+            values, indices, _, _ = retriever.batch_search(queries, N=8, K=50)
+            expected_values, expected_indices, _, _ = Retriever(
+                _index(), acquisition_function=af
+            ).batch_search(queries, N=8, K=50)
+            assert np.array_equal(indices, expected_indices)
+            assert np.allclose(values, expected_values)
+    assert retriever._pool is None
+
+
+def test_ivf_index_matches_flat_index():
+    quantizer = faiss.IndexFlatIP(d)
+    index = faiss.IndexIVFFlat(quantizer, d, 8, faiss.METRIC_INNER_PRODUCT)
+    index.train(embeddings)  # type: ignore
+    index.add(embeddings)  # type: ignore
+    index.nprobe = 8  # exhaustive search
+    values, indices, embeddings_, _ = Retriever(
+        index, acquisition_function=_vtl(VTL)
+    ).batch_search(queries, N=8, K=50)
+    expected_values, expected_indices, _, _ = Retriever(
+        _index(), acquisition_function=_vtl(VTL)
+    ).batch_search(queries, N=8, K=50)
+    assert np.array_equal(indices, expected_indices)
+    assert np.allclose(values, expected_values, atol=1e-4)
+    assert np.allclose(embeddings_, embeddings[indices])
+
+
+def test_direct_map_is_added_on_first_search():
+    quantizer = faiss.IndexFlatIP(d)
+    index = faiss.IndexIVFFlat(quantizer, d, 8, faiss.METRIC_INNER_PRODUCT)
+    index.train(embeddings)  # type: ignore
+    index.add(embeddings)  # type: ignore
+    index.nprobe = 8  # exhaustive search
+    retriever = Retriever(
+        index, acquisition_function=_vtl(VTL), also_query_opposite=True
+    )
+    assert index.direct_map.no()  # the index is not modified on construction
+    values, indices, embeddings_, _ = retriever.batch_search(queries, N=8, K=50)
+    assert not index.direct_map.no()
+    expected_values, expected_indices, _, _ = Retriever(
+        _index(), acquisition_function=_vtl(VTL), also_query_opposite=True
+    ).batch_search(queries, N=8, K=50)
+    assert np.array_equal(indices, expected_indices)
+    assert np.allclose(values, expected_values, atol=1e-4)
+    assert np.allclose(embeddings_, embeddings[indices])
+
+
+@pytest.mark.parametrize("store", ["array", "npy", "raw"])
+@pytest.mark.parametrize("also_query_opposite", [True, False])
+def test_vectors_match_index_reconstruction(
+    store: str, also_query_opposite: bool, tmp_path
+):
+    vectors = embeddings.astype(np.float16)  # exactly representable in both dtypes
+    index = faiss.IndexFlatIP(d)
+    index.add(vectors.astype(np.float32))  # type: ignore
+    vectors_store: np.ndarray | str = vectors
+    if store == "npy":
+        vectors_store = str(tmp_path / "vectors.npy")
+        np.save(vectors_store, vectors)
+    elif store == "raw":
+        vectors_store = str(tmp_path / "vectors.bin")
+        vectors.tofile(vectors_store)
+
+    values, indices, embeddings_, _ = Retriever(
+        index,
+        acquisition_function=_vtl(VTL),
+        also_query_opposite=also_query_opposite,
+        vectors=vectors_store,
+        vectors_dtype=np.float16,
+    ).batch_search(queries, N=8, K=50)
+    expected_values, expected_indices, expected_embeddings, _ = Retriever(
+        index,
+        acquisition_function=_vtl(VTL),
+        also_query_opposite=also_query_opposite,
+    ).batch_search(queries, N=8, K=50)
+    assert np.array_equal(indices, expected_indices)
+    assert np.array_equal(values, expected_values)
+    assert np.array_equal(embeddings_, expected_embeddings)
@@ -0,0 +1,49 @@
+import math
+import pytest
+import torch
+from activeft.utils import ArrayPriorityQueue, StreamingTopK
+
+
+def _reference_topk(values: torch.Tensor, r: int) -> torch.Tensor:
+    return torch.topk(values.masked_fill(torch.isnan(values), -math.inf), r).values
+
+
+def test_array_priority_queue_matches_topk():
+    generator = torch.Generator().manual_seed(0)
+    values = torch.randn(100, generator=generator)
+    values[::10] = math.nan
+    queue = ArrayPriorityQueue(values=values)
+    queue.frontier_size = 8  # frequently rebuilds the frontier
+    for _ in range(50):
+        r = int(torch.randint(1, 20, (1,), generator=generator).item())
+        indices, top_values = queue.top(r)
+        assert torch.equal(top_values, _reference_topk(values, r))
+        assert torch.equal(queue.values[indices], top_values)
+
+        updated = torch.randint(0, 100, (5,), generator=generator).unique()
+        new_values = torch.randn(updated.size(0), generator=generator) * 2
+        new_values[0] = math.nan
+        queue.update(updated, new_values)
+        values[updated] = new_values
+
+
+def test_array_priority_queue_of_nan():
+    queue = ArrayPriorityQueue(values=torch.full((10,), math.nan))
+    indices, values = queue.top(20)
+    assert sorted(indices.tolist()) == list(range(10))
+    assert torch.all(values == -math.inf)
+
+
+@pytest.mark.parametrize("k", [1, 7, 30, 100])
+def test_streaming_top_k_matches_topk(k: int):
+    generator = torch.Generator().manual_seed(0)
+    values = torch.randint(0, 5, (60,), generator=generator).float()  # many ties
+    top_k = StreamingTopK(k=k)
+    for indices in torch.arange(60).split(16):
+        top_k.update(values[indices], indices)
+
+    expected_values = torch.topk(values, min(k, values.size(0))).values
+    assert top_k.size() == min(k, values.size(0))  # fewer than k values if k > n
+    assert torch.equal(top_k.values, expected_values)
+    assert torch.equal(values[top_k.indices], top_k.values)
+    assert top_k.indices.unique().size(0) == top_k.size()